@@ -2,7 +2,9 @@ from django.contrib import admin
 from django.shortcuts import redirect
 from django.urls import path, reverse
 from django.utils.html import format_html
-from .models import Report, UserProfile, Category, Comment, Follow,UserInquiry
+from .autocomplete import update_autocomplete_index
+from .search import index_profiles, search_comments
+from .models import Report, UserProfile, Category, Comment, Follow,UserInquiry,RatingAggregate,LeaderboardEntry,Reaction
 
 from django import forms
 from .models import UserProfile, User
@@ -40,24 +42,11 @@ def create_support_group():
 
 
 class UserProfileForm(forms.ModelForm):
-    # Display followers as a multiple select field
-    followers = forms.ModelMultipleChoiceField(
-        queryset=User.objects.all(),
-        required=False,
-        widget=forms.SelectMultiple(attrs={'class': 'vSelect2'}),
-        label="Followers"
-    )
-    # Display following as a multiple select field
-    following = forms.ModelMultipleChoiceField(
-        queryset=User.objects.all(),
-        required=False,
-        widget=forms.SelectMultiple(attrs={'class': 'vSelect2'}),
-        label="Following"
-    )
 
     class Meta:
         model = UserProfile
-        fields = '__all__'
+        # Follows are edited through the Follow admin, the legacy tables are left alone
+        exclude = ['followers', 'following']
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
@@ -120,31 +109,40 @@ class UserProfileAdmin(admin.ModelAdmin):
             'fields': ('unique_id',)
         }),
         ("Relationships", {
-            'fields': ('followers', 'following')
+            'fields': ('follower_count', 'following_count')
         })
     )
 
     form = UserProfileForm
 
-    # Allow editing of related objects in the admin panel
-    filter_horizontal = ('followers', 'following')
-
-    # Options to prevent automatic updates
-    readonly_fields = ('created_at',)
+    # Options to prevent automatic updates (follow counts are kept by the Follow signals)
+    readonly_fields = ('created_at', 'follower_count', 'following_count')
 
     # Optional actions
     actions = ["activate_users", "deactivate_users"]
 
+    @staticmethod
+    def _set_active(queryset, is_active):
+        # Taken before the update: filtered on is_active, the queryset matches none of them after it
+        pks = list(queryset.values_list('pk', flat=True))
+        updated = UserProfile.objects.filter(pk__in=pks).update(is_active=is_active)
+        # update() skips the search index signals
+        profiles = list(UserProfile.objects.filter(pk__in=pks))
+        index_profiles(profiles)
+        for profile in profiles:
+            update_autocomplete_index(profile)
+        return updated
+
     def activate_users(self, request, queryset):
         """Seçilen kullanıcıları etkinleştir."""
-        updated = queryset.update(is_active=True)
+        updated = self._set_active(queryset, True)
         self.message_user(request, f"{updated} user(s) activated successfully.")
 
     activate_users.short_description = "Activate selected users"
 
     def deactivate_users(self, request, queryset):
         """Seçilen kullanıcıları devre dışı bırak."""
-        updated = queryset.update(is_active=False)
+        updated = self._set_active(queryset, False)
         self.message_user(request, f"{updated} user(s) deactivated successfully.")
 
     deactivate_users.short_description = "Deactivate selected users"
@@ -211,14 +209,19 @@ class CommentAdmin(admin.ModelAdmin):
         'created_at',
     )
 
-    # Field for searching
-    search_fields = ('user_profile__username', 'profile_commented_on__username', 'content')
+    # Field for searching; content is searched through the full-text index, see get_search_results
+    search_fields = ('=user_profile__username', '=profile_commented_on__username')
 
     # Field for filtering
     list_filter = ('category', 'is_positive', 'is_anonymous', 'created_at')
 
-    # Allow editing of related objects in the admin panel
-    filter_horizontal = ('likes', 'dislikes')
+    def get_search_results(self, request, queryset, search_term):
+        """Comments by or on the searched username, or containing every searched word."""
+        by_username, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if not search_term:
+            return by_username, may_have_duplicates
+        by_content = search_comments(search_term, match_all=True).values('id')
+        return queryset.filter(Q(pk__in=by_username.values('pk')) | Q(pk__in=by_content)), False
 
     # Fields to be displayed in the detail view
     fieldsets = (
@@ -235,12 +238,12 @@ class CommentAdmin(admin.ModelAdmin):
             )
         }),
         ("Reactions", {
-            'fields': ('likes', 'dislikes')
+            'fields': ('like_count', 'dislike_count')
         }),
     )
 
-    # Read-only fields
-    readonly_fields = ('created_at',)
+    # Read-only fields (reactions are counted by the like/dislike views)
+    readonly_fields = ('created_at', 'like_count', 'dislike_count')
 
     
 
@@ -254,6 +257,31 @@ class CategoryAdmin(admin.ModelAdmin):
         queryset = queryset.order_by('name')  # Order by name
         return queryset
 
+@admin.register(RatingAggregate)
+class RatingAggregateAdmin(admin.ModelAdmin):
+    list_display = ['id', 'profile', 'category', 'score_sum', 'score_count', 'score_sq_sum']
+    search_fields = ['profile__username']
+    list_filter = ['category']
+    # Maintained from the comments, see CoreApp/signals.py
+    readonly_fields = ('profile', 'category', 'score_sum', 'score_count', 'score_sq_sum')
+
+@admin.register(LeaderboardEntry)
+class LeaderboardEntryAdmin(admin.ModelAdmin):
+    list_display = ['id', 'profile', 'category', 'score', 'average_score', 'rating_count']
+    search_fields = ['profile__username']
+    list_filter = ['category']
+    ordering = ('category', '-score')
+    # Refreshed from the rating aggregates, see CoreApp/leaderboard.py
+    readonly_fields = ('profile', 'category', 'score', 'average_score', 'rating_count')
+
+@admin.register(Reaction)
+class ReactionAdmin(admin.ModelAdmin):
+    list_display = ['id', 'comment', 'profile', 'kind', 'created_at']
+    search_fields = ['profile__username']
+    list_filter = ['kind']
+    # Counted in Comment.like_count/dislike_count, see CoreApp/reactions.py
+    readonly_fields = ('comment', 'profile', 'kind', 'created_at')
+
 @admin.register(UserInquiry)
 class InquiryAdmin(admin.ModelAdmin):
     list_display = ['id', 'user', 'subject', 'content', 'created_at','is_answered']
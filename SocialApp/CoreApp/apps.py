@@ -6,6 +6,9 @@ class CoreappConfig(AppConfig):
     name = 'CoreApp'
 
     def ready(self):
+        # Connect the model signal handlers
+        from . import signals  # noqa: F401
+
         # Import the function and call it during app initialization
         from .admin import create_support_group
         create_support_group()
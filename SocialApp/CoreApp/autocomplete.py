@@ -0,0 +1,220 @@
+# coreapp/autocomplete.py
+import heapq
+import json
+import os
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .models import UserProfile
+from .search import PREFIX_END, fold, words
+
+PROFILE_FIELDS = ('id', 'username', 'first_name', 'last_name', 'follower_count')
+# Saves touching none of these leave the index as it is; follower counts are picked up by the rebuilds
+KEY_FIELDS = ('username', 'first_name', 'last_name', 'is_active')
+
+
+def normalize(text):
+    """Folded words of the text separated by single spaces, as typed in the search box."""
+    return ' '.join(words(text))
+
+
+def profile_keys(username, first_name, last_name):
+    """Keys a profile is found under: its username, its full name and its last name."""
+    keys = {fold(username), normalize(f"{first_name} {last_name}"), normalize(last_name)}
+    keys.discard('')
+    return keys
+
+
+class AutocompleteIndex:
+    """
+    Sorted array of (normalized key, profile id) pairs for prefix lookups over usernames
+    and full names, with the display fields of every indexed profile.
+    A prefix matches a contiguous slice of the array found with two binary searches; the
+    top matches of prefixes with more than AUTOCOMPLETE_SCAN_LIMIT entries are memoized
+    until one of their profiles changes, so short prefixes stay as cheap as long ones.
+    """
+
+    def __init__(self, profiles=(), entries=None, built_at=None):
+        # profile id -> (username, first_name, last_name, follower_count)
+        self.profiles = {profile_id: tuple(fields) for profile_id, *fields in profiles}
+        if entries is None:
+            entries = sorted(
+                (key, profile_id) for profile_id, fields in self.profiles.items() for key in profile_keys(*fields[:3])
+            )
+        self.entries = [tuple(entry) for entry in entries]
+        self.built_at = built_at or timezone.now().isoformat()
+        self.top_matches = {}
+        self.version = 0  # Bumped by every change, so a lookup racing one does not memoize stale matches
+        self.lock = threading.RLock()
+
+    @classmethod
+    def from_database(cls):
+        rows = UserProfile.objects.filter(is_active=True).values_list(*PROFILE_FIELDS).iterator(chunk_size=10000)
+        return cls(rows)
+
+    def __len__(self):
+        return len(self.profiles)
+
+    def _range(self, prefix):
+        return bisect_left(self.entries, (prefix,)), bisect_left(self.entries, (prefix + PREFIX_END,))
+
+    def _rank(self, profile_ids, limit):
+        """The `limit` profiles with the most followers, ties going to the oldest profile."""
+        with self.lock:
+            # The ids were sliced from the entries without the lock: skip profiles removed since
+            followers = {
+                profile_id: self.profiles[profile_id][3] for profile_id in profile_ids if profile_id in self.profiles
+            }
+        return heapq.nsmallest(limit, followers, key=lambda profile_id: (-followers[profile_id], profile_id))
+
+    def lookup(self, query, limit):
+        """Profile ids whose username or name starts with the query, most followed first."""
+        prefix = normalize(query)
+        if not prefix or limit < 1:
+            return []
+
+        start, end = self._range(prefix)
+        if end - start <= settings.AUTOCOMPLETE_SCAN_LIMIT:
+            return self._rank({profile_id for _, profile_id in self.entries[start:end]}, limit)
+
+        top = self.top_matches.get(prefix)
+        if top is None:
+            version = self.version
+            top = self._rank(
+                {profile_id for _, profile_id in self.entries[start:end]}, settings.AUTOCOMPLETE_MAX_RESULTS
+            )
+            with self.lock:
+                if version == self.version:
+                    self.top_matches[prefix] = top
+        return top[:limit]
+
+    def results(self, profile_ids):
+        return [
+            dict(zip(PROFILE_FIELDS, (profile_id, *self.profiles[profile_id])))
+            for profile_id in profile_ids if profile_id in self.profiles
+        ]
+
+    def _forget_prefixes(self, keys):
+        self.version += 1
+        for key in keys:
+            for length in range(1, len(key) + 1):
+                self.top_matches.pop(key[:length], None)
+
+    def update(self, profile):
+        """Add, change or (when inactive) remove a profile."""
+        with self.lock:
+            self.remove(profile.pk)
+            if not profile.is_active:
+                return
+            fields = (profile.username, profile.first_name, profile.last_name, profile.follower_count)
+            keys = profile_keys(*fields[:3])
+            self.profiles[profile.pk] = fields
+            for key in keys:
+                insort(self.entries, (key, profile.pk))
+            self._forget_prefixes(keys)
+
+    def remove(self, profile_id):
+        with self.lock:
+            fields = self.profiles.pop(profile_id, None)
+            if fields is None:
+                return
+            keys = profile_keys(*fields[:3])
+            for key in keys:
+                position = bisect_left(self.entries, (key, profile_id))
+                if position < len(self.entries) and self.entries[position] == (key, profile_id):
+                    del self.entries[position]
+            self._forget_prefixes(keys)
+
+    def save(self, path):
+        """Write the index to a JSON snapshot, replacing any previous one atomically."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'built_at': self.built_at,
+                'profiles': [[profile_id, *fields] for profile_id, fields in self.profiles.items()],
+                'entries': self.entries,
+            }, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            snapshot = json.load(f)
+        return cls(snapshot['profiles'], snapshot['entries'], snapshot['built_at'])
+
+
+class _IndexCache:
+    """
+    Per-process index. Built on first use from AUTOCOMPLETE_SNAPSHOT when that file exists,
+    otherwise from the database, and rebuilt from the database in a background thread every
+    AUTOCOMPLETE_REBUILD_SECONDS to pick up follower counts and changes saved by other
+    processes; lookups keep using the previous index meanwhile. Saves in this process are
+    applied right away.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.index = None
+        self.built_at = None
+        self.rebuilding = False
+
+    @staticmethod
+    def first_build():
+        # The snapshot only saves the first build: it is older than the database afterwards
+        path = settings.AUTOCOMPLETE_SNAPSHOT
+        if path and os.path.exists(path):
+            return AutocompleteIndex.load(path)
+        return AutocompleteIndex.from_database()
+
+    def get(self):
+        if self.index is None:
+            with self.lock:
+                if self.index is None:
+                    self.index, self.built_at = self.first_build(), time.monotonic()
+        elif time.monotonic() - self.built_at >= settings.AUTOCOMPLETE_REBUILD_SECONDS and not self.rebuilding:
+            with self.lock:
+                if not self.rebuilding:
+                    self.rebuilding = True
+                    threading.Thread(target=self._rebuild, daemon=True).start()
+        return self.index
+
+    def _rebuild(self):
+        try:
+            index = AutocompleteIndex.from_database()
+            with self.lock:
+                self.index, self.built_at = index, time.monotonic()
+        finally:
+            self.rebuilding = False
+            connection.close()
+
+    def reset(self):
+        with self.lock:
+            self.index = None
+
+
+_index = _IndexCache()
+
+
+def get_autocomplete_index():
+    return _index.get()
+
+
+def update_autocomplete_index(profile):
+    """Apply a saved profile to this process's index, if it has been built."""
+    if _index.index is not None:
+        _index.index.update(profile)
+
+
+def remove_from_autocomplete_index(profile_id):
+    if _index.index is not None:
+        _index.index.remove(profile_id)
+
+
+def reset_autocomplete_index():
+    """Drop this process's index; the next lookup builds a new one."""
+    _index.reset()
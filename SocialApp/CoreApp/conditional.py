@@ -0,0 +1,57 @@
+# coreapp/conditional.py
+import hashlib
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+
+from .utils import bump_cache_version, cache_version
+
+
+def make_etag(request, *parts):
+    """
+    Weak ETag of a response, derived from the versions it depends on (the parts) and the
+    request's path and query string (page, cursor, ?fields=...), never from the rendered body.
+    """
+    digest = hashlib.blake2b(repr((parts, request.get_full_path())).encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+def not_modified(request, etag):
+    """A 304 response if the client sent this ETag in If-None-Match, otherwise None."""
+    response = get_conditional_response(request, etag=etag)
+    return set_validators(response, etag) if response is not None else None
+
+
+def set_validators(response, etag):
+    """Send the ETag and make clients revalidate before reusing their copy."""
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+def _comments_received_key(profile_id):
+    return f"comments_received_version:{profile_id}"
+
+
+def comments_received_version(profile_id):
+    """Version of the comments made on a profile: bumped when one is added, edited, deleted or reacted to."""
+    return cache_version(_comments_received_key(profile_id))
+
+
+def invalidate_comments_received(profile_id):
+    """Outdate the ETags of a profile's comments; again on commit, for polls reading the uncommitted rows."""
+    key = _comments_received_key(profile_id)
+    bump_cache_version(key)
+    transaction.on_commit(lambda: bump_cache_version(key))
+
+
+def timeline_period():
+    """
+    Current LATEST_COMMENTS_REVALIDATE_SECONDS period. Timelines take comments from many
+    profiles, so their ETags also roll over with it: edits and reactions on comments
+    already shown reach polling clients within one period.
+    """
+    return int(time.time() // settings.LATEST_COMMENTS_REVALIDATE_SECONDS)
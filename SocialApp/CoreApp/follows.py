@@ -0,0 +1,42 @@
+# coreapp/follows.py
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Follow, UserProfile
+
+
+def toggle_follow(follower_id, followed_id):
+    """
+    Follow or unfollow a profile. Both steps are single statements on the
+    (follower, following) unique index, whatever the size of either list.
+    The Follow signals update the counts and the timeline.
+    Returns True if the follower now follows the profile, False if it unfollowed.
+    """
+    with transaction.atomic():
+        if Follow.objects.filter(follower_id=follower_id, following_id=followed_id).delete()[0]:
+            return False
+        try:
+            with transaction.atomic():
+                Follow.objects.create(follower_id=follower_id, following_id=followed_id)
+        except IntegrityError:
+            pass  # A concurrent request followed first
+        return True
+
+
+def apply_follow_delta(follower_id, followed_id, delta):
+    """Move the follow counts of both profiles by delta (+1 on follow, -1 on unfollow)."""
+    UserProfile.objects.filter(pk=follower_id).update(following_count=F('following_count') + delta)
+    UserProfile.objects.filter(pk=followed_id).update(follower_count=F('follower_count') + delta)
+
+
+def recount_follows():
+    """Recompute every profile's follower and following counts from Follow. Returns the number of profiles."""
+
+    def count_of(field):
+        counts = Follow.objects.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(
+            total=Count('id')
+        ).values('total')
+        return Coalesce(Subquery(counts), Value(0))
+
+    return UserProfile.objects.update(follower_count=count_of('following'), following_count=count_of('follower'))
@@ -0,0 +1,228 @@
+# coreapp/graph.py
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Follow, FollowChange
+
+CURRENT_FILE = 'CURRENT'
+ARRAY_NAMES = ('out_indptr', 'out_indices', 'in_indptr', 'in_indices')
+
+
+def _edge_keys(followers, followings):
+    """Encode (follower, following) pairs as sortable int64 keys."""
+    return (followers.astype(np.int64) << 32) | followings.astype(np.int64)
+
+
+def _csr(rows, cols, size):
+    """CSR arrays for edges already sorted by (row, col)."""
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=size), out=indptr[1:])
+    return indptr, cols.astype(np.int32)
+
+
+class FollowGraph:
+    """
+    Read-only snapshot of the follow graph in CSR form, indexed by profile id.
+    out_indices[out_indptr[p]:out_indptr[p + 1]] are the profiles p follows,
+    in_indices[in_indptr[p]:in_indptr[p + 1]] its followers; both sorted.
+    last_change_id is the last FollowChange included in the snapshot.
+    """
+
+    def __init__(self, out_indptr, out_indices, in_indptr, in_indices, last_change_id=0, built_at=None):
+        self.out_indptr = out_indptr
+        self.out_indices = out_indices
+        self.in_indptr = in_indptr
+        self.in_indices = in_indices
+        self.last_change_id = last_change_id
+        self.built_at = built_at
+
+    @classmethod
+    def from_edges(cls, followers, followings, last_change_id=0):
+        keys = np.unique(_edge_keys(followers, followings))
+        followers, followings = keys >> 32, keys & 0xFFFFFFFF
+        size = int(max(followers.max(), followings.max())) + 1 if len(keys) else 0
+
+        out_indptr, out_indices = _csr(followers, followings, size)
+        by_followed = np.lexsort((followers, followings))
+        in_indptr, in_indices = _csr(followings[by_followed], followers[by_followed], size)
+        return cls(out_indptr, out_indices, in_indptr, in_indices, last_change_id, timezone.now().isoformat())
+
+    @property
+    def size(self):
+        return len(self.out_indptr) - 1
+
+    def edges(self):
+        """Return (followers, followings) arrays sorted by follower, then following."""
+        followers = np.repeat(np.arange(self.size, dtype=np.int64), np.diff(self.out_indptr))
+        return followers, self.out_indices
+
+    def _neighbours(self, indptr, indices, profile_id):
+        if not 0 <= profile_id < self.size:
+            return indices[:0]
+        return indices[indptr[profile_id]:indptr[profile_id + 1]]
+
+    def following(self, profile_id):
+        return self._neighbours(self.out_indptr, self.out_indices, profile_id)
+
+    def followers(self, profile_id):
+        return self._neighbours(self.in_indptr, self.in_indices, profile_id)
+
+    def follows(self, follower_id, followed_id):
+        following = self.following(follower_id)
+        position = np.searchsorted(following, followed_id)
+        return bool(position < len(following) and following[position] == followed_id)
+
+    def mutual_followers(self, profile_id, other_id):
+        """Profiles following both profiles."""
+        return np.intersect1d(self.followers(profile_id), self.followers(other_id), assume_unique=True)
+
+    def followed_by_following(self, viewer_id, profile_id):
+        """Profiles the viewer follows that follow the profile."""
+        return np.intersect1d(self.following(viewer_id), self.followers(profile_id), assume_unique=True)
+
+    def two_hop_counts(self, profile_id):
+        """
+        Count the paths profile -> followed -> candidate, as a sparse matrix-vector product of
+        the out lists with the profile's following vector. Returns (candidate_ids, path_counts)
+        without the profile itself and the profiles it already follows.
+        """
+        following = self.following(profile_id)
+        starts = self.out_indptr[following]
+        lengths = self.out_indptr[following + 1] - starts
+        # Index of every second-hop edge: the start of its list plus its position in the list
+        ends = np.cumsum(lengths)
+        positions = np.repeat(starts - ends + lengths, lengths) + np.arange(ends[-1] if len(ends) else 0)
+        candidates, counts = np.unique(self.out_indices[positions], return_counts=True)
+
+        keep = (candidates != profile_id) & ~np.isin(candidates, following, assume_unique=True)
+        return candidates[keep], counts[keep]
+
+    def apply_changes(self, changes):
+        """
+        Return a new snapshot with (id, follower_id, following_id, added) changes applied,
+        where the last change of each edge wins. Re-applying a change is harmless.
+        """
+        if not len(changes):
+            return self
+        changes = changes[np.argsort(changes['id'], kind='stable')][::-1]
+        keys, latest = np.unique(_edge_keys(changes['follower_id'], changes['following_id']), return_index=True)
+
+        current = _edge_keys(*self.edges())
+        current = current[~np.isin(current, keys)]
+        keys = np.concatenate([current, keys[changes['added'][latest]]])
+        return FollowGraph.from_edges(keys >> 32, keys & 0xFFFFFFFF, int(changes['id'].max()))
+
+    def save(self, directory):
+        """Write the arrays under a new snapshot directory and return its name."""
+        name = f"snapshot-{self.last_change_id}-{time.time_ns()}"
+        path = os.path.join(directory, name)
+        os.makedirs(path)
+        for array_name in ARRAY_NAMES:
+            np.save(os.path.join(path, f"{array_name}.npy"), getattr(self, array_name))
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump({'last_change_id': self.last_change_id, 'built_at': self.built_at}, f)
+        return name
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """Load a snapshot directory; the arrays are memory-mapped so every process shares the pages."""
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        arrays = [np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode) for name in ARRAY_NAMES]
+        return cls(*arrays, **meta)
+
+
+def build_follow_graph():
+    """Build a full snapshot from the Follow table."""
+    with transaction.atomic():
+        last_change_id = FollowChange.objects.aggregate(last=Max('id'))['last'] or 0
+        edges = np.fromiter(
+            Follow.objects.values_list('follower_id', 'following_id').iterator(chunk_size=10000),
+            dtype=[('follower_id', np.int64), ('following_id', np.int64)],
+        )
+    return FollowGraph.from_edges(edges['follower_id'], edges['following_id'], last_change_id)
+
+
+def pending_changes(after_id):
+    """FollowChange rows newer than after_id, as a structured array."""
+    return np.fromiter(
+        FollowChange.objects.filter(id__gt=after_id).order_by('id').values_list(
+            'id', 'follower_id', 'following_id', 'added'
+        ).iterator(chunk_size=10000),
+        dtype=[('id', np.int64), ('follower_id', np.int64), ('following_id', np.int64), ('added', np.bool_)],
+    )
+
+
+def publish_follow_graph(graph, directory, keep=2):
+    """Save a snapshot, point CURRENT at it and delete all but the newest `keep` snapshots."""
+    os.makedirs(directory, exist_ok=True)
+    name = graph.save(directory)
+
+    tmp_path = os.path.join(directory, f"{CURRENT_FILE}.tmp")
+    with open(tmp_path, 'w') as f:
+        f.write(name)
+    os.replace(tmp_path, os.path.join(directory, CURRENT_FILE))
+
+    # Processes still mapping a deleted snapshot keep reading it until they reload
+    snapshots = sorted(
+        (entry for entry in os.listdir(directory) if entry.startswith('snapshot-') and entry != name),
+        key=lambda entry: int(entry.rsplit('-', 1)[1]),
+    )
+    for old_name in snapshots[:max(len(snapshots) - keep + 1, 0)]:
+        shutil.rmtree(os.path.join(directory, old_name), ignore_errors=True)
+    return name
+
+
+def current_snapshot_name(directory):
+    """Name of the snapshot CURRENT points at, or None if none was published."""
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def load_current_follow_graph(directory, mmap_mode='r'):
+    """Return the snapshot CURRENT points at, or None if none was published."""
+    name = current_snapshot_name(directory)
+    return FollowGraph.load(os.path.join(directory, name), mmap_mode) if name else None
+
+
+class _SnapshotCache:
+    """Per-process handle on the current snapshot, re-checked every FOLLOW_GRAPH_RELOAD_SECONDS."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.name = None
+        self.graph = None
+        self.checked_at = None
+
+    def get(self):
+        now = time.monotonic()
+        if self.checked_at is not None and now - self.checked_at < settings.FOLLOW_GRAPH_RELOAD_SECONDS:
+            return self.graph
+
+        with self.lock:
+            name = current_snapshot_name(settings.FOLLOW_GRAPH_DIR)
+            if name != self.name:
+                self.graph = FollowGraph.load(os.path.join(settings.FOLLOW_GRAPH_DIR, name)) if name else None
+                self.name = name
+            self.checked_at = now
+        return self.graph
+
+
+_snapshot = _SnapshotCache()
+
+
+def get_follow_graph():
+    """Return the current follow graph snapshot, or None if none has been built yet."""
+    return _snapshot.get()
@@ -0,0 +1,42 @@
+# coreapp/leaderboard.py
+from django.conf import settings
+from django.db import transaction
+
+from .models import LeaderboardEntry, RatingAggregate
+
+
+def bayesian_score(score_sum, score_count):
+    """Average score pulled towards the prior mean, so a few ratings cannot top the list."""
+    weight = settings.LEADERBOARD_PRIOR_WEIGHT
+    return (weight * settings.LEADERBOARD_PRIOR_MEAN + score_sum) / (weight + score_count)
+
+
+def refresh_leaderboard(profile_ids):
+    """Recompute the leaderboard entries of the given profiles from their rating aggregates."""
+    entries = []
+    overall = {}
+    aggregates = RatingAggregate.objects.filter(profile_id__in=profile_ids, score_count__gt=0)
+    for profile_id, category_id, score_sum, score_count in aggregates.values_list(
+        'profile_id', 'category_id', 'score_sum', 'score_count'
+    ):
+        entries.append(_entry(profile_id, category_id, score_sum, score_count))
+        totals = overall.setdefault(profile_id, [0, 0])
+        totals[0] += score_sum
+        totals[1] += score_count
+
+    for profile_id, (score_sum, score_count) in overall.items():
+        entries.append(_entry(profile_id, None, score_sum, score_count))
+
+    with transaction.atomic():
+        LeaderboardEntry.objects.filter(profile_id__in=profile_ids).delete()
+        LeaderboardEntry.objects.bulk_create(entries)
+
+
+def _entry(profile_id, category_id, score_sum, score_count):
+    return LeaderboardEntry(
+        profile_id=profile_id,
+        category_id=category_id,
+        score=bayesian_score(score_sum, score_count),
+        average_score=round(score_sum / score_count, 2),
+        rating_count=score_count,
+    )
@@ -0,0 +1,93 @@
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+
+from CoreApp.shared_cache import SQLiteCache
+
+# Each backend gets room for every key of the run, so none of them spends time culling
+BACKENDS = {
+    'locmem': lambda directory, params: LocMemCache('benchmark', params),
+    'file': lambda directory, params: FileBasedCache(os.path.join(directory, 'files'), params),
+    'sqlite': lambda directory, params: SQLiteCache(os.path.join(directory, 'cache.sqlite3'), params),
+}
+COUNTER_KEY = 'benchmark:counter'
+
+
+def _worker(backend_name, directory, params, worker, options, start, results):
+    """Run the set, get and incr rounds in one process; report the seconds each one took."""
+    backend = BACKENDS[backend_name](directory, params)
+    keys = [f'benchmark:{worker}:{i % options["keys"]}' for i in range(options['operations'])]
+    value = 'x' * options['value_size']
+    rounds = [
+        ('set', lambda key: backend.set(key, value, 300)),
+        ('get', lambda key: backend.get(key)),
+        ('incr', lambda key: backend.incr(COUNTER_KEY)),
+    ]
+
+    backend.add(COUNTER_KEY, 0, 300)
+    start.wait()
+    timings = {}
+    for name, operation in rounds:
+        started = time.perf_counter()
+        for key in keys:
+            operation(key)
+        timings[name] = time.perf_counter() - started
+    results.put(timings)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the get/set/incr throughput of the in-memory, file-based and SQLite cache backends "
+        "with several processes using the cache at once, and check which of them share their counters."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, nargs='+', default=[1, 4], help="Concurrent processes.")
+        parser.add_argument('--operations', type=int, default=1000, help="Operations of each kind per process.")
+        parser.add_argument('--keys', type=int, default=1000, help="Distinct keys per process.")
+        parser.add_argument('--value-size', type=int, default=200, help="Size of the cached strings, in bytes.")
+        parser.add_argument(
+            '--backends', nargs='+', choices=sorted(BACKENDS), default=['locmem', 'file', 'sqlite'],
+        )
+
+    def handle(self, *args, **options):
+        if min(options['processes']) < 1 or options['operations'] < 1 or options['keys'] < 1:
+            raise CommandError("--processes, --operations and --keys must be at least 1.")
+
+        self.stdout.write(
+            f"{'backend':>8} {'procs':>6} {'set/s':>10} {'get/s':>10} {'incr/s':>10} {'counter':>10} {'expected':>10}"
+        )
+        for backend_name in options['backends']:
+            for processes in options['processes']:
+                with tempfile.TemporaryDirectory() as directory:
+                    timings, counter = self._run(backend_name, directory, processes, options)
+                total = processes * options['operations']
+                # The slowest process bounds the round: operations per second of all processes together
+                rates = [total / max(timing[name] for timing in timings) for name in ('set', 'get', 'incr')]
+                self.stdout.write(
+                    f"{backend_name:>8} {processes:>6} {rates[0]:>10.0f} {rates[1]:>10.0f} {rates[2]:>10.0f}"
+                    f" {counter if counter is not None else '-':>10} {total:>10}"
+                )
+
+    def _run(self, backend_name, directory, processes, options):
+        context = multiprocessing.get_context('fork')
+        start = context.Barrier(processes)
+        results = context.Queue()
+        params = {'OPTIONS': {'MAX_ENTRIES': processes * options['keys'] + 1}}
+        workers = [
+            context.Process(target=_worker, args=(backend_name, directory, params, worker, options, start, results))
+            for worker in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        timings = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+
+        # Read back from this process: only a shared cache has seen the workers' increments
+        return timings, BACKENDS[backend_name](directory, params).get(COUNTER_KEY)
@@ -0,0 +1,100 @@
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from CoreApp.models import Category, Comment, Reaction, UserProfile
+from CoreApp.reactions import toggle_reaction
+
+
+def _measure(func, repeat):
+    """Return (queries per call, peak bytes allocated by one call, mean seconds per call)."""
+    with CaptureQueriesContext(connection) as queries:
+        func()
+    query_count = len(queries)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return query_count, peak, (time.perf_counter() - started) / repeat
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the cost of one like/dislike toggle on comments with a growing number of reactions. "
+        "Runs in a transaction that is rolled back, so nothing is left in the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[10, 1000, 10000],
+            help="Number of existing likes on the benchmarked comment.",
+        )
+        parser.add_argument('--toggles', type=int, default=50, help="Toggles timed per size.")
+        parser.add_argument(
+            '--legacy', action='store_true',
+            help="Also measure a membership check that loads every liker, like the old toggles did.",
+        )
+
+    def handle(self, *args, **options):
+        if min(options['sizes']) < 0 or options['toggles'] < 1:
+            raise CommandError("--sizes must not be negative and --toggles must be at least 1.")
+
+        with transaction.atomic():
+            self._run(options)
+            transaction.set_rollback(True)
+
+    def _run(self, options):
+        Category.objects.get_or_create(id=1, defaults={'name': "Benchmark"})
+        reactor_count = max(options['sizes'])
+        reactors = [profile.id for profile in self._create_profiles('bench_reactor', reactor_count)]
+        author, viewer = self._create_profiles('bench_user', 2, offset=reactor_count)
+
+        self.stdout.write(f"{'likes':>8} {'queries':>8} {'peak KiB':>9} {'ms/toggle':>10}  operation")
+        for size in sorted(options['sizes']):
+            comment = Comment.objects.create(
+                user_profile=author, profile_commented_on=author, content="Benchmark", like_count=size,
+            )
+            Reaction.objects.bulk_create(
+                [Reaction(comment_id=comment.id, profile_id=profile_id, kind=Reaction.LIKE)
+                 for profile_id in reactors[:size]],
+                batch_size=5000,
+            )
+
+            operations = [
+                ("toggle like", lambda: toggle_reaction(comment.id, viewer.id, Reaction.LIKE)),
+                ("switch like/dislike", lambda: toggle_reaction(comment.id, viewer.id, Reaction.DISLIKE)),
+            ]
+            if options['legacy']:
+                operations.append(("legacy membership check", lambda: viewer.id in comment.reactions.filter(
+                    kind=Reaction.LIKE
+                ).values_list('profile_id', flat=True)))
+
+            for name, func in operations:
+                queries, peak, seconds = _measure(func, options['toggles'])
+                self.stdout.write(f"{size:>8} {queries:>8} {peak / 1024:>9.1f} {seconds * 1000:>10.3f}  {name}")
+
+    def _create_profiles(self, prefix, count, offset=0):
+        users = User.objects.bulk_create(
+            [User(username=f"{prefix}{i}") for i in range(count)], batch_size=5000
+        )
+        return UserProfile.objects.bulk_create([
+            UserProfile(
+                user=user,
+                username=f"{prefix}{i}",
+                phone_number=f"{offset + i:010d}",
+                email=f"{prefix}{i}@example.com",
+                first_name=prefix,
+                last_name="Benchmark",
+                unique_id=f"b{offset + i:09d}",
+            )
+            for i, user in enumerate(users)
+        ], batch_size=5000)
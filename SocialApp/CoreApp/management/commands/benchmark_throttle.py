@@ -0,0 +1,74 @@
+import random
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory, override_settings
+
+from CoreApp.throttling import CustomRateLimiter, TokenBuckets
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the per-request overhead of CustomRateLimiter with many distinct client IPs: "
+        "the in-memory token buckets alone, the whole throttle check, and the shared-cache mode."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=100000, help="Distinct client IPs.")
+        parser.add_argument('--requests', type=int, default=200000, help="Requests timed per measurement.")
+        parser.add_argument('--shards', type=int, default=16, help="Lock shards of the bucket table.")
+        parser.add_argument(
+            '--shared-requests', type=int, default=2000,
+            help="Requests timed in the shared-cache mode, which is much slower (0 to skip it).",
+        )
+
+    def handle(self, *args, **options):
+        if options['clients'] < 1 or options['requests'] < 1 or options['shards'] < 1:
+            raise CommandError("--clients, --requests and --shards must be at least 1.")
+
+        clients = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(options['clients'])]
+        order = [random.choice(clients) for _ in range(options['requests'])]
+        factory = RequestFactory()
+        requests = {ip: factory.get('/', REMOTE_ADDR=ip) for ip in clients}
+        self.stdout.write(f"{'us/request':>11} {'KiB':>9}  measurement")
+
+        now = time.time()
+        interval, capacity = 1 / 30, 30
+        tracemalloc.start()
+        table = TokenBuckets(options['shards'], options['clients'])
+        for ip in clients:
+            table.take(ip, now, interval, capacity)
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        table = TokenBuckets(options['shards'], options['clients'])
+        started = time.perf_counter()
+        for ip in clients:
+            table.take(ip, now, interval, capacity)
+        self._report((time.perf_counter() - started) / len(clients), size, f"first request of {len(clients)} clients")
+
+        started = time.perf_counter()
+        for ip in order:
+            table.take(ip, now, interval, capacity)
+        self._report((time.perf_counter() - started) / len(order), None, "bucket table, known clients")
+
+        with override_settings(CUSTOM_THROTTLE_SHARED=False):
+            self._report(self._time_throttle(order, requests), None, "CustomRateLimiter, in memory")
+        if options['shared_requests']:
+            with override_settings(CUSTOM_THROTTLE_SHARED=True):
+                self._report(
+                    self._time_throttle(order[:options['shared_requests']], requests), None,
+                    "CustomRateLimiter, shared cache",
+                )
+
+    def _time_throttle(self, order, requests):
+        """Seconds per request of a full throttle check: instantiation, client IP and bucket."""
+        started = time.perf_counter()
+        for ip in order:
+            CustomRateLimiter().allow_request(requests[ip], None)
+        return (time.perf_counter() - started) / len(order)
+
+    def _report(self, seconds, size, name):
+        kib = f"{size / 1024:.0f}" if size is not None else "-"
+        self.stdout.write(f"{seconds * 1_000_000:>11.2f} {kib:>9}  {name}")
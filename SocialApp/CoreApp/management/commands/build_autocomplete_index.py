@@ -0,0 +1,31 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from CoreApp.autocomplete import AutocompleteIndex
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the profile autocomplete index from the database and write it to a snapshot file "
+        "that workers load at startup instead of reading every profile."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', default=settings.AUTOCOMPLETE_SNAPSHOT,
+            help="Snapshot file to write (defaults to AUTOCOMPLETE_SNAPSHOT).",
+        )
+
+    def handle(self, *args, **options):
+        if not options['output']:
+            raise CommandError("Set AUTOCOMPLETE_SNAPSHOT or pass --output.")
+
+        started = time.perf_counter()
+        index = AutocompleteIndex.from_database()
+        index.save(options['output'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {options['output']}: {len(index)} profile(s), {len(index.entries)} key(s) "
+            f"in {time.perf_counter() - started:.2f}s."
+        ))
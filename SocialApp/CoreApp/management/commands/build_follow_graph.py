@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from CoreApp.graph import build_follow_graph, load_current_follow_graph, pending_changes, publish_follow_graph
+from CoreApp.models import FollowChange
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the follow graph snapshot served to the graph endpoints. With --incremental, "
+        "the current snapshot is updated from the follow change log instead of re-reading Follow."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help="Apply the changes logged since the current snapshot (full build if there is none).",
+        )
+        parser.add_argument('--keep', type=int, default=2, help="Number of snapshots kept on disk.")
+        parser.add_argument(
+            '--keep-log', action='store_true',
+            help="Do not delete the change log entries included in the new snapshot.",
+        )
+
+    def handle(self, *args, **options):
+        if options['keep'] < 1:
+            raise CommandError("--keep must be at least 1.")
+        directory = settings.FOLLOW_GRAPH_DIR
+
+        current = load_current_follow_graph(directory) if options['incremental'] else None
+        if current is None:
+            graph = build_follow_graph()
+            self.stdout.write("Full build from the Follow table.")
+        else:
+            changes = pending_changes(current.last_change_id)
+            if not len(changes):
+                self.stdout.write(self.style.SUCCESS("Follow graph is up to date."))
+                return
+            graph = current.apply_changes(changes)
+            self.stdout.write(f"{len(changes)} change(s) applied to the current snapshot.")
+
+        name = publish_follow_graph(graph, directory, options['keep'])
+        if not options['keep_log']:
+            # The newest included entry stays, so ids keep growing past it even on SQLite
+            FollowChange.objects.filter(id__lt=graph.last_change_id).delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Published {name}: {graph.size} profile slot(s), {len(graph.out_indices)} follow(s)."
+        ))
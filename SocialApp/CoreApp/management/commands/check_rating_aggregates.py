@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from CoreApp.ratings import find_rating_aggregate_mismatches, repair_rating_aggregates
+
+
+class Command(BaseCommand):
+    help = "Compare the stored rating aggregates with the raw comments."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--profile', type=int, action='append', dest='profile_ids',
+            help="Only check this profile id (can be repeated).",
+        )
+        parser.add_argument(
+            '--fix', action='store_true',
+            help="Overwrite mismatched aggregates with the values computed from the comments.",
+        )
+
+    def handle(self, *args, **options):
+        mismatches = find_rating_aggregate_mismatches(options['profile_ids'])
+
+        for profile_id, category_id, expected, stored in mismatches:
+            self.stdout.write(
+                f"Profile {profile_id}, category {category_id}: "
+                f"expected (sum, count, sq_sum) {expected}, stored {stored}"
+            )
+
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS("Rating aggregates are consistent."))
+            return
+
+        if options['fix']:
+            repair_rating_aggregates(mismatches)
+            self.stdout.write(self.style.SUCCESS(f"{len(mismatches)} aggregate(s) repaired."))
+        else:
+            self.stdout.write(self.style.ERROR(f"{len(mismatches)} mismatched aggregate(s) found."))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Exists, OuterRef
+
+from CoreApp.models import Comment, CommentSearchTerm
+from CoreApp.search import index_comments
+
+
+class Command(BaseCommand):
+    help = (
+        "Backfill the comment full-text index. Only comments without index rows are read, so an "
+        "interrupted run picks up where it stopped; --after-id skips the comments already walked. "
+        "With --all, every comment is re-indexed (only changed words are written)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Comments indexed per batch.")
+        parser.add_argument('--after-id', type=int, default=0, help="Start after this comment id.")
+        parser.add_argument('--all', action='store_true', help="Re-index comments that already have index rows.")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        comments = Comment.objects.order_by('id').only('id', 'profile_commented_on_id', 'content')
+        if not options['all']:
+            comments = comments.exclude(Exists(CommentSearchTerm.objects.filter(comment_id=OuterRef('pk'))))
+
+        indexed = 0
+        last_id = options['after_id']
+        while True:
+            batch = list(comments.filter(id__gt=last_id)[:options['batch_size']])
+            if not batch:
+                break
+            index_comments(batch)
+            last_id = batch[-1].id
+            indexed += len(batch)
+            self.stdout.write(f"{indexed} comment(s) indexed, up to id {last_id}.")
+
+        self.stdout.write(self.style.SUCCESS(f"Comment search index backfilled: {indexed} comment(s)."))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from CoreApp.follows import recount_follows
+from CoreApp.models import Follow, UserProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the legacy UserProfile.following and UserProfile.followers rows into the Follow table "
+        "and recompute the follow counts. Safe to run again: existing follows are kept."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows copied per query.")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        # following: from_userprofile follows to_userprofile
+        # followers: to_userprofile follows from_userprofile
+        legacy_tables = (
+            ('following', UserProfile.following.through, False),
+            ('followers', UserProfile.followers.through, True),
+        )
+        for name, relation, reverse in legacy_tables:
+            rows = relation.objects.order_by('id').values_list('id', 'from_userprofile_id', 'to_userprofile_id')
+            copied = last_id = 0
+            while True:
+                batch = list(rows.filter(id__gt=last_id)[:options['batch_size']])
+                if not batch:
+                    break
+                with transaction.atomic():
+                    Follow.objects.bulk_create(
+                        [Follow(follower_id=to_id, following_id=from_id) if reverse
+                         else Follow(follower_id=from_id, following_id=to_id)
+                         for _, from_id, to_id in batch if from_id != to_id],
+                        ignore_conflicts=True,
+                    )
+                last_id = batch[-1][0]
+                copied += len(batch)
+            self.stdout.write(f"{copied} legacy {name} row(s) read.")
+
+        updated = recount_follows()
+        self.stdout.write(self.style.SUCCESS(f"Follows migrated; counts recomputed for {updated} profile(s)."))
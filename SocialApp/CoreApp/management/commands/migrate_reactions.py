@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from CoreApp.models import Comment, Reaction
+from CoreApp.reactions import recount_reactions
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the legacy Comment.likes and Comment.dislikes rows into the Reaction table and "
+        "recompute the like/dislike counters. Safe to run again: existing reactions are kept. "
+        "A profile found in both tables of one comment keeps its like."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows copied per query.")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        for relation, kind in ((Comment.likes.through, Reaction.LIKE), (Comment.dislikes.through, Reaction.DISLIKE)):
+            rows = relation.objects.order_by('id').values_list('id', 'comment_id', 'userprofile_id')
+            copied = last_id = 0
+            while True:
+                batch = list(rows.filter(id__gt=last_id)[:options['batch_size']])
+                if not batch:
+                    break
+                with transaction.atomic():
+                    Reaction.objects.bulk_create(
+                        [Reaction(comment_id=comment_id, profile_id=profile_id, kind=kind)
+                         for _, comment_id, profile_id in batch],
+                        ignore_conflicts=True,
+                    )
+                last_id = batch[-1][0]
+                copied += len(batch)
+            self.stdout.write(f"{copied} legacy {kind}(s) read.")
+
+        updated = recount_reactions()
+        self.stdout.write(self.style.SUCCESS(
+            f"Reactions migrated; counters recomputed for {updated} comment(s)."
+        ))
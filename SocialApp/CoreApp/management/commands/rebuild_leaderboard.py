@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from CoreApp.leaderboard import refresh_leaderboard
+from CoreApp.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = "Rebuild every leaderboard entry from the rating aggregates (e.g. after changing the ranking prior)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Profiles refreshed per batch.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        refreshed = 0
+        batch = []
+        for profile_id in UserProfile.objects.order_by('id').values_list('id', flat=True).iterator():
+            batch.append(profile_id)
+            if len(batch) == batch_size:
+                refresh_leaderboard(batch)
+                refreshed += len(batch)
+                batch = []
+        if batch:
+            refresh_leaderboard(batch)
+            refreshed += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Leaderboard rebuilt for {refreshed} profile(s)."))
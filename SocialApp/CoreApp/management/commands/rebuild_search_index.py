@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from CoreApp.models import UserProfile
+from CoreApp.search import SEARCH_FIELDS, index_profiles
+
+
+class Command(BaseCommand):
+    help = "Build or repair the profile search index from the profiles (e.g. for existing rows)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Profiles indexed per batch.")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        profiles = UserProfile.objects.order_by('id').only('id', 'is_active', *SEARCH_FIELDS)
+        indexed = last_id = 0
+        while True:
+            batch = list(profiles.filter(id__gt=last_id)[:options['batch_size']])
+            if not batch:
+                break
+            index_profiles(batch)
+            last_id = batch[-1].id
+            indexed += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Search index rebuilt for {indexed} profile(s)."))
@@ -0,0 +1,276 @@
+import multiprocessing
+import os
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from CoreApp.leaderboard import refresh_leaderboard
+from CoreApp.models import Category, Comment, RatingAggregate, UserProfile, normalize_category_scores
+from CoreApp.stats_cache import invalidate_all_comment_stats
+
+
+class ShardTotals:
+    """
+    Rating totals for a contiguous range of profile ids, held in NumPy arrays
+    of shape (profiles, categories).
+    """
+
+    def __init__(self, profile_ids, category_ids):
+        self.profile_ids = profile_ids
+        self.category_ids = category_ids
+        shape = (len(profile_ids), len(category_ids))
+        self.sums = np.zeros(shape, dtype=np.int64)
+        self.counts = np.zeros(shape, dtype=np.int64)
+        self.sq_sums = np.zeros(shape, dtype=np.int64)
+        self.last_pk = 0
+        self.comments_seen = 0
+
+    def add_comments(self, rows):
+        """Add (pk, profile_id, category_scores, category_id, score) rows."""
+        profile_col, category_col, score_col = [], [], []
+        for _, profile_id, category_scores, category_id, score in rows:
+            for cat_id, cat_score in normalize_category_scores(category_scores, category_id, score).items():
+                profile_col.append(profile_id)
+                category_col.append(cat_id)
+                score_col.append(cat_score)
+
+        self.last_pk = rows[-1][0]
+        self.comments_seen += len(rows)
+        if not profile_col:
+            return
+
+        profiles = np.array(profile_col, dtype=np.int64)
+        categories = np.array(category_col, dtype=np.int64)
+        scores = np.array(score_col, dtype=np.int64)
+
+        rows_idx = np.minimum(np.searchsorted(self.profile_ids, profiles), len(self.profile_ids) - 1)
+        cols_idx = np.minimum(np.searchsorted(self.category_ids, categories), len(self.category_ids) - 1)
+        # Skip profiles created after the shard was listed and unknown categories
+        valid = (self.profile_ids[rows_idx] == profiles) & (self.category_ids[cols_idx] == categories)
+        index = (rows_idx[valid], cols_idx[valid])
+        scores = scores[valid]
+
+        np.add.at(self.sums, index, scores)
+        np.add.at(self.counts, index, 1)
+        np.add.at(self.sq_sums, index, scores * scores)
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                profile_ids=self.profile_ids,
+                category_ids=self.category_ids,
+                sums=self.sums,
+                counts=self.counts,
+                sq_sums=self.sq_sums,
+                progress=np.array([self.last_pk, self.comments_seen], dtype=np.int64),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, profile_ids, category_ids):
+        """Load a checkpoint, or return None if it was taken over different profiles or categories."""
+        with np.load(path) as data:
+            if not (np.array_equal(data['profile_ids'], profile_ids)
+                    and np.array_equal(data['category_ids'], category_ids)):
+                return None
+            totals = cls(profile_ids, category_ids)
+            totals.sums = data['sums']
+            totals.counts = data['counts']
+            totals.sq_sums = data['sq_sums']
+            totals.last_pk, totals.comments_seen = (int(value) for value in data['progress'])
+        return totals
+
+
+def split_shards(profile_ids, shards):
+    """Split sorted profile ids into contiguous (first_id, last_id) ranges."""
+    return [(int(part[0]), int(part[-1])) for part in np.array_split(profile_ids, shards) if len(part)]
+
+
+def write_totals(totals, batch_size):
+    """
+    Write the totals back to UserProfile.category_scores and RatingAggregate in batches,
+    and refresh the leaderboard entries of each batch.
+    """
+    updated = 0
+    for start in range(0, len(totals.profile_ids), batch_size):
+        batch_ids = totals.profile_ids[start:start + batch_size].tolist()
+        current = dict(UserProfile.objects.filter(id__in=batch_ids).values_list('id', 'category_scores'))
+
+        profiles = []
+        aggregates = []
+        for row, profile_id in enumerate(batch_ids, start):
+            if profile_id not in current:
+                continue  # Deleted during the run
+
+            category_scores = {}
+            for col in np.flatnonzero(totals.counts[row]):
+                category_id = int(totals.category_ids[col])
+                category_scores[str(category_id)] = {
+                    "total_score": int(totals.sums[row, col]),
+                    "comment_count": int(totals.counts[row, col]),
+                }
+                aggregates.append(RatingAggregate(
+                    profile_id=profile_id,
+                    category_id=category_id,
+                    score_sum=int(totals.sums[row, col]),
+                    score_count=int(totals.counts[row, col]),
+                    score_sq_sum=int(totals.sq_sums[row, col]),
+                ))
+
+            if category_scores != (current[profile_id] or {}):
+                profiles.append(UserProfile(id=profile_id, category_scores=category_scores))
+
+        with transaction.atomic():
+            UserProfile.objects.bulk_update(profiles, ['category_scores'])
+            RatingAggregate.objects.filter(profile_id__in=batch_ids).delete()
+            RatingAggregate.objects.bulk_create(aggregates)
+            refresh_leaderboard(batch_ids)
+        updated += len(profiles)
+
+    return updated
+
+
+def recompute_shard(shard, options):
+    """Stream the comments of one profile-id shard and write its totals back."""
+    first_id, last_id = shard
+    checkpoint_dir = options['checkpoint']
+    checkpoint_path = done_path = None
+    if checkpoint_dir:
+        checkpoint_path = os.path.join(checkpoint_dir, f"shard-{first_id}-{last_id}.npz")
+        done_path = os.path.join(checkpoint_dir, f"shard-{first_id}-{last_id}.done")
+        if options['resume'] and os.path.exists(done_path):
+            return first_id, last_id, None, 0
+
+    profile_ids = np.fromiter(
+        UserProfile.objects.filter(id__range=shard).order_by('id').values_list('id', flat=True).iterator(),
+        dtype=np.int64,
+    )
+    category_ids = np.fromiter(Category.objects.order_by('id').values_list('id', flat=True), dtype=np.int64)
+    if not len(profile_ids) or not len(category_ids):
+        return first_id, last_id, 0, 0
+
+    totals = None
+    if options['resume'] and checkpoint_path and os.path.exists(checkpoint_path):
+        totals = ShardTotals.load(checkpoint_path, profile_ids, category_ids)
+    if totals is None:
+        totals = ShardTotals(profile_ids, category_ids)
+
+    comments = Comment.objects.filter(
+        profile_commented_on_id__gte=first_id, profile_commented_on_id__lte=last_id
+    ).order_by('pk').values_list(
+        'pk', 'profile_commented_on_id', 'category_scores', 'category_id', 'score'
+    )
+    chunks = 0
+    while True:
+        rows = list(comments.filter(pk__gt=totals.last_pk)[:options['chunk_size']])
+        if not rows:
+            break
+        totals.add_comments(rows)
+        chunks += 1
+        if checkpoint_path and chunks % options['checkpoint_every'] == 0:
+            totals.save(checkpoint_path)
+
+    updated = write_totals(totals, options['batch_size'])
+
+    if checkpoint_path:
+        open(done_path, 'w').close()
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+    return first_id, last_id, totals.comments_seen, updated
+
+
+def _init_worker():
+    import django
+    django.setup()
+    # Never share the parent's database connections
+    connections.close_all()
+
+
+def _recompute_shard_worker(args):
+    try:
+        return recompute_shard(*args)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild UserProfile.category_scores and the rating aggregates from the comments. "
+        "Comments are streamed in primary-key chunks and summed in NumPy arrays per profile-id shard."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from-profile', type=int, help="First profile id to recompute.")
+        parser.add_argument('--to-profile', type=int, help="Last profile id to recompute.")
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Comments read per query.")
+        parser.add_argument('--batch-size', type=int, default=500, help="Profiles written per bulk_update.")
+        parser.add_argument('--workers', type=int, default=1, help="Number of worker processes.")
+        parser.add_argument(
+            '--shards', type=int,
+            help="Number of profile-id shards (defaults to the number of workers).",
+        )
+        parser.add_argument('--checkpoint', help="Directory where shard progress is saved.")
+        parser.add_argument(
+            '--checkpoint-every', type=int, default=20,
+            help="Save shard progress after this many chunks.",
+        )
+        parser.add_argument(
+            '--resume', action='store_true',
+            help="Skip finished shards and continue the others from the checkpoint directory.",
+        )
+
+    def handle(self, *args, **options):
+        if options['resume'] and not options['checkpoint']:
+            raise CommandError("--resume needs --checkpoint.")
+        for name in ('chunk_size', 'batch_size', 'workers', 'checkpoint_every'):
+            if options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be at least 1.")
+        if options['shards'] is not None and options['shards'] < 1:
+            raise CommandError("--shards must be at least 1.")
+        if options['checkpoint']:
+            os.makedirs(options['checkpoint'], exist_ok=True)
+
+        profiles = UserProfile.objects.order_by('id')
+        if options['from_profile'] is not None:
+            profiles = profiles.filter(id__gte=options['from_profile'])
+        if options['to_profile'] is not None:
+            profiles = profiles.filter(id__lte=options['to_profile'])
+        profile_ids = np.fromiter(profiles.values_list('id', flat=True).iterator(), dtype=np.int64)
+        if not len(profile_ids):
+            self.stdout.write("No profiles to recompute.")
+            return
+
+        shards = split_shards(profile_ids, options['shards'] or options['workers'])
+        shard_options = {
+            key: options[key]
+            for key in ('chunk_size', 'batch_size', 'checkpoint', 'checkpoint_every', 'resume')
+        }
+        jobs = [(shard, shard_options) for shard in shards]
+
+        if options['workers'] == 1:
+            results = (recompute_shard(*job) for job in jobs)
+            self._report(results)
+        else:
+            # Forked workers must open their own connections
+            connections.close_all()
+            with multiprocessing.Pool(options['workers'], initializer=_init_worker) as pool:
+                self._report(pool.imap_unordered(_recompute_shard_worker, jobs))
+        invalidate_all_comment_stats()
+
+    def _report(self, results):
+        total_comments = total_updated = 0
+        for first_id, last_id, comments, updated in results:
+            if comments is None:
+                self.stdout.write(f"Profiles {first_id}-{last_id}: already done, skipped.")
+                continue
+            total_comments += comments
+            total_updated += updated
+            self.stdout.write(
+                f"Profiles {first_id}-{last_id}: {comments} comment(s) read, {updated} profile(s) updated."
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Recompute finished: {total_comments} comment(s) read, {total_updated} profile(s) updated."
+        ))
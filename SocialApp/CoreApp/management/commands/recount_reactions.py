@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from CoreApp.reactions import recount_reactions
+
+
+class Command(BaseCommand):
+    help = "Recompute Comment.like_count and dislike_count from the reactions."
+
+    def handle(self, *args, **options):
+        updated = recount_reactions()
+        self.stdout.write(self.style.SUCCESS(f"Reaction counts recomputed for {updated} comment(s)."))
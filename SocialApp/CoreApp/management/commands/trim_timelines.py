@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from CoreApp.models import TimelineEntry
+from CoreApp.timeline import restore_fanout_on_write, trim_timelines
+
+
+class Command(BaseCommand):
+    help = (
+        "Switch profiles back under TIMELINE_FANOUT_LIMIT followers to fan-out on write, "
+        "and trim every timeline to the newest TIMELINE_MAX_ENTRIES entries."
+    )
+
+    def handle(self, *args, **options):
+        restored = restore_fanout_on_write()
+        owner_ids = TimelineEntry.objects.order_by('owner_id').values_list('owner_id', flat=True).distinct()
+        count = 0
+        for owner_id in owner_ids.iterator():
+            trim_timelines([owner_id])
+            count += 1
+        self.stdout.write(self.style.SUCCESS(
+            f"{restored} profile(s) switched back to fan-out on write, "
+            f"{count} timeline(s) trimmed to {settings.TIMELINE_MAX_ENTRIES} entries."
+        ))
@@ -0,0 +1,109 @@
+# coreapp/metrics.py
+import atexit
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Every metric defined in the code, by name, for the metrics endpoint
+REGISTRY = {}
+
+# Counts not written to the cache yet, by key: counting a cache hit must not cost a cache write
+_pending = {}
+_pending_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def _add(key, amount):
+    """Add to a counter kept in the cache, through this process's buffer."""
+    global _last_flush
+    with _pending_lock:
+        _pending[key] = _pending.get(key, 0) + amount
+        now = time.monotonic()
+        if now - _last_flush < settings.METRICS_FLUSH_SECONDS:
+            return
+        _last_flush = now
+    flush()
+
+
+def flush():
+    """Write this process's buffered counts to the cache."""
+    global _pending
+    with _pending_lock:
+        pending, _pending = _pending, {}
+    for key, amount in pending.items():
+        _incr(key, amount)
+
+
+def _incr(key, amount):
+    """Atomically add to a counter kept in the cache, creating it (without expiry) if needed."""
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        if not cache.add(key, amount, None):
+            # Created by a concurrent request in the meantime
+            cache.incr(key, amount)
+
+
+# Counts of a worker that stops are not lost
+atexit.register(flush)
+
+
+class Counter:
+    """
+    Monotonic counter stored in the cache, so it is shared by the processes that share the cache.
+    Counts reach the cache within METRICS_FLUSH_SECONDS of a later count, or on the next snapshot().
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.key = f"metrics:{name}"
+        REGISTRY[name] = self
+
+    def incr(self, amount=1):
+        _add(self.key, amount)
+
+    def value(self):
+        return cache.get(self.key, 0)
+
+
+class Timer:
+    """Number and total duration of timed operations; reports their mean in milliseconds."""
+
+    def __init__(self, name):
+        self.name = name
+        self.count_key = f"metrics:{name}:count"
+        self.total_key = f"metrics:{name}:total_us"
+        REGISTRY[name] = self
+
+    def observe(self, seconds):
+        _add(self.count_key, 1)
+        _add(self.total_key, int(seconds * 1_000_000))
+
+    def value(self):
+        values = cache.get_many([self.count_key, self.total_key])
+        count = values.get(self.count_key, 0)
+        total_ms = values.get(self.total_key, 0) / 1000
+        return {"count": count, "total_ms": total_ms, "mean_ms": round(total_ms / count, 3) if count else None}
+
+
+class HitRatio:
+    """Share of cache hits among all lookups, derived from hit and miss counters."""
+
+    def __init__(self, name, hits, misses):
+        self.name = name
+        self.hits = hits
+        self.misses = misses
+        REGISTRY[name] = self
+
+    def value(self):
+        hits = sum(counter.value() for counter in self.hits)
+        total = hits + sum(counter.value() for counter in self.misses)
+        return round(hits / total, 4) if total else None
+
+
+def snapshot():
+    """Current value of every registered metric, with this process's buffered counts written first."""
+    flush()
+    return {name: metric.value() for name, metric in sorted(REGISTRY.items())}
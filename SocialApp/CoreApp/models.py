@@ -13,7 +13,7 @@ from django.core.validators import (
 from datetime import datetime, timedelta
 from django.db.models import JSONField
 from django.utils.timezone import now
-from django.db.models import Count, Q, F,Sum
+from django.db.models import Count, Q, F,Sum, FilteredRelation
 
 from django.core.exceptions import ValidationError
 import re
@@ -39,6 +39,23 @@ def max_file_size_validator(file):
         limit_mb = limit_bytes // (1024 * 1024)
         raise ValidationError(f"Maximum file size allowed is {limit_mb} MB. Please upload a smaller file.")
 
+def normalize_category_scores(category_scores, category_id=None, score=None):
+    """
+    Return a comment's ratings as {category_id: score} with integer keys.
+    - New format: the category_scores JSON field
+    - Old format: the separate category and score fields
+    """
+    if not category_scores:
+        return {int(category_id): score} if category_id and score else {}
+
+    scores = {}
+    for key, value in category_scores.items():
+        try:
+            scores[int(key)] = int(value)
+        except (TypeError, ValueError):
+            continue  # Ignore malformed entries
+    return scores
+
 # Function to generate a random string (letters and digits)
 def generate_random_unique_id():
     return ''.join(random.choices(string.ascii_letters + string.digits, k=10))
@@ -50,8 +67,12 @@ class UserProfile(models.Model):
     phone_number = models.CharField(
         unique=True, max_length=10,null=False,blank=False,validators=[validate_phone_number]
     )
+    # Legacy follow tables, superseded by Follow. Only read by the migrate_follows
+    # command; drop them once it has been run
     followers = models.ManyToManyField('self', symmetrical=False, related_name='followed_by', blank=True)
     following = models.ManyToManyField('self', symmetrical=False, related_name='follows', blank=True)
+    follower_count = models.PositiveIntegerField(default=0)  # Kept in step with Follow by the signals
+    following_count = models.PositiveIntegerField(default=0)  # Kept in step with Follow by the signals
     username = models.CharField(max_length=20, db_index=True, unique=True)
     bio = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -80,6 +101,9 @@ class UserProfile(models.Model):
     otp_max_out = models.DateTimeField(blank=True,null=True)
     is_active = models.BooleanField(default=False)
     category_scores = JSONField(default=dict, blank=True, null=True)
+    # Set once the profile has more than TIMELINE_FANOUT_LIMIT followers: its comments
+    # are then read directly by followers instead of being copied to their timelines
+    fanout_on_read = models.BooleanField(default=False)
     USERNAME_FIELD = "phone_number"
 
     # objects = UserProfileManager()
@@ -97,50 +121,34 @@ class UserProfile(models.Model):
         """Generate a random 6-digit OTP."""
         self.otp = ''.join(random.choices('0123456789', k=6))
         self.otp_expiry = now() + timedelta(minutes=5)  # OTP is valid for 5 minutes
-        self.save()
+        self.save(update_fields=['otp', 'otp_expiry'])
         return self.otp, self.otp_expiry
 
 
     def get_category_comment_stats(self):
-        all_categories = Category.objects.all()
-        
-        # Initialize stats for all categories
-        stats = {category.id: {'score': 0, 'count': 0} for category in all_categories}
-        
-        # Fetch all comments for the profile being commented on
-        comments = Comment.objects.filter(profile_commented_on=self)
-        
-        for comment in comments:
-            if hasattr(comment, 'category_scores') and comment.category_scores:
-                # New format: Use the category_scores field (JSON field)
-                category_scores = comment.category_scores
-            else:
-                # Old format: Use the separate category and score fields
-                category_scores = {str(comment.category.id): comment.score} if comment.category and comment.score else {}
-            
-            # Update stats for each category based on category_scores
-            for category_id, score in category_scores.items():
-                if int(category_id) in stats:
-                    stats[int(category_id)]['score'] += score
-                    stats[int(category_id)]['count'] += 1
-
-        # Calculate average score for each category
-        for category_id, data in stats.items():
-            if data['count'] > 0:
-                avg_score = data['score'] / data['count']
-                stats[category_id]['avg_score'] = round(avg_score, 2)
-            else:
-                stats[category_id]['avg_score'] = 0  # No comments for this category, so set avg_score to 0
+        # One query: every category LEFT JOINed to this profile's aggregate row
+        categories = Category.objects.annotate(
+            profile_aggregate=FilteredRelation(
+                'rating_aggregates', condition=Q(rating_aggregates__profile=self)
+            )
+        ).values_list('id', 'profile_aggregate__score_sum', 'profile_aggregate__score_count').order_by('id')
+
+        stats = {}
+        for category_id, score, count in categories:
+            score = score or 0
+            count = count or 0
+            stats[category_id] = {
+                'score': score,
+                'count': count,
+                'avg_score': round(score / count, 2) if count > 0 else 0,
+            }
 
         return stats
 
-
-
-
-
-
-    def get_user_average_score(self):
-        stats = self.get_category_comment_stats()
+    def get_user_average_score(self, stats=None):
+        # Callers that already have the category stats pass them in to skip the query
+        if stats is None:
+            stats = self.get_category_comment_stats()
 
         total_score = 0
         category_count = 0
@@ -159,9 +167,19 @@ class UserProfile(models.Model):
         return {'average_score': avg_score}
 
 
+    # Counters kept up to date by update() queries only (follows, ratings, timelines): saving a
+    # loaded profile leaves them out, so it cannot write back values changed since it was read
+    DENORMALIZED_FIELDS = ('follower_count', 'following_count', 'category_scores', 'fanout_on_read')
+
     def save(self, *args, **kwargs):
         if not self.profile_picture:
             self.profile_picture = 'images/profile-pics/keyd.jpg'
+        saving_loaded = not self._state.adding and not args and not kwargs.get('force_insert')
+        if saving_loaded and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.DENORMALIZED_FIELDS
+            ]
         super().save(*args, **kwargs)
 
         
@@ -172,6 +190,7 @@ class UserProfile(models.Model):
 
 
 class Follow(models.Model):
+    """The follow graph: one row per follower -> followed profile edge."""
     follower = models.ForeignKey(
         UserProfile,  # Following user
         on_delete=models.CASCADE,
@@ -195,10 +214,41 @@ class Follow(models.Model):
     class Meta:
         db_table = 'Core_Follows'
         unique_together = ('follower', 'following')  # Prevents adding the same relationship multiple times
+        indexes = [
+            # Followers of a profile (the unique index above serves the profiles one follows)
+            models.Index(fields=['following', 'follower'], name='follow_following_idx'),
+        ]
 
     def __str__(self):
         return f"{self.follower.username} follows {self.following.username}"
 
+class ProfileSearchGram(models.Model):
+    """
+    Search index of active profiles: the trigrams of the folded words of their username,
+    names and phone number, plus the one and two letter prefixes of each word.
+    Kept in sync by the UserProfile signals, see CoreApp/search.py.
+    """
+    profile = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='search_grams')
+    gram = models.CharField(max_length=3)
+
+    class Meta:
+        db_table = 'Core_ProfileSearchGrams'
+        unique_together = ('gram', 'profile')  # Posting lists: the profiles of each gram
+
+class FollowChange(models.Model):
+    """
+    Append-only log of follows and unfollows, written by the Follow signals and
+    consumed by the follow graph snapshot (see CoreApp/graph.py) to refresh incrementally.
+    Plain ids rather than foreign keys, so entries outlive deleted profiles.
+    """
+    follower_id = models.IntegerField()
+    following_id = models.IntegerField()
+    added = models.BooleanField()  # False for an unfollow
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'Core_FollowChanges'
+
 class Category(models.Model):
     name = models.CharField(max_length=255, unique=True)
 
@@ -214,8 +264,12 @@ class Comment(models.Model):
     content = models.TextField(max_length=255, blank=False, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     is_anonymous = models.BooleanField(default=True)
+    # Legacy reaction tables, superseded by Reaction. Only read by the migrate_reactions
+    # command; drop them once it has been run
     likes = models.ManyToManyField(UserProfile, related_name='liked_comments', blank=True)
     dislikes = models.ManyToManyField(UserProfile, related_name='disliked_comments', blank=True)
+    like_count = models.PositiveIntegerField(default=0)  # Kept in step with the reactions by toggle_reaction
+    dislike_count = models.PositiveIntegerField(default=0)  # Kept in step with the reactions by toggle_reaction
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='comments', default=1)  # new category field
     is_positive = models.BooleanField(default=True)  # Determine positive/negative comment
     score = models.PositiveIntegerField(default=0)
@@ -224,13 +278,135 @@ class Comment(models.Model):
     def __str__(self):
         return f"Comment by {self.user_profile.user.username} on {self.profile_commented_on.user.username}'s profile"
     
-    def clean(self):
-        if self.likes.filter(id__in=self.dislikes.values_list('id', flat=True)).exists():
-            raise ValidationError("A user cannot both like and dislike the same comment.")
-    
+    def get_scores(self):
+        """Return this comment's ratings as {category_id: score}."""
+        return normalize_category_scores(self.category_scores, self.category_id, self.score)
+
     class Meta:
         db_table = 'Core_Comments'
 
+
+class CommentSearchTerm(models.Model):
+    """
+    Full-text index of comment content: one row per folded word of a comment, with the
+    number of times it occurs. The profile commented on is copied so a profile's comments
+    can be searched on the index alone. Kept in sync by the Comment signals, see CoreApp/search.py.
+    """
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, related_name='search_terms')
+    profile = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='comment_search_terms')
+    term = models.CharField(max_length=50)
+    count = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        db_table = 'Core_CommentSearchTerms'
+        unique_together = ('comment', 'term')  # One row per comment and word
+        indexes = [
+            # Posting lists of a word within one profile's comments
+            models.Index(fields=['profile', 'term'], name='comment_term_profile_idx'),
+            # Posting lists across all comments, for the admin search
+            models.Index(fields=['term'], name='comment_term_idx'),
+        ]
+
+
+class Reaction(models.Model):
+    """
+    A profile's like or dislike on a comment. The unique (comment, profile) pair
+    makes the two mutually exclusive, so switching is an update of one row.
+    """
+    LIKE = 'like'
+    DISLIKE = 'dislike'
+    KIND_CHOICES = [
+        (LIKE, 'Like'),
+        (DISLIKE, 'Dislike'),
+    ]
+
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, related_name='reactions')
+    profile = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='reactions')
+    kind = models.CharField(max_length=7, choices=KIND_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.profile.username} {self.kind}s comment {self.comment_id}"
+
+    class Meta:
+        db_table = 'Core_Reactions'
+        unique_together = ('comment', 'profile')  # One reaction per profile and comment
+        indexes = [
+            # Counting and paging the likers or dislikers of a comment
+            models.Index(fields=['comment', 'kind', 'id'], name='reaction_comment_kind_idx'),
+            # A profile's own reactions on a page of comments, without touching the table
+            models.Index(fields=['profile', 'comment', 'kind'], name='reaction_profile_idx'),
+        ]
+
+
+class RatingAggregate(models.Model):
+    """
+    Running rating totals for one profile in one category.
+    Kept up to date by the Comment signals in CoreApp/signals.py.
+    """
+    profile = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='rating_aggregates')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='rating_aggregates')
+    score_sum = models.BigIntegerField(default=0)
+    score_count = models.BigIntegerField(default=0)
+    score_sq_sum = models.BigIntegerField(default=0)  # Sum of squared scores, for variance
+
+    def __str__(self):
+        return f"{self.profile.username} - {self.category.name}: {self.score_sum}/{self.score_count}"
+
+    class Meta:
+        db_table = 'Core_RatingAggregates'
+        unique_together = ('profile', 'category')  # One row per profile and category
+
+class TimelineEntry(models.Model):
+    """
+    A comment on a followed profile, copied to a follower's timeline when it is created.
+    LatestCommentsView reads these rows instead of scanning every followed profile.
+    """
+    owner = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='timeline_entries')
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, related_name='timeline_entries')
+    followed_profile = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='+')
+
+    def __str__(self):
+        return f"Comment {self.comment_id} on {self.owner.username}'s timeline"
+
+    class Meta:
+        db_table = 'Core_Timeline'
+        unique_together = ('owner', 'comment')  # Also serves the newest-first timeline reads
+        indexes = [
+            models.Index(fields=['owner', 'followed_profile'], name='timeline_owner_followed_idx'),
+        ]
+
+
+class LeaderboardEntry(models.Model):
+    """
+    Precomputed ranking row for one profile, per category or overall (category is null).
+    Refreshed from the rating aggregates whenever the profile's ratings change.
+    """
+    profile = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='leaderboard_entries')
+    category = models.ForeignKey(
+        Category, on_delete=models.CASCADE, related_name='leaderboard_entries', blank=True, null=True
+    )
+    score = models.FloatField()  # Bayesian average used for ranking
+    average_score = models.FloatField()
+    rating_count = models.BigIntegerField()
+
+    def __str__(self):
+        category = self.category.name if self.category else "Overall"
+        return f"{self.profile.username} - {category}: {self.score:.2f}"
+
+    class Meta:
+        db_table = 'Core_Leaderboard'
+        constraints = [
+            models.UniqueConstraint(fields=['profile', 'category'], name='unique_leaderboard_profile_category'),
+            models.UniqueConstraint(
+                fields=['profile'], condition=Q(category__isnull=True), name='unique_leaderboard_profile_overall'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['category', '-score', 'profile'], name='leaderboard_ranking_idx'),
+        ]
+
+
 class UserInquiry(models.Model):
     user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='user_inquiries')
     subject = models.CharField(max_length=255, blank=False, null=True)
@@ -0,0 +1,134 @@
+# coreapp/profile_cache.py
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .metrics import Counter, HitRatio
+from .models import UserProfile
+from .serializers import UserProfileSerializer, UserUpdateSerializer
+from .utils import bump_cache_version, cache_version
+
+# Serialized representations of a profile that are cached, by name
+PAYLOADS = {
+    'details': lambda profile: UserProfileSerializer(profile).data,
+    'info': lambda profile: UserUpdateSerializer(profile).data,
+    'id': lambda profile: {'id': profile.id},
+}
+# Alias value of a lookup known to match no profile
+MISSING = 0
+# Pause between two checks of a waiting request while another one loads the profile
+WAIT_STEP_SECONDS = 0.01
+
+hits = Counter('profile_cache.hits')
+misses = Counter('profile_cache.misses')
+coalesced = Counter('profile_cache.coalesced')
+hit_ratio = HitRatio('profile_cache.hit_ratio', hits=[hits], misses=[misses])
+
+
+def _version_key(profile_id):
+    return f"profile_version:{profile_id}"
+
+
+def profile_version(profile_id):
+    """Current cache version of a profile, bumped by every change to what its payloads show."""
+    return cache_version(_version_key(profile_id))
+
+
+def _alias_key(lookup, value):
+    return f"profile_alias:{lookup}:{value}"
+
+
+def _payload_key(profile_id, version, payload):
+    return f"profile:{profile_id}:{version}:{payload}"
+
+
+def _cached(payload, lookup, value):
+    """Return (found, data): the cached payload, (True, None) for a known miss, (False, None) if not cached."""
+    profile_id = cache.get(_alias_key(lookup, value))
+    if profile_id is None:
+        return False, None
+    if profile_id == MISSING:
+        return True, None
+
+    entry = cache.get(_payload_key(profile_id, profile_version(profile_id), payload))
+    # A renamed profile keeps its old aliases until they expire; they no longer match
+    if entry is None or entry['lookups'][lookup] != value:
+        return False, None
+    return True, entry['data']
+
+
+def _load(payload, lookup, value):
+    profile_id = UserProfile.objects.filter(**{lookup: value}).values_list('id', flat=True).first()
+    if profile_id is None:
+        cache.set(_alias_key(lookup, value), MISSING, settings.PROFILE_CACHE_MISSING_SECONDS)
+        return None
+
+    # The version is read before the profile, so a concurrent change can only make this
+    # payload outdated on arrival, never cache outdated data under the new version
+    version = profile_version(profile_id)
+    profile = UserProfile.objects.select_related('user').filter(id=profile_id).first()
+    if profile is None:
+        return None
+
+    data = PAYLOADS[payload](profile)
+    entry = {
+        'lookups': {'username': profile.username, 'user_id': profile.user_id, 'user__username': profile.user.username},
+        'data': data,
+    }
+    cache.set_many({
+        _payload_key(profile_id, version, payload): entry,
+        _alias_key(lookup, value): profile_id,
+    }, settings.PROFILE_CACHE_SECONDS)
+    return data
+
+
+def get_profile_payload(payload, lookup, value):
+    """
+    Return a serialized profile ('details', 'info' or 'id') found by its username, user_id
+    or user__username (the username of its User), or None
+    if no profile matches. Read through the cache: only one request per key loads a missing
+    payload while the others wait for it, for at most PROFILE_CACHE_LOCK_SECONDS.
+    """
+    found, data = _cached(payload, lookup, value)
+    if found:
+        hits.incr()
+        return data
+
+    lock_key = f"profile_load:{payload}:{lookup}:{value}"
+    owner = cache.add(lock_key, 1, settings.PROFILE_CACHE_LOCK_SECONDS)
+    if not owner:
+        coalesced.incr()
+        deadline = time.monotonic() + settings.PROFILE_CACHE_LOCK_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(WAIT_STEP_SECONDS)
+            found, data = _cached(payload, lookup, value)
+            if found:
+                return data
+        # The loading request is too slow or failed: load it here as well
+
+    misses.incr()
+    try:
+        return _load(payload, lookup, value)
+    finally:
+        if owner:
+            cache.delete(lock_key)
+
+
+def _bump(profile_ids):
+    for profile_id in profile_ids:
+        bump_cache_version(_version_key(profile_id))
+
+
+def invalidate_profiles(*profile_ids, lookups=()):
+    """
+    Make the cached payloads of the profiles outdated, and forget the given (lookup, value)
+    aliases, such as the ones of a new profile that were cached as missing. The versions are
+    bumped again on commit, so a request reading the old row before the commit cannot keep
+    its payload.
+    """
+    _bump(profile_ids)
+    cache.delete_many([_alias_key(lookup, value) for lookup, value in lookups])
+    transaction.on_commit(lambda: _bump(profile_ids))
+
@@ -0,0 +1,185 @@
+# coreapp/ratings.py
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .leaderboard import refresh_leaderboard
+from .models import Category, Comment, RatingAggregate, UserProfile, normalize_category_scores
+from .stats_cache import invalidate_comment_stats
+
+
+def score_deltas(old_scores, new_scores):
+    """
+    Compute per-category (sum, count, sum of squares) changes between two
+    {category_id: score} maps. Categories that do not change are left out.
+    """
+    deltas = {}
+    for sign, scores in ((-1, old_scores), (1, new_scores)):
+        for category_id, score in scores.items():
+            delta = deltas.setdefault(category_id, [0, 0, 0])
+            delta[0] += sign * score
+            delta[1] += sign
+            delta[2] += sign * score * score
+
+    return {category_id: tuple(delta) for category_id, delta in deltas.items() if any(delta)}
+
+
+def apply_rating_delta(profile_id, old_scores, new_scores):
+    """
+    Move a profile's aggregates from old_scores to new_scores.
+    Pass {} as old_scores for a new comment and {} as new_scores for a deleted one.
+    """
+    deltas = score_deltas(old_scores, new_scores)
+    if not deltas:
+        return
+
+    # Scores for unknown categories are ignored, like in the stats calculation
+    category_ids = sorted(Category.objects.filter(id__in=deltas).values_list('id', flat=True))
+
+    with transaction.atomic():
+        for category_id in category_ids:  # Fixed order so concurrent writers lock rows alike
+            _apply_category_delta(profile_id, category_id, *deltas[category_id])
+
+
+def _apply_category_delta(profile_id, category_id, score_delta, count_delta, sq_delta):
+    aggregates = RatingAggregate.objects.filter(profile_id=profile_id, category_id=category_id)
+    increment = {
+        'score_sum': F('score_sum') + score_delta,
+        'score_count': F('score_count') + count_delta,
+        'score_sq_sum': F('score_sq_sum') + sq_delta,
+    }
+    if aggregates.update(**increment):
+        if count_delta < 0:
+            # The last rating of the category was removed: keep no empty row
+            aggregates.filter(score_count__lte=0).delete()
+        return
+    if count_delta <= 0:
+        # Nothing to create for removals: the row is gone only when the profile is being deleted
+        return
+
+    try:
+        with transaction.atomic():
+            RatingAggregate.objects.create(
+                profile_id=profile_id,
+                category_id=category_id,
+                score_sum=score_delta,
+                score_count=count_delta,
+                score_sq_sum=sq_delta,
+            )
+    except IntegrityError:
+        # Another writer created the row first
+        aggregates.update(**increment)
+
+
+def apply_profile_score_delta(profile_id, old_scores, new_scores):
+    """
+    Move the totals in UserProfile.category_scores from old_scores to new_scores.
+    The profile row is locked for the read-modify-write so concurrent ratings
+    queue up instead of overwriting each other, and only that column is written.
+    """
+    deltas = score_deltas(old_scores, new_scores)
+    if not deltas:
+        return
+
+    with transaction.atomic():
+        rows = list(UserProfile.objects.select_for_update().filter(pk=profile_id).values_list(
+            'category_scores', flat=True
+        ))
+        if not rows:
+            return  # The profile is being deleted
+        totals = rows[0] or {}
+
+        for category_id, (score_delta, count_delta, _) in deltas.items():
+            current_data = totals.get(str(category_id), {"total_score": 0, "comment_count": 0})
+            current_data["total_score"] += score_delta
+            current_data["comment_count"] += count_delta
+            if current_data["comment_count"] > 0:
+                totals[str(category_id)] = current_data
+            else:
+                totals.pop(str(category_id), None)
+
+        UserProfile.objects.filter(pk=profile_id).update(category_scores=totals)
+
+
+def apply_comment_delta(profile_id, old_scores, new_scores):
+    """
+    Apply a comment change to both stores of a profile's ratings:
+    the RatingAggregate rows and the UserProfile.category_scores totals,
+    then refresh the profile's leaderboard entries and outdate its cached comment stats.
+    Costs O(categories) queries, whatever the number of comments.
+    """
+    with transaction.atomic():
+        apply_rating_delta(profile_id, old_scores, new_scores)
+        apply_profile_score_delta(profile_id, old_scores, new_scores)
+        refresh_leaderboard([profile_id])
+        invalidate_comment_stats(profile_id)
+
+
+def compute_rating_totals(profile_ids=None, chunk_size=2000):
+    """
+    Sum ratings straight from the Comment table.
+    Returns {(profile_id, category_id): (score_sum, score_count, score_sq_sum)}.
+    """
+    comments = Comment.objects.all()
+    if profile_ids is not None:
+        comments = comments.filter(profile_commented_on_id__in=profile_ids)
+
+    category_ids = set(Category.objects.values_list('id', flat=True))
+    totals = {}
+    rows = comments.values_list('profile_commented_on_id', 'category_scores', 'category_id', 'score')
+    for profile_id, category_scores, category_id, score in rows.iterator(chunk_size=chunk_size):
+        for cat_id, cat_score in normalize_category_scores(category_scores, category_id, score).items():
+            if cat_id not in category_ids:
+                continue
+            total = totals.setdefault((profile_id, cat_id), [0, 0, 0])
+            total[0] += cat_score
+            total[1] += 1
+            total[2] += cat_score * cat_score
+
+    return {key: tuple(total) for key, total in totals.items()}
+
+
+def find_rating_aggregate_mismatches(profile_ids=None):
+    """
+    Compare the stored aggregates with the raw comments.
+    Returns a list of (profile_id, category_id, expected, stored) tuples,
+    where expected and stored are (score_sum, score_count, score_sq_sum).
+    """
+    expected = compute_rating_totals(profile_ids)
+
+    aggregates = RatingAggregate.objects.all()
+    if profile_ids is not None:
+        aggregates = aggregates.filter(profile_id__in=profile_ids)
+    stored = {
+        (profile_id, category_id): (score_sum, score_count, score_sq_sum)
+        for profile_id, category_id, score_sum, score_count, score_sq_sum in aggregates.values_list(
+            'profile_id', 'category_id', 'score_sum', 'score_count', 'score_sq_sum'
+        ).iterator()
+    }
+
+    empty = (0, 0, 0)
+    mismatches = []
+    for key in sorted(expected.keys() | stored.keys()):
+        if expected.get(key, empty) != stored.get(key, empty):
+            mismatches.append((*key, expected.get(key, empty), stored.get(key, empty)))
+    return mismatches
+
+
+def repair_rating_aggregates(mismatches):
+    """Overwrite the stored aggregates listed by find_rating_aggregate_mismatches()."""
+    with transaction.atomic():
+        for profile_id, category_id, (score_sum, score_count, score_sq_sum), _ in mismatches:
+            if not score_count:
+                # No rating left in the category: no row, as after the last one is deleted
+                RatingAggregate.objects.filter(profile_id=profile_id, category_id=category_id).delete()
+                invalidate_comment_stats(profile_id)
+                continue
+            RatingAggregate.objects.update_or_create(
+                profile_id=profile_id,
+                category_id=category_id,
+                defaults={
+                    'score_sum': score_sum,
+                    'score_count': score_count,
+                    'score_sq_sum': score_sq_sum,
+                },
+            )
+            invalidate_comment_stats(profile_id)
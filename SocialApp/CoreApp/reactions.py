@@ -0,0 +1,112 @@
+# coreapp/reactions.py
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value, Window
+from django.db.models.functions import Coalesce, RowNumber
+
+from .models import Comment, Reaction
+
+# Number of reacting profiles embedded per comment and kind
+REACTORS_PAGE_SIZE = 20
+
+# Comment counter kept in step with each kind of reaction
+COUNTER_FIELDS = {
+    Reaction.LIKE: 'like_count',
+    Reaction.DISLIKE: 'dislike_count',
+}
+
+
+def reaction_summaries(comment_ids, viewer, include_reactors=False):
+    """
+    Return {comment_id: summary} with the like/dislike counts and the viewer's
+    own reaction for every comment, in a single query.
+    With include_reactors, the first REACTORS_PAGE_SIZE likers and dislikers of
+    each comment are added (one more query).
+    """
+    viewer_reaction = Reaction.objects.filter(comment_id=OuterRef('pk'), profile_id=viewer.pk).values('kind')[:1]
+    rows = Comment.objects.filter(id__in=comment_ids).annotate(
+        viewer_kind=Subquery(viewer_reaction),
+    ).values_list('id', 'like_count', 'dislike_count', 'viewer_kind')
+
+    summaries = {
+        comment_id: {
+            "id": comment_id,
+            "like_count": like_count,
+            "dislike_count": dislike_count,
+            "user_action": {
+                "has_liked": viewer_kind == Reaction.LIKE,
+                "has_disliked": viewer_kind == Reaction.DISLIKE,
+            },
+        }
+        for comment_id, like_count, dislike_count, viewer_kind in rows
+    }
+
+    if include_reactors and summaries:
+        reactors = first_reactors(summaries.keys())
+        for comment_id, summary in summaries.items():
+            summary["likes"] = reactors.get((comment_id, Reaction.LIKE), [])
+            summary["dislikes"] = reactors.get((comment_id, Reaction.DISLIKE), [])
+
+    return summaries
+
+
+def first_reactors(comment_ids, limit=REACTORS_PAGE_SIZE):
+    """Return {(comment_id, kind): [{"id", "username"}, ...]} with the first `limit` reactions of each kind."""
+    rows = Reaction.objects.filter(comment_id__in=comment_ids).annotate(
+        position=Window(RowNumber(), partition_by=[F('comment_id'), F('kind')], order_by=F('id').asc()),
+    ).filter(position__lte=limit).order_by('comment_id', 'kind', 'id').values_list(
+        'comment_id', 'kind', 'profile_id', 'profile__username'
+    )
+
+    reactors = {}
+    for comment_id, kind, profile_id, username in rows:
+        reactors.setdefault((comment_id, kind), []).append({"id": profile_id, "username": username})
+    return reactors
+
+
+def toggle_reaction(comment_id, profile_id, kind):
+    """
+    Toggle a profile's like or dislike on a comment and keep the comment's counters in step:
+    the same kind again removes the reaction, the other kind switches it in place.
+    Every step is a single statement on the (comment, profile) unique index, so the
+    cost does not depend on how many reactions the comment has.
+    Returns True if the profile now has this reaction, False if it was removed.
+    """
+    with transaction.atomic():
+        reaction = Reaction.objects.select_for_update().filter(comment_id=comment_id, profile_id=profile_id)
+        current = reaction.values_list('kind', flat=True).first()
+
+        if current is None:
+            try:
+                with transaction.atomic():
+                    Reaction.objects.create(comment_id=comment_id, profile_id=profile_id, kind=kind)
+            except IntegrityError:
+                # A concurrent request reacted first: toggle its reaction instead
+                return toggle_reaction(comment_id, profile_id, kind)
+            increments = {COUNTER_FIELDS[kind]: 1}
+            added = True
+        elif current == kind:
+            reaction.delete()
+            increments = {COUNTER_FIELDS[kind]: -1}
+            added = False
+        else:
+            reaction.update(kind=kind)
+            increments = {COUNTER_FIELDS[current]: -1, COUNTER_FIELDS[kind]: 1}
+            added = True
+
+        Comment.objects.filter(pk=comment_id).update(**{
+            field: F(field) + change for field, change in increments.items()
+        })
+
+    return added
+
+
+def recount_reactions():
+    """Recompute every comment's like and dislike counters from the reactions. Returns the number of comments."""
+    counts = Reaction.objects.filter(comment_id=OuterRef('pk')).order_by().values('comment_id')
+
+    def count_of(kind):
+        return Coalesce(
+            Subquery(counts.annotate(total=Count('id', filter=Q(kind=kind))).values('total')), Value(0)
+        )
+
+    return Comment.objects.update(**{field: count_of(kind) for kind, field in COUNTER_FIELDS.items()})
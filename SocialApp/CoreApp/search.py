@@ -0,0 +1,159 @@
+# coreapp/search.py
+import re
+from collections import Counter
+from functools import reduce
+from operator import add, or_
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum, Value
+from django.db.models.functions import Least
+
+from .models import Comment, CommentSearchTerm, ProfileSearchGram, UserProfile
+
+# Turkish letters are folded to their ASCII base, so "isik" finds "Işık" and "İLKER" finds "ilker".
+# Dotted capital İ and dotless ı are mapped before lower(), which would otherwise turn
+# "İ" into "i" plus a combining dot
+TURKISH_FOLDING = str.maketrans({
+    'İ': 'i', 'I': 'i', 'ı': 'i',
+    'Ş': 's', 'ş': 's',
+    'Ğ': 'g', 'ğ': 'g',
+    'Ü': 'u', 'ü': 'u',
+    'Ö': 'o', 'ö': 'o',
+    'Ç': 'c', 'ç': 'c',
+})
+WORD_RE = re.compile(r'\w+')
+# Upper bound of every code point, appended to a prefix to find the end of its range
+PREFIX_END = '\U0010ffff'
+
+SEARCH_FIELDS = ('username', 'first_name', 'last_name', 'phone_number')
+
+# Comment words are cut to the indexed length; only the first query words are searched
+MAX_TERM_LENGTH = 50
+MAX_QUERY_TERMS = 8
+
+
+def fold(text):
+    """Lower-case text the Turkish way and strip Turkish diacritics."""
+    return (text or '').translate(TURKISH_FOLDING).lower()
+
+
+def words(text):
+    return WORD_RE.findall(fold(text))
+
+
+def word_grams(word):
+    """The trigrams of a word; words shorter than three letters are their own gram."""
+    if len(word) < 3:
+        return {word}
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+
+def document_grams(profile):
+    """Grams indexed for a profile: trigrams and short prefixes of every word of the searched fields."""
+    grams = set()
+    for field in SEARCH_FIELDS:
+        for word in words(getattr(profile, field)):
+            grams |= word_grams(word)
+            grams.update(word[:length] for length in (1, 2) if len(word) > length)
+    return grams
+
+
+def index_profiles(profiles):
+    """Bring the index of the given profiles up to date; inactive profiles are removed from it."""
+    profiles = list(profiles)
+    wanted = {profile.pk: document_grams(profile) if profile.is_active else set() for profile in profiles}
+
+    existing = {}
+    for profile_id, gram in ProfileSearchGram.objects.filter(profile_id__in=wanted).values_list('profile_id', 'gram'):
+        existing.setdefault(profile_id, set()).add(gram)
+
+    stale = Q()
+    added = []
+    for profile_id, grams in wanted.items():
+        current = existing.get(profile_id, set())
+        if current - grams:
+            stale |= Q(profile_id=profile_id, gram__in=current - grams)
+        added.extend(ProfileSearchGram(profile_id=profile_id, gram=gram) for gram in grams - current)
+
+    with transaction.atomic():
+        if stale:
+            ProfileSearchGram.objects.filter(stale).delete()
+        ProfileSearchGram.objects.bulk_create(added, ignore_conflicts=True)
+
+
+def search_profiles(query):
+    """
+    Active profiles matching any word of the query, most relevant first.
+    Relevance is the number of distinct query grams a profile has; profiles with fewer grams
+    than the shortest query word are left out. Query words shorter than three letters match
+    word prefixes. Only the posting lists of the query grams are read.
+    """
+    query_grams = [word_grams(word) for word in words(query)]
+    if not query_grams:
+        return UserProfile.objects.none()
+
+    all_grams = set().union(*query_grams)
+    return UserProfile.objects.filter(search_grams__gram__in=all_grams, is_active=True).annotate(
+        relevance=Count('search_grams', distinct=True),
+    ).filter(
+        relevance__gte=min(len(grams) for grams in query_grams),
+    ).order_by('-relevance', 'id')
+
+
+def comment_terms(content):
+    """{folded word: occurrences} of a comment's content."""
+    return Counter(word[:MAX_TERM_LENGTH] for word in words(content))
+
+
+def index_comments(comments):
+    """Bring the full-text index of the given comments up to date, writing only the changed words."""
+    wanted = {comment.pk: (comment.profile_commented_on_id, comment_terms(comment.content)) for comment in comments}
+
+    existing = {}
+    for comment_id, profile_id, term, count in CommentSearchTerm.objects.filter(comment_id__in=wanted).values_list(
+        'comment_id', 'profile_id', 'term', 'count'
+    ):
+        existing.setdefault(comment_id, {})[term] = (profile_id, count)
+
+    stale = Q()
+    added = []
+    for comment_id, (profile_id, terms) in wanted.items():
+        current = existing.get(comment_id, {})
+        outdated = [term for term, row in current.items() if row != (profile_id, terms.get(term))]
+        if outdated:
+            stale |= Q(comment_id=comment_id, term__in=outdated)
+        added.extend(
+            CommentSearchTerm(comment_id=comment_id, profile_id=profile_id, term=term, count=count)
+            for term, count in terms.items() if current.get(term) != (profile_id, count)
+        )
+
+    with transaction.atomic():
+        if stale:
+            CommentSearchTerm.objects.filter(stale).delete()
+        CommentSearchTerm.objects.bulk_create(added)
+
+
+def search_comments(query, profile_id=None, match_all=False):
+    """
+    Comments containing words that start with the query words, optionally only those made on
+    one profile, best match first: the most query words matched, then the most occurrences,
+    then the newest. With match_all, every query word has to match.
+    """
+    terms = list(dict.fromkeys(words(query)))[:MAX_QUERY_TERMS]
+    if not terms:
+        return Comment.objects.none()
+
+    # Word prefixes are ranges of the (profile, term) and (term) indexes
+    ranges = [Q(search_terms__term__gte=term, search_terms__term__lt=term + PREFIX_END) for term in terms]
+    matches = reduce(or_, ranges)
+    if profile_id is not None:
+        matches &= Q(search_terms__profile_id=profile_id)
+
+    # One filter() call, so the annotations aggregate over the matched index rows only
+    comments = Comment.objects.filter(matches).annotate(
+        relevance=reduce(add, [Least(Count('search_terms', filter=term_range), Value(1)) for term_range in ranges]),
+        hits=Sum('search_terms__count'),
+    )
+    if match_all:
+        comments = comments.filter(relevance=len(terms))
+    return comments.order_by('-relevance', '-hits', '-id')
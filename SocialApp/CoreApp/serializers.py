@@ -1,25 +1,66 @@
 # coreapp/serializers.py
 from rest_framework import serializers
-from .models import Report, UserProfile, Comment
+from django.db.models import OuterRef, Prefetch, Subquery
+from .models import LeaderboardEntry, Reaction, Report, UserProfile, Comment
+from .reactions import REACTORS_PAGE_SIZE
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """
+    Let clients pick a subset of the fields with ?fields=a,b (or fields=[...] when
+    instantiating). Unknown names are ignored, and no selection keeps every field.
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+
+        if fields is None:
+            request = self.context.get('request')
+            requested = request.query_params.get('fields') if request is not None else None
+            fields = requested.split(',') if requested else None
+        if fields:
+            selected = set(fields) & set(self.fields)
+            if selected:
+                for name in set(self.fields) - selected:
+                    self.fields.pop(name)
+
+
+class UserProfileSerializer(SparseFieldsMixin, serializers.ModelSerializer):
 
     class Meta:
         model = UserProfile
-        fields = ['id', 'username','bio', 'profile_picture', 'email', 'first_name', 'last_name', 'unique_id','followers', 'following','phone_number']
-        read_only_fields = ['user']  # The 'user' field will be automatically assigned
+        fields = ['id', 'username','bio', 'profile_picture', 'email', 'first_name', 'last_name', 'unique_id','follower_count', 'following_count','phone_number']
+        read_only_fields = ['user', 'follower_count', 'following_count']  # The 'user' field will be automatically assigned
 
     def get_profile_picture(self, obj):
         if obj.profile_picture:
             return f'http://localhost:8000{obj.profile_picture.url}'
         return None
 
+class UserProfileCardSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """Compact profile representation for lists: identity, names, picture and follow counts."""
+
+    class Meta:
+        model = UserProfile
+        fields = ['id', 'username', 'first_name', 'last_name', 'unique_id', 'profile_picture',
+                  'follower_count', 'following_count']
+        read_only_fields = fields
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """Load only the columns the card shows."""
+        return queryset.only(*UserProfileCardSerializer.Meta.fields)
+
 class UserUpdateSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = UserProfile
         fields = ['id', 'username', 'first_name', 'last_name', 'email', 'phone_number','bio']
 
+def _first_reactions(kind):
+    return Reaction.objects.filter(kind=kind).only('id', 'comment_id', 'profile_id').order_by('id')[:REACTORS_PAGE_SIZE]
+
+
 class CommentSerializer(serializers.ModelSerializer):
     commenter_username = serializers.CharField(source='user_profile.user.username')  # Username of the commenter
     user_unique_id = serializers.CharField(source='user_profile.unique_id')  # Unique ID of the commenter
@@ -29,6 +70,9 @@ class CommentSerializer(serializers.ModelSerializer):
     commented_profile_unique_id = serializers.CharField(source='profile_commented_on.unique_id')  # Unique ID of the commented profile
     created_at = serializers.DateTimeField(format='%Y-%m-%d %H:%M:%S')  # Date format
     average_score = serializers.SerializerMethodField()
+    likes = serializers.SerializerMethodField()  # Ids of the first profiles that liked the comment
+    dislikes = serializers.SerializerMethodField()  # Ids of the first profiles that disliked the comment
+    user_action = serializers.SerializerMethodField()  # The viewer's own reaction
     class Meta:
         model = Comment
         fields = [
@@ -37,6 +81,9 @@ class CommentSerializer(serializers.ModelSerializer):
             'content',
             'likes',
             'dislikes',
+            'like_count',
+            'dislike_count',
+            'user_action',
             'created_at',
             'user_unique_id',
             'is_anonymous',
@@ -47,14 +94,60 @@ class CommentSerializer(serializers.ModelSerializer):
             'category_scores',
             'average_score'
         ]
+        read_only_fields = ['like_count', 'dislike_count']  # Maintained by the like/dislike views
     
+    @staticmethod
+    def setup_eager_loading(queryset, viewer=None):
+        """
+        Load everything the serializer reads in a fixed number of queries: both profiles and
+        their users are joined, the first REACTORS_PAGE_SIZE likes and dislikes are prefetched
+        without their profiles, and with a viewer, their own reaction is annotated.
+        The full lists are paginated by likes_dislikes?reaction=likes|dislikes.
+        """
+        queryset = queryset.select_related(
+            'user_profile__user',
+            'profile_commented_on__user',
+        ).prefetch_related(
+            Prefetch('reactions', queryset=_first_reactions(Reaction.LIKE), to_attr='first_likes'),
+            Prefetch('reactions', queryset=_first_reactions(Reaction.DISLIKE), to_attr='first_dislikes'),
+        )
+        if viewer is not None:
+            queryset = queryset.annotate(viewer_kind=Subquery(
+                Reaction.objects.filter(comment_id=OuterRef('pk'), profile_id=viewer.pk).values('kind')[:1]
+            ))
+        return queryset
+
+    def get_likes(self, obj):
+        return self._first_reactors(obj, 'first_likes', Reaction.LIKE)
+
+    def get_dislikes(self, obj):
+        return self._first_reactors(obj, 'first_dislikes', Reaction.DISLIKE)
+
+    @staticmethod
+    def _first_reactors(obj, attr, kind):
+        reactions = getattr(obj, attr, None)
+        if reactions is None:
+            # Not loaded by setup_eager_loading (a comment just created or edited)
+            return list(Reaction.objects.filter(comment_id=obj.pk, kind=kind).order_by('id').values_list(
+                'profile_id', flat=True
+            )[:REACTORS_PAGE_SIZE])
+        return [reaction.profile_id for reaction in reactions]
+
+    def get_user_action(self, obj):
+        # Only annotated for a viewer; comments are serialized unannotated right after their
+        # author creates or edits them, and authors cannot react to their own comments
+        viewer_kind = getattr(obj, 'viewer_kind', None)
+        return {
+            "has_liked": viewer_kind == Reaction.LIKE,
+            "has_disliked": viewer_kind == Reaction.DISLIKE,
+        }
+
     def get_average_score(self, obj):
         total = 0
         count = 0
 
         # Calculate total and count
         for category, score in obj.category_scores.items():
-            print(category, score)  # Print for debugging
             total += int(score)
             count += 1
 
@@ -71,6 +164,30 @@ class CommentSerializer(serializers.ModelSerializer):
         last_name = obj.profile_commented_on.user.last_name
         return f"{first_name} {last_name}"
 
+class ProfileSuggestionSerializer(UserProfileCardSerializer):
+    mutual_count = serializers.SerializerMethodField()  # Followed profiles that follow the suggestion
+
+    class Meta(UserProfileCardSerializer.Meta):
+        fields = UserProfileCardSerializer.Meta.fields + ['mutual_count']
+
+    def get_mutual_count(self, obj):
+        return self.context['path_counts'].get(obj.id, 0)
+
+class LeaderboardEntrySerializer(serializers.ModelSerializer):
+    username = serializers.CharField(source='profile.username')
+    first_name = serializers.CharField(source='profile.first_name')
+    last_name = serializers.CharField(source='profile.last_name')
+    unique_id = serializers.CharField(source='profile.unique_id')
+    profile_picture = serializers.ImageField(source='profile.profile_picture')
+    score = serializers.SerializerMethodField()
+
+    class Meta:
+        model = LeaderboardEntry
+        fields = ['username', 'first_name', 'last_name', 'unique_id', 'profile_picture', 'category', 'score', 'average_score', 'rating_count']
+
+    def get_score(self, obj):
+        return round(obj.score, 2)
+
 class ReportSerializer(serializers.ModelSerializer):
     class Meta:
         model = Report
@@ -0,0 +1,253 @@
+# coreapp/shared_cache.py
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Largest number of keys bound in one statement (SQLite's default variable limit is 999)
+MAX_BOUND_KEYS = 900
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS cache_entries ("
+    " key TEXT PRIMARY KEY,"
+    " value BLOB NOT NULL,"
+    " expires REAL,"
+    " accessed INTEGER NOT NULL"
+    ") WITHOUT ROWID"
+)
+NOT_EXPIRED = "(expires IS NULL OR expires > ?)"
+
+
+def _encode(value):
+    # Integers are stored as SQLite integers so incr() can add to them in a single UPDATE;
+    # everything else (bools included) is pickled
+    if type(value) is int and -2 ** 63 <= value < 2 ** 63:
+        return value
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def _decode(value):
+    return value if isinstance(value, int) else pickle.loads(value)
+
+
+class SQLiteCache(BaseCache):
+    """
+    Cache shared by every process of a host through a SQLite database file (LOCATION), so
+    gunicorn workers see the same entries, counters and locks without an external service.
+
+    - incr() is a single UPDATE, atomic across processes; add() only writes a missing or
+      expired key, so it can serve as a lock.
+    - Expired entries are never returned, and are deleted when read or when the cache is culled.
+    - Once the cache holds more than MAX_ENTRIES, the least recently used entries are evicted:
+      the CULL_FREQUENCY-th part of them, or all with 0 (the same options as Django's backends).
+
+    The database runs in WAL mode, so reads never wait for writes. Reading an entry records
+    its use at most once per LRU_RESOLUTION seconds (an OPTIONS setting), to keep reads from
+    turning into writes; the entry count is checked once every CULL_CHECK_INTERVAL writes of
+    a process.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._location = str(location)
+        self._busy_timeout = float(options.get('BUSY_TIMEOUT', 5))
+        self._lru_resolution = int(options.get('LRU_RESOLUTION', 60))
+        self._cull_check_interval = int(options.get('CULL_CHECK_INTERVAL', 1000))
+        self._local = threading.local()
+
+    @property
+    def _db(self):
+        """This thread's connection, opened again in a forked process."""
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            directory = os.path.dirname(self._location)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self._location, timeout=self._busy_timeout, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            # A cache can lose its last writes on a power failure, it cannot be corrupted
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(SCHEMA)
+            local.db, local.pid, local.writes = db, os.getpid(), 0
+        return local.db
+
+    def _wrote(self, count=1):
+        local = self._local
+        local.writes += count
+        if local.writes >= self._cull_check_interval:
+            local.writes = 0
+            self._cull()
+
+    def _cull(self):
+        db = self._db
+        now = time.time()
+        count = db.execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0]
+        if count <= self._max_entries:
+            return
+        count -= db.execute("DELETE FROM cache_entries WHERE expires <= ?", (now,)).rowcount
+        if count <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            db.execute("DELETE FROM cache_entries")
+            return
+        evicted = max(count // self._cull_frequency, count - self._max_entries)
+        db.execute(
+            "DELETE FROM cache_entries WHERE key IN"
+            " (SELECT key FROM cache_entries ORDER BY accessed LIMIT ?)",
+            (evicted,),
+        )
+
+    def _read(self, rows):
+        """Decode (key, value, expires, accessed) rows into {key: value}, skipping expired ones."""
+        now = time.time()
+        stale_before = int(now) - self._lru_resolution
+        values, used, expired = {}, [], []
+        for key, value, expires, accessed in rows:
+            if expires is not None and expires <= now:
+                expired.append(key)
+                continue
+            values[key] = _decode(value)
+            if accessed < stale_before:
+                used.append(key)
+
+        if expired or used:
+            db = self._db
+            for chunk in _chunks(expired):
+                db.execute(
+                    f"DELETE FROM cache_entries WHERE expires <= ? AND key IN ({_params(chunk)})",
+                    (now, *chunk),
+                )
+            for chunk in _chunks(used):
+                db.execute(
+                    f"UPDATE cache_entries SET accessed = ? WHERE key IN ({_params(chunk)})",
+                    (int(now), *chunk),
+                )
+        return values
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        rows = self._db.execute(
+            "SELECT key, value, expires, accessed FROM cache_entries WHERE key = ?", (key,)
+        ).fetchall()
+        return self._read(rows).get(key, default)
+
+    def get_many(self, keys, version=None):
+        names = {self.make_and_validate_key(key, version=version): key for key in keys}
+        rows = []
+        for chunk in _chunks(list(names)):
+            rows += self._db.execute(
+                f"SELECT key, value, expires, accessed FROM cache_entries WHERE key IN ({_params(chunk)})",
+                chunk,
+            ).fetchall()
+        return {names[key]: value for key, value in self._read(rows).items()}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._db.execute(
+            "INSERT OR REPLACE INTO cache_entries (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+            (key, _encode(value), self.get_backend_timeout(timeout), int(time.time())),
+        )
+        self._wrote()
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires, accessed = self.get_backend_timeout(timeout), int(time.time())
+        rows = [
+            (self.make_and_validate_key(key, version=version), _encode(value), expires, accessed)
+            for key, value in data.items()
+        ]
+        db = self._db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.executemany(
+                "INSERT OR REPLACE INTO cache_entries (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+        self._wrote(len(rows))
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        added = self._db.execute(
+            "INSERT INTO cache_entries (key, value, expires, accessed) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT (key) DO UPDATE SET"
+            " value = excluded.value, expires = excluded.expires, accessed = excluded.accessed"
+            " WHERE cache_entries.expires <= ?",
+            (key, _encode(value), self.get_backend_timeout(timeout), int(now), now),
+        ).rowcount == 1
+        if added:
+            self._wrote()
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        db = self._db
+        now = time.time()
+        row = db.execute(
+            f"UPDATE cache_entries SET value = value + ?, accessed = ?"
+            f" WHERE key = ? AND typeof(value) = 'integer' AND {NOT_EXPIRED} RETURNING value",
+            (delta, int(now), key, now),
+        ).fetchone()
+        if row is not None:
+            return row[0]
+
+        # Missing, or not stored as an integer (a float, a big int): add to it in a transaction
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute(
+                f"SELECT value FROM cache_entries WHERE key = ? AND {NOT_EXPIRED}", (key, now)
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = _decode(row[0]) + delta
+            db.execute(
+                "UPDATE cache_entries SET value = ?, accessed = ? WHERE key = ?",
+                (_encode(value), int(now), key),
+            )
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        return self._db.execute(
+            f"UPDATE cache_entries SET expires = ?, accessed = ? WHERE key = ? AND {NOT_EXPIRED}",
+            (self.get_backend_timeout(timeout), int(now), key, now),
+        ).rowcount == 1
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._db.execute(
+            f"SELECT 1 FROM cache_entries WHERE key = ? AND {NOT_EXPIRED}", (key, time.time())
+        ).fetchone() is not None
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._db.execute("DELETE FROM cache_entries WHERE key = ?", (key,)).rowcount == 1
+
+    def delete_many(self, keys, version=None):
+        names = [self.make_and_validate_key(key, version=version) for key in keys]
+        for chunk in _chunks(names):
+            self._db.execute(f"DELETE FROM cache_entries WHERE key IN ({_params(chunk)})", chunk)
+
+    def clear(self):
+        self._db.execute("DELETE FROM cache_entries")
+
+
+def _chunks(keys):
+    return [keys[i:i + MAX_BOUND_KEYS] for i in range(0, len(keys), MAX_BOUND_KEYS)]
+
+
+def _params(chunk):
+    return ", ".join("?" * len(chunk))
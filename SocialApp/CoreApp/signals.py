@@ -0,0 +1,149 @@
+# coreapp/signals.py
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .autocomplete import KEY_FIELDS as AUTOCOMPLETE_FIELDS, remove_from_autocomplete_index, update_autocomplete_index
+from .conditional import invalidate_comments_received
+from .follows import apply_follow_delta
+from .models import Category, Comment, Follow, FollowChange, UserProfile, normalize_category_scores
+from .profile_cache import invalidate_profiles
+from .ratings import apply_comment_delta
+from .search import SEARCH_FIELDS, index_comments, index_profiles
+from .stats_cache import invalidate_all_comment_stats
+from .timeline import backfill_timeline, fan_out_comment, remove_from_timeline
+
+
+def _saved_any(update_fields, fields):
+    """Whether a save wrote any of the fields: every field does without update_fields."""
+    return update_fields is None or not set(fields).isdisjoint(update_fields)
+
+
+@receiver(pre_save, sender=Comment)
+def remember_previous_rating(sender, instance, raw=False, **kwargs):
+    """Keep the stored ratings of an edited comment so post_save can apply the difference."""
+    instance._previous_rating = None
+    if raw or instance.pk is None:
+        return
+
+    previous = Comment.objects.filter(pk=instance.pk).values_list(
+        'profile_commented_on_id', 'category_scores', 'category_id', 'score'
+    ).first()
+    if previous is not None:
+        profile_id, category_scores, category_id, score = previous
+        instance._previous_rating = (
+            profile_id, normalize_category_scores(category_scores, category_id, score)
+        )
+
+
+@receiver(post_save, sender=Comment)
+def update_rating_totals(sender, instance, created, raw=False, **kwargs):
+    """Add a new comment's ratings, or the change of an edited one, to the profile's totals."""
+    if raw:
+        return
+
+    new_scores = instance.get_scores()
+    previous = getattr(instance, '_previous_rating', None)
+    if previous is None:
+        apply_comment_delta(instance.profile_commented_on_id, {}, new_scores)
+    elif previous[0] == instance.profile_commented_on_id:
+        apply_comment_delta(instance.profile_commented_on_id, previous[1], new_scores)
+    else:
+        # The comment was moved to another profile
+        apply_comment_delta(previous[0], previous[1], {})
+        apply_comment_delta(instance.profile_commented_on_id, {}, new_scores)
+    instance._previous_rating = None
+
+
+@receiver(post_delete, sender=Comment)
+def remove_rating_totals(sender, instance, **kwargs):
+    """Take a deleted comment's ratings out of the profile's totals."""
+    apply_comment_delta(instance.profile_commented_on_id, instance.get_scores(), {})
+
+
+@receiver(post_save, sender=Comment)
+def add_comment_to_timelines(sender, instance, created, raw=False, **kwargs):
+    """Fan a new comment out to the followers of the profile it was made on."""
+    if created and not raw:
+        fan_out_comment(instance)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_list(sender, instance, **kwargs):
+    """Change the ETag of the comment list of the profile the comment was made on."""
+    invalidate_comments_received(instance.profile_commented_on_id)
+
+
+@receiver(post_save, sender=Comment)
+def update_comment_search_index(sender, instance, raw=False, **kwargs):
+    """Index the words of a new or edited comment; a deleted comment's words go with it (cascade)."""
+    if not raw:
+        index_comments([instance])
+
+
+@receiver(post_save, sender=Follow)
+def add_follow(sender, instance, created, raw=False, **kwargs):
+    """Count and log a new follow, and backfill the follower's timeline."""
+    if created and not raw:
+        apply_follow_delta(instance.follower_id, instance.following_id, 1)
+        FollowChange.objects.create(follower_id=instance.follower_id, following_id=instance.following_id, added=True)
+        backfill_timeline(instance.follower_id, instance.following_id)
+
+
+@receiver(post_delete, sender=Follow)
+def remove_follow(sender, instance, **kwargs):
+    """Uncount and log a removed follow, and clean up the follower's timeline."""
+    apply_follow_delta(instance.follower_id, instance.following_id, -1)
+    FollowChange.objects.create(follower_id=instance.follower_id, following_id=instance.following_id, added=False)
+    remove_from_timeline(instance.follower_id, instance.following_id)
+
+
+@receiver(post_save, sender=UserProfile)
+def update_search_index(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Re-index a saved profile's searched fields (or drop it from the index when inactive)."""
+    if not raw and _saved_any(update_fields, (*SEARCH_FIELDS, 'is_active')):
+        index_profiles([instance])
+
+
+@receiver(post_save, sender=UserProfile)
+def update_autocomplete(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Apply a saved profile to this process's autocomplete index."""
+    if not raw and _saved_any(update_fields, AUTOCOMPLETE_FIELDS):
+        update_autocomplete_index(instance)
+
+
+@receiver(post_delete, sender=UserProfile)
+def remove_autocomplete(sender, instance, **kwargs):
+    remove_from_autocomplete_index(instance.pk)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_cached_profile(sender, instance, **kwargs):
+    """Outdate the cached payloads of a changed profile, and any cached miss of its names."""
+    invalidate_profiles(instance.pk, lookups=[('username', instance.username), ('user_id', instance.user_id)])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user_profile(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        # Logins do not change anything the profile payloads show
+        return
+    profile_ids = UserProfile.objects.filter(user_id=instance.pk).values_list('id', flat=True)
+    invalidate_profiles(*profile_ids, lookups=[('user__username', instance.username)])
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_cached_follow_counts(sender, instance, **kwargs):
+    """Both profiles' follow counts changed."""
+    invalidate_profiles(instance.follower_id, instance.following_id)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_all_cached_comment_stats(sender, **kwargs):
+    """Every profile's comment stats list the categories."""
+    invalidate_all_comment_stats()
@@ -0,0 +1,103 @@
+# coreapp/stats_cache.py
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from .metrics import Counter, HitRatio, Timer
+from .models import UserProfile
+from .utils import bump_cache_version, cache_version
+
+# Bumped when every profile's stats change at once (categories edited, ratings recomputed)
+GENERATION_KEY = 'comment_stats_generation'
+
+hits = Counter('comment_stats.hits')
+stale_hits = Counter('comment_stats.stale_hits')
+misses = Counter('comment_stats.misses')
+hit_ratio = HitRatio('comment_stats.hit_ratio', hits=[hits, stale_hits], misses=[misses])
+recompute_time = Timer('comment_stats.recompute')
+
+
+def _version_key(profile_id):
+    return f"comment_stats_version:{profile_id}"
+
+
+def _entry_key(profile_id):
+    return f"comment_stats:{profile_id}"
+
+
+def comment_stats_version(profile_id):
+    """Current version of a profile's stats: (global generation, profile version)."""
+    return cache_version(GENERATION_KEY), cache_version(_version_key(profile_id))
+
+
+def compute_comment_stats(profile):
+    """The comment_stats payload: per-category stats and their overall average, in one query."""
+    stats = profile.get_category_comment_stats()
+    return {
+        "comment_stats": stats,
+        "average_score": profile.get_user_average_score(stats)['average_score'],
+    }
+
+
+def _recompute(profile_id):
+    """Compute and cache a profile's stats; returns (data, version), or None if the profile does not exist."""
+    # Read before the ratings, so a concurrent rating leaves the entry outdated, not hidden
+    version = comment_stats_version(profile_id)
+    started = time.perf_counter()
+    try:
+        profile = UserProfile.objects.only('id').filter(id=profile_id).first()
+        if profile is None:
+            return None
+        data = compute_comment_stats(profile)
+    finally:
+        recompute_time.observe(time.perf_counter() - started)
+        cache.delete(f"{_entry_key(profile_id)}:refresh")
+
+    cache.set(_entry_key(profile_id), {'version': version, 'data': data}, settings.COMMENT_STATS_CACHE_SECONDS)
+    return data, version
+
+
+def run_in_background(func):
+    """Run func in a daemon thread with its own database connection."""
+    def target():
+        try:
+            func()
+        finally:
+            connection.close()
+
+    threading.Thread(target=target, daemon=True).start()
+
+
+def get_comment_stats(profile_id):
+    """
+    A profile's comment_stats payload and the version it was computed at, cached under that
+    version. An outdated entry is still served while one background recompute per profile
+    refreshes it; only profiles with no entry at all are computed in the request.
+    None if the profile does not exist.
+    """
+    entry = cache.get(_entry_key(profile_id))
+    if entry is None:
+        misses.incr()
+        return _recompute(profile_id)
+
+    if entry['version'] == comment_stats_version(profile_id):
+        hits.incr()
+    else:
+        stale_hits.incr()
+        if cache.add(f"{_entry_key(profile_id)}:refresh", 1, settings.COMMENT_STATS_REFRESH_LOCK_SECONDS):
+            run_in_background(lambda: _recompute(profile_id))
+    return entry['data'], entry['version']
+
+
+def invalidate_comment_stats(profile_id):
+    """Mark a profile's cached stats outdated; again on commit, for reads of the uncommitted rows."""
+    key = _version_key(profile_id)
+    bump_cache_version(key)
+    transaction.on_commit(lambda: bump_cache_version(key))
+
+
+def invalidate_all_comment_stats():
+    bump_cache_version(GENERATION_KEY)
@@ -0,0 +1,48 @@
+# coreapp/suggestions.py
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from .graph import get_follow_graph
+from .leaderboard import bayesian_score
+from .models import UserProfile
+
+
+def rank_suggestions(graph, profile_id):
+    """
+    Rank the profiles reachable in two follow hops by number of paths, weighted by their
+    Bayesian rating average (see leaderboard.bayesian_score). Inactive profiles are left out.
+    Returns [(profile_id, path_count), ...], best first.
+    """
+    candidate_ids, path_counts = graph.two_hop_counts(profile_id)
+    # Weighting needs the database, so only the candidates with the most paths are weighted
+    top = np.argsort(-path_counts, kind='stable')[:settings.SUGGESTION_CANDIDATES]
+    paths = dict(zip(candidate_ids[top].tolist(), path_counts[top].tolist()))
+
+    ranked = []
+    for candidate_id, category_scores in UserProfile.objects.filter(id__in=paths, is_active=True).values_list(
+        'id', 'category_scores'
+    ):
+        totals = (category_scores or {}).values()
+        score_sum = sum(data.get("total_score", 0) for data in totals)
+        score_count = sum(data.get("comment_count", 0) for data in totals)
+        ranked.append((paths[candidate_id] * bayesian_score(score_sum, score_count), candidate_id))
+
+    ranked.sort(key=lambda item: (-item[0], item[1]))
+    return [(candidate_id, paths[candidate_id]) for _, candidate_id in ranked]
+
+
+def get_suggestions(profile_id):
+    """
+    Return the ranked suggestions of a profile, cached for SUGGESTIONS_CACHE_SECONDS,
+    or None when no follow graph snapshot is available.
+    """
+    cache_key = f"suggestions:{profile_id}"
+    suggestions = cache.get(cache_key)
+    if suggestions is None:
+        graph = get_follow_graph()
+        if graph is None:
+            return None
+        suggestions = rank_suggestions(graph, profile_id)
+        cache.set(cache_key, suggestions, settings.SUGGESTIONS_CACHE_SECONDS)
+    return suggestions
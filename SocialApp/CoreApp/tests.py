@@ -1,3 +1,1432 @@
-from django.test import TestCase
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.settings import api_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .autocomplete import _index as autocomplete_cache, reset_autocomplete_index
+from .management.commands.recompute_ratings import ShardTotals
+from .leaderboard import refresh_leaderboard
+from .metrics import REGISTRY as metrics_registry, Counter, flush as flush_metrics, snapshot as metrics_snapshot
+from .models import (
+    Category, Comment, CommentSearchTerm, Follow, LeaderboardEntry, RatingAggregate, Reaction, TimelineEntry, UserProfile,
+)
+from .profile_cache import get_profile_payload
+from .reactions import REACTORS_PAGE_SIZE
+from .ratings import find_rating_aggregate_mismatches
+from .shared_cache import SQLiteCache
+from .suggestions import get_suggestions
+from .throttling import CustomRateLimiter, TokenBuckets, TokenRateLimiter, buckets
+from .views import LeaderboardPagination
+
+
+def create_profile(username, index):
+    user = User.objects.create_user(username=username)
+    return UserProfile.objects.create(
+        user=user,
+        username=username,
+        phone_number=f"5{index:09d}",
+        email=f"{username}@example.com",
+        first_name=username,
+        last_name="Test",
+        is_active=True,
+    )
+
+
+class ConcurrentRatingTests(TransactionTestCase):
+    """Fire parallel ratings at one profile and check that no increment is lost."""
+
+    raters = 16
+
+    def setUp(self):
+        for category_id in (1, 2, 3):
+            Category.objects.create(id=category_id, name=f"Category {category_id}")
+        self.target = create_profile('target', 0)
+        self.users = [create_profile(f"rater{i}", i + 1).user for i in range(self.raters)]
+
+    def test_parallel_ratings_keep_exact_totals(self):
+        barrier = threading.Barrier(self.raters)
+        statuses = []
+
+        def rate(index, user):
+            client = APIClient()
+            client.force_authenticate(user=user)
+            try:
+                barrier.wait()
+                response = client.post('/api/comments/create', {
+                    'profile_commented_on': 'target',
+                    'content': f"Comment {index}",
+                    'category_scores': {'1': index % 10 + 1, '2': 5, '3': 10},
+                }, format='json')
+                statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=rate, args=(i, user)) for i, user in enumerate(self.users)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(statuses, [201] * self.raters)
+
+        expected = {
+            1: sum(i % 10 + 1 for i in range(self.raters)),
+            2: 5 * self.raters,
+            3: 10 * self.raters,
+        }
+        self.target.refresh_from_db()
+        for category_id, total in expected.items():
+            self.assertEqual(self.target.category_scores[str(category_id)], {
+                'total_score': total,
+                'comment_count': self.raters,
+            })
+            aggregate = RatingAggregate.objects.get(profile=self.target, category_id=category_id)
+            self.assertEqual((aggregate.score_sum, aggregate.score_count), (total, self.raters))
+
+
+class RatingTotalsTests(TestCase):
+    """Comment creates, edits and deletes move both rating stores by the difference only."""
+
+    def setUp(self):
+        for category_id in (1, 2, 3):
+            Category.objects.create(id=category_id, name=f"Category {category_id}")
+        self.author = create_profile('author', 0)
+        self.target = create_profile('target', 1)
+
+    def rate(self, scores, author=None):
+        return Comment.objects.create(
+            user_profile=author or self.author, profile_commented_on=self.target, content="Rating",
+            category_scores=scores,
+        )
+
+    def assertTotals(self, expected):
+        """expected: {category_id: (score_sum, score_count)}, for categories with ratings only."""
+        self.target.refresh_from_db()
+        self.assertEqual(self.target.category_scores, {
+            str(category_id): {"total_score": score, "comment_count": count}
+            for category_id, (score, count) in expected.items()
+        })
+        self.assertEqual(
+            {row.category_id: (row.score_sum, row.score_count) for row in self.target.rating_aggregates.all()},
+            expected,
+        )
+        self.assertEqual(find_rating_aggregate_mismatches(), [])
+
+    def test_edit_score(self):
+        self.rate({"1": 4})
+        comment = self.rate({"1": 2, "2": 5})
+        comment.category_scores = {"1": 3, "2": 5}
+        comment.save()
+        self.assertTotals({1: (7, 2), 2: (5, 1)})
+
+    def test_add_category_on_edit(self):
+        comment = self.rate({"1": 4})
+        comment.category_scores = {"1": 4, "3": 2}
+        comment.save()
+        self.assertTotals({1: (4, 1), 3: (2, 1)})
+
+    def test_delete_comment(self):
+        kept = self.rate({"1": 4})
+        deleted = self.rate({"1": 2, "2": 5})
+        deleted.delete()
+        self.assertTotals({1: (4, 1)})
+
+        # The last ratings leave no empty entries behind
+        kept.delete()
+        self.assertTotals({})
+
+    def test_delete_commenter(self):
+        self.rate({"1": 4})
+        other = create_profile('other', 2)
+        self.rate({"1": 2, "2": 5}, author=other)
+
+        other.delete()
+        self.assertTotals({1: (4, 1)})
+
+
+def legacy_category_stats(profile):
+    """The per-category stats as computed before the aggregates: by reading every comment."""
+    stats = {category.id: {'score': 0, 'count': 0} for category in Category.objects.all()}
+    for comment in Comment.objects.filter(profile_commented_on=profile):
+        for category_id, score in comment.get_scores().items():
+            if category_id in stats:
+                stats[category_id]['score'] += score
+                stats[category_id]['count'] += 1
+    for data in stats.values():
+        data['avg_score'] = round(data['score'] / data['count'], 2) if data['count'] else 0
+    return stats
+
+
+class RatingAggregateStatsTests(TestCase):
+    """The one-query category stats match the comments; check_rating_aggregates finds and repairs drift."""
+
+    def setUp(self):
+        for category_id in (1, 2, 3):
+            Category.objects.create(id=category_id, name=f"Category {category_id}")
+        self.author = create_profile('author', 0)
+        self.target = create_profile('target', 1)
+        for scores in ({"1": 4, "2": 3}, {"1": 5}, {"2": 2, "99": 5}):
+            Comment.objects.create(
+                user_profile=self.author, profile_commented_on=self.target, content="Rating", category_scores=scores,
+            )
+        # Old format: a single category and score
+        Comment.objects.create(
+            user_profile=self.author, profile_commented_on=self.target, content="Old", category_id=2, score=4,
+        )
+
+    def test_stats_match_the_comments(self):
+        with CaptureQueriesContext(connection) as queries:
+            stats = self.target.get_category_comment_stats()
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(stats, legacy_category_stats(self.target))
+        # Category 3 has no ratings
+        self.assertEqual(stats[3], {'score': 0, 'count': 0, 'avg_score': 0})
+        self.assertEqual(stats[2], {'score': 9, 'count': 3, 'avg_score': 3.0})
+        self.assertEqual(self.author.get_category_comment_stats(), legacy_category_stats(self.author))
+
+    def test_check_and_repair(self):
+        RatingAggregate.objects.filter(profile=self.target, category_id=1).update(score_sum=1)
+        RatingAggregate.objects.create(profile=self.author, category_id=3, score_sum=2, score_count=1, score_sq_sum=4)
+
+        out = StringIO()
+        call_command('check_rating_aggregates', stdout=out)
+        self.assertIn("2 mismatched aggregate(s) found.", out.getvalue())
+        self.assertEqual(len(find_rating_aggregate_mismatches()), 2)
+
+        call_command('check_rating_aggregates', fix=True, stdout=StringIO())
+        self.assertEqual(find_rating_aggregate_mismatches(), [])
+        self.assertFalse(RatingAggregate.objects.filter(profile=self.author).exists())
+        self.assertEqual(self.target.get_category_comment_stats(), legacy_category_stats(self.target))
+
+
+class RecomputeRatingsTests(TestCase):
+    """recompute_ratings rebuilds both rating stores shard by shard, and resumes from its checkpoints."""
+
+    def setUp(self):
+        for category_id in (1, 2):
+            Category.objects.create(id=category_id, name=f"Category {category_id}")
+        self.author = create_profile('author', 0)
+        self.targets = [create_profile(f"target{i}", i + 1) for i in range(4)]
+        for i, target in enumerate(self.targets):
+            for score in range(1, i + 2):
+                Comment.objects.create(
+                    user_profile=self.author, profile_commented_on=target, content="Rating",
+                    category_scores={"1": score, "2": 10 - score},
+                )
+        self.expected = self.totals()
+
+        checkpoint = tempfile.TemporaryDirectory()
+        self.addCleanup(checkpoint.cleanup)
+        self.checkpoint = checkpoint.name
+
+    def totals(self):
+        return (
+            dict(UserProfile.objects.values_list('id', 'category_scores')),
+            sorted(RatingAggregate.objects.values_list(
+                'profile_id', 'category_id', 'score_sum', 'score_count', 'score_sq_sum'
+            )),
+        )
+
+    def corrupt(self):
+        UserProfile.objects.filter(pk__in=[target.pk for target in self.targets]).update(category_scores={})
+        RatingAggregate.objects.all().delete()
+
+    def recompute(self, **options):
+        out = StringIO()
+        call_command('recompute_ratings', stdout=out, **options)
+        return out.getvalue()
+
+    def test_sharded_recompute(self):
+        self.corrupt()
+        out = self.recompute(shards=3)
+
+        self.assertEqual(out.count("Profiles "), 3)
+        self.assertIn("Recompute finished: 10 comment(s) read, 4 profile(s) updated.", out)
+        self.assertEqual(self.totals(), self.expected)
+        self.assertEqual(find_rating_aggregate_mismatches(), [])
+
+        # Nothing left to change
+        self.assertIn("0 profile(s) updated.", self.recompute(shards=10))
+
+    def test_invalid_shards(self):
+        for shards in (0, -1):
+            with self.assertRaisesMessage(CommandError, "--shards must be at least 1."):
+                self.recompute(shards=shards)
+
+    def test_resume_skips_finished_shards(self):
+        self.recompute(shards=2, checkpoint=self.checkpoint)
+        self.assertEqual(len([name for name in os.listdir(self.checkpoint) if name.endswith('.done')]), 2)
+
+        self.corrupt()
+        out = self.recompute(shards=2, checkpoint=self.checkpoint, resume=True)
+        self.assertEqual(out.count("already done, skipped"), 2)
+        self.assertIn("Recompute finished: 0 comment(s) read", out)
+
+        self.recompute(shards=2, checkpoint=self.checkpoint)
+        self.assertEqual(self.totals(), self.expected)
+
+    def test_resume_continues_from_a_checkpoint(self):
+        # A run interrupted after the first comment of the only shard
+        profile_ids = np.array(sorted(UserProfile.objects.values_list('id', flat=True)), dtype=np.int64)
+        first = Comment.objects.order_by('pk').values_list(
+            'pk', 'profile_commented_on_id', 'category_scores', 'category_id', 'score'
+        )[:1]
+        totals = ShardTotals(profile_ids, np.array([1, 2], dtype=np.int64))
+        totals.add_comments(list(first))
+        totals.save(os.path.join(self.checkpoint, f"shard-{profile_ids[0]}-{profile_ids[-1]}.npz"))
+
+        # Deleted since: still counted from the checkpoint, the run does not start over
+        Comment.objects.get(pk=first[0][0]).delete()
+        self.corrupt()
+        out = self.recompute(checkpoint=self.checkpoint, resume=True)
+        self.assertIn("Recompute finished: 10 comment(s) read", out)
+        self.assertEqual(self.totals(), self.expected)
+        self.assertEqual(os.listdir(self.checkpoint), [f"shard-{profile_ids[0]}-{profile_ids[-1]}.done"])
+
+    def test_resume_needs_a_checkpoint(self):
+        with self.assertRaisesMessage(CommandError, "--resume needs --checkpoint."):
+            self.recompute(resume=True)
+
+
+@override_settings(LEADERBOARD_PRIOR_MEAN=5, LEADERBOARD_PRIOR_WEIGHT=2)
+class LeaderboardTests(TestCase):
+    """The leaderboard ranks by Bayesian average, per category or overall, with keyset pages."""
+
+    def setUp(self):
+        for category_id in (1, 2):
+            Category.objects.create(id=category_id, name=f"Category {category_id}")
+        self.author = create_profile('author', 0)
+        self.profiles = {}
+        for i, (username, ratings) in enumerate([
+            # One perfect rating ranks below many good ones: (2 * 5 + 10) / 3 < (2 * 5 + 40) / 7
+            ('single', [{"1": 10}]),
+            ('many', [{"1": 8}] * 5),
+            ('mixed', [{"1": 7, "2": 9}] * 2),
+            ('low', [{"2": 2}] * 3),
+        ]):
+            profile = self.profiles[username] = create_profile(username, i + 1)
+            for scores in ratings:
+                Comment.objects.create(
+                    user_profile=self.author, profile_commented_on=profile, content="Rating", category_scores=scores,
+                )
+
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.author.user)
+
+    def ranking(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [(entry['username'], entry['score'], entry['rating_count']) for entry in response.json()['results']]
+
+    def test_bayesian_ranking(self):
+        self.assertEqual(self.ranking('/api/leaderboard/'), [
+            ('many', 7.14, 5), ('mixed', 7.0, 4), ('single', 6.67, 1), ('low', 3.2, 3),
+        ])
+        entry = LeaderboardEntry.objects.get(profile=self.profiles['single'], category__isnull=True)
+        self.assertEqual(entry.average_score, 10)
+
+    def test_category_filter(self):
+        self.assertEqual(self.ranking('/api/leaderboard/?category=1'), [
+            ('many', 7.14, 5), ('single', 6.67, 1), ('mixed', 6.0, 2),
+        ])
+        self.assertEqual(self.ranking('/api/leaderboard/?category=2'), [('mixed', 7.0, 2), ('low', 3.2, 3)])
+        self.assertEqual(self.client.get('/api/leaderboard/?category=abc').status_code, 400)
+
+    def test_entries_follow_the_ratings(self):
+        Comment.objects.filter(profile_commented_on=self.profiles['many']).delete()
+        UserProfile.objects.filter(pk=self.profiles['single'].pk).update(is_active=False)
+        self.assertEqual([username for username, _, _ in self.ranking('/api/leaderboard/')], ['mixed', 'low'])
+
+        RatingAggregate.objects.filter(profile=self.profiles['mixed'], category_id=1).delete()
+        refresh_leaderboard([self.profiles['mixed'].pk])
+        self.assertEqual(self.ranking('/api/leaderboard/?category=1'), [])
+        self.assertEqual(self.ranking('/api/leaderboard/')[0], ('mixed', 7.0, 2))
+
+    def test_keyset_pagination(self):
+        # Ties on the score are broken by profile id
+        for i in range(3):
+            tied = create_profile(f"tied{i}", i + 10)
+            Comment.objects.create(
+                user_profile=self.author, profile_commented_on=tied, content="Rating", category_scores={"2": 2},
+            )
+
+        usernames = []
+        url = '/api/leaderboard/'
+        with mock.patch.object(LeaderboardPagination, 'page_size', 2):
+            while url:
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                # No COUNT; the cursor seeks on the score, an OFFSET only skips rows tied with it
+                self.assertFalse(any('COUNT(' in query['sql'] for query in queries))
+                usernames += [entry['username'] for entry in response.json()['results']]
+                url = response.json()['next']
+
+        self.assertEqual(usernames, ['many', 'mixed', 'single', 'tied0', 'tied1', 'tied2', 'low'])
+
+
+class CommentListingQueryCountTests(TestCase):
+    """Each comment listing must run the same number of queries whatever the page holds."""
+
+    def setUp(self):
+        for category_id in (1, 2, 3):
+            Category.objects.create(id=category_id, name=f"Category {category_id}")
+        self.viewer = create_profile('viewer', 0)
+        self.target = create_profile('target', 1)
+        self.reactors = [create_profile(f"reactor{i}", i + 2) for i in range(3)]
+        Follow.objects.create(follower=self.viewer, following=self.target)
+
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.viewer.user)
+
+    def add_comments(self, count):
+        for i in range(count):
+            comment = Comment.objects.create(
+                user_profile=self.viewer,
+                profile_commented_on=self.target,
+                content=f"Comment {i}",
+                category_scores={'1': 5, '2': 6, '3': 7},
+            )
+            Reaction.objects.bulk_create(
+                [Reaction(comment=comment, profile=profile, kind=Reaction.LIKE) for profile in self.reactors[:2]]
+                + [Reaction(comment=comment, profile=self.reactors[2], kind=Reaction.DISLIKE)]
+            )
+
+    def count_queries(self, url):
+        cache.clear()  # Both counts start from cold caches
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assertConstantQueries(self, url):
+        self.add_comments(1)
+        single = self.count_queries(url)
+        self.add_comments(9)
+        full_page = self.count_queries(url)
+        self.assertEqual(single, full_page)
+
+    def test_profile_comments(self):
+        self.assertConstantQueries('/api/user-profiles/target/comments/')
+
+    def test_own_comments(self):
+        self.assertConstantQueries('/api/comments/own_comments/')
+
+    def test_latest_comments(self):
+        self.assertConstantQueries('/api/latest-comments/')
+
+    def test_comment_list(self):
+        self.assertConstantQueries('/api/comments/')
+
+
+class PaginationTests(TestCase):
+    """Listings page by number unless the client asks for cursors; the cursor total is opt-in and cached."""
+
+    url = '/api/user-profiles/target/comments/'
+
+    def setUp(self):
+        cache.clear()
+        Category.objects.create(id=1, name="Category 1")
+        self.author = create_profile('author', 0)
+        self.target = create_profile('target', 1)
+        self.comments = [
+            Comment.objects.create(
+                user_profile=self.author, profile_commented_on=self.target, content=f"Comment {i}", category_scores={},
+            )
+            for i in range(12)
+        ]
+        self.newest_first = [comment.id for comment in reversed(self.comments)]
+
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.author.user)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        counted = any('COUNT(' in query['sql'] for query in queries)
+        return response.json(), counted
+
+    def test_page_mode_by_default(self):
+        page, _ = self.get(self.url)
+        self.assertEqual(set(page), {'count', 'next', 'previous', 'results'})
+        self.assertEqual(page['count'], 12)
+        self.assertEqual([comment['id'] for comment in page['results']], self.newest_first[:5])
+        self.assertIn('page=2', page['next'])
+
+        page, _ = self.get(f"{self.url}?page=3")
+        self.assertEqual([comment['id'] for comment in page['results']], self.newest_first[10:])
+        self.assertIsNone(page['next'])
+
+    def test_cursor_mode(self):
+        ids = []
+        pages = []
+        url = f"{self.url}?pagination=cursor"
+        while url:
+            page, counted = self.get(url)
+            self.assertFalse(counted)
+            self.assertNotIn('count', page)
+            ids += [comment['id'] for comment in page['results']]
+            pages.append(page)
+            url = page['next']
+            if url:
+                self.assertIn('pagination=cursor', url)
+
+        self.assertEqual(ids, self.newest_first)
+        self.assertEqual(len(pages), 3)
+        # The previous link goes back to the same page
+        previous, _ = self.get(pages[1]['previous'])
+        self.assertEqual(previous['results'], pages[0]['results'])
+
+    def test_count_is_opt_in_and_cached(self):
+        page, counted = self.get(f"{self.url}?pagination=cursor&count=true")
+        self.assertTrue(counted)
+        self.assertEqual(page['count'], 12)
+
+        # Approximate: served from the cache until it expires
+        Comment.objects.create(
+            user_profile=self.author, profile_commented_on=self.target, content="New", category_scores={},
+        )
+        page, counted = self.get(f"{self.url}?pagination=cursor&count=true")
+        self.assertFalse(counted)
+        self.assertEqual(page['count'], 12)
+        self.assertEqual(page['results'][0]['content'], "New")
+
+
+class CommentReactionTests(TestCase):
+    """Toggles keep the counters exact and the batch endpoint answers in one query."""
+
+    def setUp(self):
+        Category.objects.create(id=1, name="Category 1")
+        self.author = create_profile('author', 0)
+        self.target = create_profile('target', 1)
+        self.viewer = create_profile('viewer', 2)
+        self.comments = [
+            Comment.objects.create(
+                user_profile=self.author,
+                profile_commented_on=self.target,
+                content=f"Comment {i}",
+                category_scores={},
+            )
+            for i in range(3)
+        ]
+
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.viewer.user)
+
+    def test_toggles_keep_counters(self):
+        comment = self.comments[0]
+        self.client.post(f'/api/comments/{comment.id}/like/')
+        comment.refresh_from_db()
+        self.assertEqual((comment.like_count, comment.dislike_count), (1, 0))
+
+        self.client.post(f'/api/comments/{comment.id}/dislike/')
+        comment.refresh_from_db()
+        self.assertEqual((comment.like_count, comment.dislike_count), (0, 1))
+
+        self.client.post(f'/api/comments/{comment.id}/dislike/')
+        comment.refresh_from_db()
+        self.assertEqual((comment.like_count, comment.dislike_count), (0, 0))
+
+    def test_toggle_cost_does_not_grow_with_reactions(self):
+        comment = self.comments[0]
+
+        def toggle_queries():
+            with CaptureQueriesContext(connection) as queries:
+                self.client.post(f'/api/comments/{comment.id}/like/')
+            self.client.post(f'/api/comments/{comment.id}/like/')  # Undo
+            return len(queries)
+
+        few = toggle_queries()
+        Reaction.objects.bulk_create([
+            Reaction(comment=comment, profile=create_profile(f"liker{i}", i + 10), kind=Reaction.LIKE)
+            for i in range(30)
+        ])
+        self.assertEqual(toggle_queries(), few)
+
+    def test_batch_summary_is_one_query(self):
+        liked, disliked, untouched = self.comments
+        self.client.post(f'/api/comments/{liked.id}/like/')
+        self.client.post(f'/api/comments/{disliked.id}/dislike/')
+
+        ids = ','.join(str(comment.id) for comment in self.comments)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/comments/{liked.id}/likes_dislikes/?ids={ids}')
+        self.assertEqual(response.status_code, 200)
+        comment_queries = [query for query in queries if 'Core_Comments' in query['sql']]
+        self.assertEqual(len(comment_queries), 1)
+
+        summaries = {summary['id']: summary for summary in response.json()}
+        self.assertEqual(summaries[liked.id]['like_count'], 1)
+        self.assertEqual(summaries[liked.id]['user_action'], {'has_liked': True, 'has_disliked': False})
+        self.assertEqual(summaries[disliked.id]['user_action'], {'has_liked': False, 'has_disliked': True})
+        self.assertEqual(summaries[untouched.id]['dislike_count'], 0)
+
+    def test_listings_cap_the_reactors(self):
+        comment = self.comments[0]
+        likers = [create_profile(f"liker{i}", i + 10) for i in range(REACTORS_PAGE_SIZE + 5)]
+        Reaction.objects.bulk_create([Reaction(comment=comment, profile=liker, kind=Reaction.LIKE) for liker in likers])
+        Comment.objects.filter(pk=comment.pk).update(like_count=len(likers))
+        self.client.post(f'/api/comments/{comment.id}/dislike/')
+
+        response = self.client.get('/api/user-profiles/target/comments/')
+        self.assertEqual(response.status_code, 200)
+        listed = {listed_comment['id']: listed_comment for listed_comment in response.json()['results']}[comment.id]
+        self.assertEqual(listed['likes'], [liker.id for liker in likers[:REACTORS_PAGE_SIZE]])
+        self.assertEqual(listed['dislikes'], [self.viewer.id])
+        self.assertEqual(listed['like_count'], REACTORS_PAGE_SIZE + 5)
+        self.assertEqual(listed['user_action'], {'has_liked': False, 'has_disliked': True})
+
+        # Another viewer sees their own reaction, not this one
+        self.client.force_authenticate(user=likers[0].user)
+        listed = self.client.get(f'/api/comments/{comment.id}/').json()
+        self.assertEqual(listed['user_action'], {'has_liked': True, 'has_disliked': False})
+
+    def test_non_numeric_comment_id(self):
+        for url in ('/api/comments/abc/likes_dislikes/', '/api/comments/abc/likes_dislikes/?reaction=likes'):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class FollowToggleTests(TestCase):
+    """Follow toggles keep the counts and the timeline in step, at a cost independent of list sizes."""
+
+    def setUp(self):
+        Category.objects.create(id=1, name="Category 1")
+        self.viewer = create_profile('viewer', 0)
+        self.target = create_profile('target', 1)
+        self.comment = Comment.objects.create(
+            user_profile=self.target, profile_commented_on=self.target, content="Hello", category_scores={},
+        )
+
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.viewer.user)
+
+    def toggle(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/profiles/target/follow/')
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assertCounts(self, following, followers):
+        self.viewer.refresh_from_db()
+        self.target.refresh_from_db()
+        self.assertEqual((self.viewer.following_count, self.target.follower_count), (following, followers))
+
+    def test_follow_and_unfollow(self):
+        self.toggle()
+        self.assertCounts(1, 1)
+        self.assertTrue(TimelineEntry.objects.filter(owner=self.viewer, comment=self.comment).exists())
+
+        self.toggle()
+        self.assertCounts(0, 0)
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.viewer).exists())
+
+    def test_saving_a_loaded_profile_keeps_the_counts(self):
+        stale = UserProfile.objects.get(pk=self.target.pk)
+        self.toggle()
+        stale.first_name = "Renamed"
+        stale.save()
+        stale.generate_otp()
+
+        self.assertCounts(1, 1)
+        self.assertEqual(self.target.first_name, "Renamed")
+
+    def test_bulk_follow_status(self):
+        other = create_profile('other', 2)
+        Follow.objects.create(follower=self.viewer, following=self.target)
+        Follow.objects.create(follower=other, following=self.viewer)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/profiles/follow-status/?usernames=target,other,missing')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len([query for query in queries if 'Core_Follows' in query['sql']]), 1)
+        self.assertIn('private', response['Cache-Control'])
+
+        statuses = {result['username']: (result['following'], result['followed_by'])
+                    for result in response.json()['results']}
+        self.assertEqual(statuses, {'target': (True, False), 'other': (False, True)})
+
+    def test_follower_list_uses_cards_and_sparse_fields(self):
+        Follow.objects.create(follower=self.target, following=self.viewer)
+
+        response = self.client.get('/api/profiles/followers/?username=viewer')
+        self.assertEqual(response.status_code, 200)
+        card = response.json()['results'][0]
+        self.assertEqual(card['username'], 'target')
+        self.assertEqual(card['following_count'], 1)
+        self.assertNotIn('email', card)
+        self.assertNotIn('phone_number', card)
+
+        response = self.client.get('/api/profiles/followers/?username=viewer&fields=id,username')
+        self.assertEqual(response.json()['results'], [{'id': self.target.id, 'username': 'target'}])
+
+    def test_toggle_cost_does_not_grow_with_follows(self):
+        follow, unfollow = self.toggle(), self.toggle()
+
+        others = [create_profile(f"other{i}", i + 2) for i in range(20)]
+        Follow.objects.bulk_create(
+            [Follow(follower=self.viewer, following=other) for other in others]
+            + [Follow(follower=other, following=self.target) for other in others]
+        )
+        self.assertEqual((self.toggle(), self.toggle()), (follow, unfollow))
+
+
+@override_settings(TIMELINE_FANOUT_LIMIT=2, TIMELINE_MAX_ENTRIES=3)
+class TimelineTests(TestCase):
+    """Comments are copied to followers' timelines, or read directly once a profile has too many followers."""
+
+    def setUp(self):
+        Category.objects.create(id=1, name="Category 1")
+        self.target = create_profile('target', 0)
+        self.followers = [create_profile(f"follower{i}", i + 1) for i in range(3)]
+        for follower in self.followers[:2]:
+            Follow.objects.create(follower=follower, following=self.target)
+
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.followers[0].user)
+
+    def comment(self, content):
+        return Comment.objects.create(
+            user_profile=self.target, profile_commented_on=self.target, content=content, category_scores={},
+        )
+
+    def latest(self):
+        response = self.client.get('/api/latest-comments/')
+        self.assertEqual(response.status_code, 200)
+        return [comment['content'] for comment in response.json()['results']]
+
+    def test_fan_out_on_write(self):
+        comment = self.comment("Hello")
+
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(comment=comment).values_list('owner_id', flat=True)),
+            {self.followers[0].pk, self.followers[1].pk},
+        )
+        self.assertEqual(self.latest(), ["Hello"])
+
+    def test_read_fallback_over_the_limit(self):
+        self.comment("Before")
+        Follow.objects.create(follower=self.followers[2], following=self.target)
+        self.comment("After")
+
+        self.target.refresh_from_db()
+        self.assertTrue(self.target.fanout_on_read)
+        self.assertFalse(TimelineEntry.objects.filter(comment__content="After").exists())
+        self.assertEqual(self.latest(), ["After", "Before"])
+
+        # The follower who went over the limit only got the backfill, and reads the rest
+        self.client.force_authenticate(user=self.followers[2].user)
+        self.assertEqual(
+            list(TimelineEntry.objects.filter(owner=self.followers[2]).values_list('comment__content', flat=True)),
+            ["Before"],
+        )
+        self.assertEqual(self.latest(), ["After", "Before"])
+
+    def test_trim_keeps_the_newest_entries(self):
+        for i in range(5):
+            self.comment(f"Comment {i}")
+
+        out = StringIO()
+        call_command('trim_timelines', stdout=out)
+        self.assertIn("2 timeline(s) trimmed to 3 entries.", out.getvalue())
+        self.assertEqual(TimelineEntry.objects.filter(owner=self.followers[0]).count(), 3)
+        self.assertEqual(self.latest(), ["Comment 4", "Comment 3", "Comment 2"])
+
+    def test_fan_out_on_write_restored_after_unfollows(self):
+        Follow.objects.create(follower=self.followers[2], following=self.target)
+        self.comment("Pulled")
+        Follow.objects.get(follower=self.followers[2], following=self.target).delete()
+
+        out = StringIO()
+        call_command('trim_timelines', stdout=out)
+        self.assertIn("1 profile(s) switched back to fan-out on write", out.getvalue())
+        self.target.refresh_from_db()
+        self.assertFalse(self.target.fanout_on_read)
+        # The comments made while read-merged are backfilled, new ones are copied again
+        self.comment("Pushed")
+        for follower in self.followers[:2]:
+            self.assertEqual(
+                list(TimelineEntry.objects.filter(owner=follower).order_by('-comment_id').values_list(
+                    'comment__content', flat=True
+                )),
+                ["Pushed", "Pulled"],
+            )
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.followers[2]).exists())
+        self.assertEqual(self.latest(), ["Pushed", "Pulled"])
+
+        # Still over the limit: left read-merged
+        Follow.objects.create(follower=self.followers[2], following=self.target)
+        self.comment("Pulled again")
+        call_command('trim_timelines', stdout=StringIO())
+        self.target.refresh_from_db()
+        self.assertTrue(self.target.fanout_on_read)
+
+
+class FollowGraphTests(TestCase):
+    """The snapshot answers graph questions and follows the change log incrementally."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(FOLLOW_GRAPH_DIR=directory.name, FOLLOW_GRAPH_RELOAD_SECONDS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+
+        self.viewer, self.target, self.alice, self.bob = (
+            create_profile(username, i) for i, username in enumerate(['viewer', 'target', 'alice', 'bob'])
+        )
+        for follower, followed in [
+            (self.alice, self.viewer), (self.alice, self.target),
+            (self.bob, self.viewer), (self.viewer, self.bob), (self.bob, self.target),
+        ]:
+            Follow.objects.create(follower=follower, following=followed)
+
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.viewer.user)
+
+    def usernames(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['count'], len(data['results']))
+        return sorted(result['username'] for result in data['results'])
+
+    def test_unavailable_before_first_build(self):
+        response = self.client.get('/api/profiles/target/mutual-followers/')
+        self.assertEqual(response.status_code, 503)
+
+    def test_graph_endpoints_and_incremental_refresh(self):
+        call_command('build_follow_graph', stdout=StringIO())
+        self.assertEqual(self.usernames('/api/profiles/target/mutual-followers/'), ['alice', 'bob'])
+        self.assertEqual(self.usernames('/api/profiles/target/followed-by-following/'), ['bob'])
+
+        Follow.objects.filter(follower=self.alice, following=self.target).delete()
+        Follow.objects.create(follower=self.viewer, following=self.alice)
+        call_command('build_follow_graph', incremental=True, stdout=StringIO())
+
+        self.assertEqual(self.usernames('/api/profiles/target/mutual-followers/'), ['bob'])
+        self.assertEqual(self.usernames('/api/profiles/target/followed-by-following/'), ['bob'])
+        self.assertEqual(self.usernames('/api/profiles/alice/followed-by-following/'), [])
+
+    def test_suggestions(self):
+        carol = create_profile('carol', 10)
+        inactive = create_profile('inactive', 11)
+        UserProfile.objects.filter(pk=inactive.pk).update(is_active=False)
+        # Same number of paths as target (through bob), but better rated
+        UserProfile.objects.filter(pk=carol.pk).update(
+            category_scores={'1': {'total_score': 90, 'comment_count': 10}}
+        )
+        for followed in (carol, inactive):
+            Follow.objects.create(follower=self.bob, following=followed)
+        call_command('build_follow_graph', stdout=StringIO())
+
+        response = self.client.get('/api/profiles/suggestions/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(result['username'], result['mutual_count']) for result in response.json()['results']],
+            [('carol', 1), ('target', 1)],
+        )
+        # A limit below 1 still returns one suggestion, not the whole ranking
+        response = self.client.get('/api/profiles/suggestions/', {'limit': -1})
+        self.assertEqual([result['username'] for result in response.json()['results']], ['carol'])
+
+        # Following a suggestion drops it even before the cached ranking expires
+        self.client.post('/api/profiles/carol/follow/')
+        response = self.client.get('/api/profiles/suggestions/')
+        self.assertEqual([result['username'] for result in response.json()['results']], ['target'])
+
+    def test_suggestions_fill_the_limit(self):
+        others = [create_profile(f"other{i}", i + 10) for i in range(6)]
+        for other in others:
+            Follow.objects.create(follower=self.bob, following=other)
+        call_command('build_follow_graph', stdout=StringIO())
+        ranked = [profile_id for profile_id, _ in get_suggestions(self.viewer.pk)]
+        self.assertEqual(len(ranked), 7)
+
+        # The first batch of the cached ranking is followed or deactivated since
+        Follow.objects.create(follower=self.viewer, following_id=ranked[0])
+        Follow.objects.create(follower=self.viewer, following_id=ranked[1])
+        UserProfile.objects.filter(pk__in=ranked[2:4]).update(is_active=False)
+
+        response = self.client.get('/api/profiles/suggestions/', {'limit': 2})
+        self.assertEqual([result['id'] for result in response.json()['results']], ranked[4:6])
+        response = self.client.get('/api/profiles/suggestions/', {'limit': 5})
+        self.assertEqual([result['id'] for result in response.json()['results']], ranked[4:])
+
+
+class ProfileSearchTests(TestCase):
+    """Search goes through the n-gram index, folds Turkish letters and ranks by relevance."""
+
+    def setUp(self):
+        self.viewer = create_profile('viewer', 0)
+        for index, (username, first_name, last_name) in enumerate([
+            ('isik', 'Işık', 'Yılmaz'),
+            ('ilker', 'İlker', 'Şahin'),
+            ('yilmazer', 'Can', 'Yılmazer'),
+        ], start=1):
+            profile = create_profile(username, index)
+            profile.first_name, profile.last_name = first_name, last_name
+            profile.save()
+
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.viewer.user)
+
+    def search(self, query):
+        response = self.client.get('/api/profiles/search/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [result['username'] for result in response.json()['results']]
+
+    def test_turkish_folding(self):
+        self.assertEqual(self.search('IŞIK'), ['isik'])
+        self.assertEqual(self.search('ILKER sahin'), ['ilker'])
+        self.assertEqual(self.search('il'), ['ilker'])
+
+    def test_relevance_order(self):
+        # Both match "yilmaz"; the exact surname shares more grams with "yilmaz isik"
+        self.assertEqual(self.search('yilmaz isik'), ['isik', 'yilmazer'])
+
+    def test_inactive_profiles_are_dropped(self):
+        UserProfile.objects.filter(username='ilker').update(is_active=False)
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.search('ilker'), [])
+
+    def test_only_searched_fields_reindex(self):
+        profile = UserProfile.objects.get(username='isik')
+        with CaptureQueriesContext(connection) as queries:
+            profile.generate_otp()
+            profile.save(update_fields=['bio'])
+        self.assertFalse(any('Core_ProfileSearchGrams' in query['sql'] for query in queries))
+
+        profile.last_name = 'Kaya'
+        profile.save(update_fields=['bio', 'last_name'])
+        self.assertEqual(self.search('kaya'), ['isik'])
+
+    def test_admin_actions_update_the_indexes(self):
+        reset_autocomplete_index()
+        self.addCleanup(reset_autocomplete_index)
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        ilker = UserProfile.objects.get(username='ilker')
+
+        def run(action, is_active):
+            # From the changelist filtered on the current state, which the action changes
+            response = self.client.post(
+                f'/admin/CoreApp/userprofile/?is_active__exact={int(is_active)}',
+                {'action': action, '_selected_action': [ilker.pk]},
+            )
+            self.assertEqual(response.status_code, 302)
+
+        def autocomplete():
+            response = self.client.get('/api/profiles/autocomplete/', {'q': 'ilk'})
+            return [result['username'] for result in response.json()['results']]
+
+        self.assertEqual(autocomplete(), ['ilker'])
+        run('deactivate_users', True)
+        self.assertEqual(self.search('ilker'), [])
+        self.assertEqual(autocomplete(), [])
+
+        run('activate_users', False)
+        self.assertEqual(self.search('ilker'), ['ilker'])
+        self.assertEqual(autocomplete(), ['ilker'])
+
+
+class ProfileAutocompleteTests(TestCase):
+    """Autocomplete matches name prefixes from the in-memory index, most followed first."""
+
+    def setUp(self):
+        reset_autocomplete_index()
+        self.viewer = create_profile('viewer', 0)
+        self.profiles = {}
+        for index, (username, first_name, last_name, follower_count) in enumerate([
+            ('sahin', 'Şahin', 'Öztürk', 3),
+            ('sahika', 'Şahika', 'Demir', 7),
+            ('ozan', 'Ozan', 'Şahinler', 1),
+        ], start=1):
+            profile = create_profile(username, index)
+            profile.first_name, profile.last_name, profile.follower_count = first_name, last_name, follower_count
+            profile.save(update_fields=['first_name', 'last_name', 'follower_count'])
+            self.profiles[username] = profile
+
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.viewer.user)
+        self.addCleanup(reset_autocomplete_index)
+
+    def complete(self, query, **params):
+        response = self.client.get('/api/profiles/autocomplete/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [result['username'] for result in response.json()['results']]
+
+    def test_prefixes_ranked_by_followers(self):
+        self.assertEqual(self.complete('ŞAH'), ['sahika', 'sahin', 'ozan'])
+        self.assertEqual(self.complete('sahin'), ['sahin', 'ozan'])
+        self.assertEqual(self.complete('sahin  ozt'), ['sahin'])
+        self.assertEqual(self.complete('sah', limit=1), ['sahika'])
+
+    def test_saves_update_the_index(self):
+        self.assertEqual(self.complete('oz'), ['sahin', 'ozan'])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.complete('oz')
+        self.assertEqual(len(queries), 0)
+
+        ozan = self.profiles['ozan']
+        ozan.username = 'ozgur'
+        ozan.follower_count = 10
+        ozan.save(update_fields=['username', 'follower_count'])
+        self.assertEqual(self.complete('oz'), ['ozgur', 'sahin'])
+
+        ozan.is_active = False
+        ozan.save()
+        self.assertEqual(self.complete('oz'), ['sahin'])
+
+    def test_other_saves_keep_the_index(self):
+        self.complete('sah')
+        index = autocomplete_cache.index
+        version = index.version
+
+        self.profiles['sahin'].generate_otp()
+        self.profiles['sahin'].save(update_fields=['bio'])
+        self.assertEqual(index.version, version)
+
+        self.profiles['sahin'].save(update_fields=['bio', 'last_name'])
+        self.assertEqual(index.version, version + 2)
+
+    def test_snapshot_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/autocomplete.json"
+            call_command('build_autocomplete_index', output=path, stdout=StringIO())
+            with override_settings(AUTOCOMPLETE_SNAPSHOT=path):
+                reset_autocomplete_index()
+                UserProfile.objects.filter(username='sahika').delete()
+                # Served from the snapshot, which still has the deleted profile
+                self.assertEqual(self.complete('sah'), ['sahika', 'sahin', 'ozan'])
+
+                # Rebuilds read the database, not the snapshot again
+                with mock.patch('CoreApp.autocomplete.connection'):
+                    autocomplete_cache._rebuild()
+                self.assertEqual(self.complete('sah'), ['sahin', 'ozan'])
+
+
+class CommentSearchTests(TestCase):
+    """Comment search reads the word index, which follows creates, edits and deletes."""
+
+    def setUp(self):
+        Category.objects.create(id=1, name="Category 1")
+        self.author = create_profile('author', 0)
+        self.target = create_profile('target', 1)
+        self.other = create_profile('other', 2)
+        self.comments = [
+            Comment.objects.create(user_profile=self.author, profile_commented_on=profile, content=content)
+            for profile, content in [
+                (self.target, "Çok yardımsever, yardım etti"),
+                (self.target, "Dakik ve yardımsever biri"),
+                (self.target, "Hiç dakik değil"),
+                (self.other, "Dakik ve yardımsever"),
+            ]
+        ]
+
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.author.user)
+
+    def search(self, query, username='target'):
+        response = self.client.get(f'/api/user-profiles/{username}/comments/search/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [result['id'] for result in response.json()['results']]
+
+    def test_ranked_and_scoped_to_profile(self):
+        first, second, third, _ = self.comments
+        # "yardım" is a prefix of both words of the first comment
+        self.assertEqual(self.search('YARDIM'), [first.id, second.id])
+        self.assertEqual(self.search('dakik yardımsever'), [second.id, third.id, first.id])
+
+    def test_index_follows_edits_and_deletes(self):
+        first, second, third, _ = self.comments
+        first.content = "Hep geç kalıyor"
+        first.save()
+        third.delete()
+        self.assertEqual(self.search('yardım'), [second.id])
+        self.assertEqual(self.search('gec'), [first.id])
+        self.assertEqual(self.search('dakik'), [second.id])
+
+    def test_resumable_backfill(self):
+        CommentSearchTerm.objects.filter(comment__in=self.comments[:2]).delete()
+        call_command('index_comments', batch_size=1, stdout=StringIO())
+        self.assertEqual(self.search('yardım'), [self.comments[0].id, self.comments[1].id])
+
+
+class ProfileCacheTests(TestCase):
+    """Profile payloads are read through the cache and outdated by the model signals."""
+
+    def setUp(self):
+        flush_metrics()  # Counts of earlier tests go before the cache is cleared
+        cache.clear()
+        self.viewer = create_profile('viewer', 0)
+        self.profile = create_profile('cached', 1)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.viewer.user)
+
+    def details(self, username='cached'):
+        return self.client.get('/api/profiles/details/', {'username': username})
+
+    def test_hits_are_served_without_queries(self):
+        self.assertEqual(self.details().json()['first_name'], 'cached')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/profiles/details/', {'username': 'cached', 'fields': 'id,username'})
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(response.json(), {'id': self.profile.id, 'username': 'cached'})
+
+        # The id lookup behind the ETag and the payload itself
+        stats = metrics_snapshot()
+        self.assertEqual((stats['profile_cache.hits'], stats['profile_cache.misses']), (2, 2))
+
+    def test_signals_invalidate(self):
+        self.details()
+        self.profile.first_name = 'Renamed'
+        self.profile.save()
+        self.assertEqual(self.details().json()['first_name'], 'Renamed')
+
+        Follow.objects.create(follower=self.viewer, following=self.profile)
+        self.assertEqual(self.details().json()['follower_count'], 1)
+
+        self.assertEqual(self.details('newcomer').status_code, 404)
+        create_profile('newcomer', 2)
+        self.assertEqual(self.details('newcomer').status_code, 200)
+
+        self.profile.username = 'moved'
+        self.profile.save()
+        self.assertEqual(self.details().status_code, 404)
+
+    def test_concurrent_misses_wait_for_one_load(self):
+        get_profile_payload('details', 'username', 'cached')
+        version = cache.get(f'profile_version:{self.profile.id}')
+        entries = cache.get_many([
+            f'profile_version:{self.profile.id}',
+            'profile_alias:username:cached',
+            f'profile:{self.profile.id}:{version}:details',
+        ])
+        cache.clear()
+        # Another request holds the load lock and stores the payload a moment later
+        cache.add('profile_load:details:username:cached', 1, 5)
+        loader = threading.Timer(0.05, lambda: cache.set_many(entries, None))
+        loader.start()
+        with CaptureQueriesContext(connection) as queries:
+            data = get_profile_payload('details', 'username', 'cached')
+        loader.join()
+        self.assertEqual(data['username'], 'cached')
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(metrics_snapshot()['profile_cache.coalesced'], 1)
+
+
+class CommentStatsCacheTests(TestCase):
+    """comment_stats is cached per profile; outdated entries are served while one recompute runs."""
+
+    def setUp(self):
+        flush_metrics()  # Counts of earlier tests go before the cache is cleared
+        cache.clear()
+        Category.objects.create(id=1, name="Category 1")
+        Category.objects.create(id=2, name="Category 2")
+        self.author = create_profile('author', 0)
+        self.target = create_profile('target', 1)
+        self.rate({"1": 8, "2": 6})
+
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.author.user)
+
+    def rate(self, category_scores):
+        return Comment.objects.create(
+            user_profile=self.author, profile_commented_on=self.target, content="Rating",
+            category_scores=category_scores,
+        )
+
+    def stats(self):
+        response = self.client.get('/api/profiles/comment_stats/', {'username': 'target'})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_cached_then_refreshed_in_background(self):
+        self.assertEqual(self.stats()['average_score'], 7.0)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.stats()['comment_stats']['1']['count'], 1)
+        self.assertEqual(len(queries), 0)
+
+        self.rate({"1": 10, "2": 10})
+        with mock.patch('CoreApp.stats_cache.run_in_background') as run_in_background:
+            # The outdated payload is served and a single recompute is started
+            self.assertEqual(self.stats()['average_score'], 7.0)
+            self.assertEqual(self.stats()['average_score'], 7.0)
+        self.assertEqual(run_in_background.call_count, 1)
+
+        run_in_background.call_args.args[0]()
+        self.assertEqual(self.stats()['average_score'], 8.5)
+
+        stats = metrics_snapshot()
+        self.assertEqual(
+            (stats['comment_stats.hits'], stats['comment_stats.stale_hits'], stats['comment_stats.misses']), (2, 2, 1)
+        )
+        self.assertEqual(stats['comment_stats.recompute']['count'], 2)
+
+
+class MetricsTests(TestCase):
+    """Counts are buffered in the process and written to the cache in batches."""
+
+    def setUp(self):
+        flush_metrics()
+        cache.clear()
+        self.counter = Counter('tests.counted')
+        self.addCleanup(metrics_registry.pop, 'tests.counted')
+
+    def test_counts_are_buffered(self):
+        with override_settings(METRICS_FLUSH_SECONDS=3600):
+            for _ in range(5):
+                self.counter.incr()
+            self.assertIsNone(cache.get(self.counter.key))
+            self.assertEqual(metrics_snapshot()['tests.counted'], 5)
+            self.assertEqual(cache.get(self.counter.key), 5)
+
+        with override_settings(METRICS_FLUSH_SECONDS=0):
+            self.counter.incr(2)
+            self.assertEqual(cache.get(self.counter.key), 7)
+
+
+class ConditionalGetTests(TestCase):
+    """Polled endpoints send version-based ETags and answer 304 without serializing."""
+
+    def setUp(self):
+        cache.clear()
+        Category.objects.create(id=1, name="Category 1")
+        self.viewer = create_profile('viewer', 0)
+        self.target = create_profile('target', 1)
+        Follow.objects.create(follower=self.viewer, following=self.target)
+        self.comment = self.comment_on_target("First")
+
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.viewer.user)
+
+    def comment_on_target(self, content):
+        return Comment.objects.create(
+            user_profile=self.target, profile_commented_on=self.target, content=content, category_scores={"1": 5},
+        )
+
+    def assertRevalidates(self, url, params, change):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertFalse(any('"Core_Comments"."content"' in query['sql'] for query in queries))
+
+        change()
+        response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_profile_details(self):
+        def rename():
+            self.target.first_name = "Renamed"
+            self.target.save()
+        self.assertRevalidates('/api/profiles/details/', {'username': 'target'}, rename)
+
+    def test_comments_received(self):
+        url = '/api/user-profiles/target/comments/'
+        self.assertRevalidates(url, {}, lambda: self.client.post(f'/api/comments/{self.comment.id}/like/'))
+        self.assertRevalidates(url, {}, lambda: self.comment_on_target("Second"))
+        # Another page is another resource
+        self.assertNotEqual(self.client.get(url)['ETag'], self.client.get(url, {'pagination': 'cursor'})['ETag'])
+
+    def test_comments_received_changes_again_on_commit(self):
+        url = '/api/user-profiles/target/comments/'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.comment_on_target("Second")
+            # Polled before the commit: another process would still read the old rows
+            etag = self.client.get(url)['ETag']
+        self.assertNotEqual(self.client.get(url)['ETag'], etag)
+
+    def test_latest_comments(self):
+        self.assertRevalidates('/api/latest-comments/', {}, lambda: self.comment_on_target("Second"))
+
+    def test_comment_stats(self):
+        def rate_and_refresh():
+            with mock.patch('CoreApp.stats_cache.run_in_background') as run_in_background:
+                self.comment_on_target("Second")
+                # Until the recompute has run, the outdated stats keep their ETag
+                response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+            run_in_background.call_args.args[0]()
+
+        url, params = '/api/profiles/comment_stats/', {'username': 'target'}
+        etag = self.client.get(url, params)['ETag']
+        self.assertRevalidates(url, params, rate_and_refresh)
+
+
+def _increment(location, key, times):
+    backend = SQLiteCache(location, {})
+    for _ in range(times):
+        backend.incr(key)
+
+
+class SharedCacheTests(TestCase):
+    """The SQLite backend: atomic counters across processes, expiry and LRU eviction."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = os.path.join(directory.name, 'cache.sqlite3')
+
+    def backend(self, **options):
+        return SQLiteCache(self.location, {'TIMEOUT': 60, 'OPTIONS': options})
+
+    def test_incr_is_atomic_across_processes(self):
+        self.backend().set('counter', 0)
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=_increment, args=(self.location, 'counter', 200)) for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        self.assertEqual(self.backend().get('counter'), 800)
+        with self.assertRaises(ValueError):
+            self.backend().incr('missing')
+
+    def test_add_and_expiry(self):
+        backend = self.backend()
+        self.assertTrue(backend.add('lock', 1, 0.05))
+        self.assertFalse(backend.add('lock', 2))
+        self.assertEqual(backend.get_many(['lock', 'other']), {'lock': 1})
+
+        time.sleep(0.06)
+        self.assertIsNone(backend.get('lock'))
+        self.assertTrue(backend.add('lock', {'owner': 2}))
+        self.assertEqual(backend.get('lock'), {'owner': 2})
+
+    def test_least_recently_used_are_evicted(self):
+        backend = self.backend(MAX_ENTRIES=10, CULL_FREQUENCY=2, CULL_CHECK_INTERVAL=1, LRU_RESOLUTION=0)
+        for i in range(10):
+            backend.set(f'key{i}', i)
+        # Entries used a second ago count as older than key0, read just now
+        backend._db.execute("UPDATE cache_entries SET accessed = accessed - 1")
+        backend.get('key0')
+
+        backend.set('key10', 10)
+        remaining = backend.get_many([f'key{i}' for i in range(11)])
+        self.assertLessEqual(len(remaining), 10)
+        self.assertIn('key0', remaining)
+        self.assertIn('key10', remaining)
+
+
+class TokenRateLimiterTests(TestCase):
+    """Sliding-window throttling per access token, with the Retry-After it advertises."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_profile('throttled', 1).user
+        self.now = 60 * 100000 + 30
+        patches = [
+            mock.patch.dict(api_settings.DEFAULT_THROTTLE_RATES, {'token': '3/minute'}),
+            mock.patch.object(TokenRateLimiter, 'timer', lambda throttle: self.now),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        return client
+
+    def test_limit_per_token(self):
+        client = self.client_for(self.user)
+        for _ in range(3):
+            self.assertEqual(client.get('/api/latest-comments/').status_code, 200)
+        response = client.get('/api/latest-comments/')
+        self.assertEqual(response.status_code, 429)
+        # 30 seconds until the next window, then 20 more until the 3 requests weigh 2
+        self.assertEqual(response['Retry-After'], '50')
+
+        self.assertEqual(self.client_for(self.user).get('/api/latest-comments/').status_code, 200)
+
+    def test_previous_window_slides_out(self):
+        client = self.client_for(self.user)
+        for _ in range(3):
+            client.get('/api/latest-comments/')
+
+        # 20 seconds into the next window the previous 3 requests weigh 2: room for one more
+        self.now += 50
+        self.assertEqual(client.get('/api/latest-comments/').status_code, 200)
+        response = client.get('/api/latest-comments/')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '20')
+
+        self.now += 20
+        self.assertEqual(client.get('/api/latest-comments/').status_code, 200)
+
+
+class CustomRateLimiterTests(TestCase):
+    """Per-IP token buckets, in memory and in the shared cache."""
+
+    def setUp(self):
+        cache.clear()
+        buckets.clear()
+        self.now = 1000.0
+        self.factory = RequestFactory()
+        patches = [
+            mock.patch.dict(api_settings.DEFAULT_THROTTLE_RATES, {'custom': '3/minute'}),
+            mock.patch.object(CustomRateLimiter, 'timer', lambda throttle: self.now),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def check(self, ip):
+        """Return (allowed, wait) for a request from ip."""
+        throttle = CustomRateLimiter()
+        allowed = throttle.allow_request(self.factory.get('/', REMOTE_ADDR=ip), None)
+        return allowed, None if allowed else throttle.wait()
+
+    def test_bucket_refills(self):
+        for _ in range(3):
+            self.assertEqual(self.check('10.0.0.1'), (True, None))
+        # One token every 20 seconds
+        self.assertEqual(self.check('10.0.0.1'), (False, 20.0))
+        self.assertTrue(self.check('10.0.0.2')[0])
+
+        self.now += 20
+        self.assertTrue(self.check('10.0.0.1')[0])
+        self.assertFalse(self.check('10.0.0.1')[0])
+
+    def test_idle_clients_are_evicted(self):
+        table = TokenBuckets(shards=1, max_size=2)
+        for ident in ('a', 'b', 'a', 'c'):
+            table.take(ident, 0.0, 1.0, 1)
+        self.assertEqual(len(table), 2)
+        # b was the least recently seen: it starts over with a full bucket, c's is still empty
+        self.assertEqual(table.take('b', 0.0, 1.0, 1), 0.0)
+        self.assertEqual(table.take('c', 0.0, 1.0, 1), 1.0)
+
+    @override_settings(CUSTOM_THROTTLE_SHARED=True)
+    def test_shared_cache_mode(self):
+        for _ in range(3):
+            self.assertTrue(self.check('10.0.0.1')[0])
+        allowed, wait = self.check('10.0.0.1')
+        self.assertFalse(allowed)
+        self.assertGreater(wait, 0)
+        self.assertEqual(len(buckets), 0)
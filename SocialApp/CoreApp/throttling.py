@@ -1,58 +1,165 @@
-from rest_framework.throttling import BaseThrottle
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+from django.conf import settings
 from django.core.cache import cache
-import time
-class CustomRateLimiter(BaseThrottle):
-    scope = 'custom'
+
+
+def _incr(key, timeout):
+    """Atomically increment a counter in the cache, creating it with the timeout if needed."""
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout)
+        return cache.incr(key)
+
+
+@functools.lru_cache(maxsize=None)
+def _parse_rate(rate):
+    return SimpleRateThrottle.parse_rate(None, rate)
+
+
+class SlidingWindowThrottle(SimpleRateThrottle):
+    """
+    Sliding-window limit at the scope's rate of DEFAULT_THROTTLE_RATES, per cache key.
+
+    Every window of the rate's duration has a counter in the cache. A request is counted in
+    the current window, and the previous window's count is added in proportion to how much
+    of it still falls within the last `duration` seconds: two integers per client and an
+    atomic incr per request, whatever the rate.
+    """
+
+    def get_rate(self):
+        # Throttles are created per request: a changed setting applies without a restart
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+    def parse_rate(self, rate):
+        # Parsed once per rate string rather than once per request
+        return _parse_rate(rate)
 
     def allow_request(self, request, view):
-        # Implement your custom rate-limiting logic here
-        # Return True if the request is allowed, False otherwise
-        user_ip = self.get_ident(request)
-        if self.is_allowed(user_ip):
+        if self.rate is None:
+            return True
+
+        key = self.get_cache_key(request, view)
+        window, self.elapsed = divmod(self.timer(), self.duration)
+        current_key = f"{key}_{int(window)}"
+        self.previous = cache.get(f"{key}_{int(window) - 1}", 0)
+        self.current = _incr(current_key, 2 * self.duration)
+
+        # previous * (duration - elapsed) / duration + current <= num_requests, without rounding errors
+        weighted = self.previous * (self.duration - self.elapsed) + self.current * self.duration
+        if weighted <= self.num_requests * self.duration:
             return True
-        return False
 
-    def is_allowed(self, user_ip):
-        # Custom logic to check if the IP is rate-limited
-        # For example, you could use a dictionary or database to track requests
-        # Replace with your actual logic
-        return True  # Allow all requests for demonstration
+        # Rejected requests are not counted, so a client that keeps retrying gets in when the window allows
+        cache.decr(current_key)
+        self.current -= 1
+        return False
 
     def wait(self):
-        # Optionally, return the time (in seconds) to wait before retrying
-        return None
+        """Seconds until a retry fits within the rate, for the Retry-After header."""
+        room = self.num_requests - 1
+        if self.current > room:
+            # Not before the next window, where the current count becomes the previous one
+            return self.duration - self.elapsed + self.duration * (self.current - room) / self.current
+        return max(0, self.duration * (self.previous - room + self.current) / self.previous - self.elapsed)
+
 
-    
-class TokenRateLimiter(BaseThrottle):
+class TokenRateLimiter(SlidingWindowThrottle):
+    """Sliding-window limit per access token (per IP for anonymous requests), at the 'token' rate."""
     scope = 'token'
 
-    def allow_request(self, request, view):
-        # Extract token from the request (assuming token is in the headers)
-        return True
+    def get_cache_key(self, request, view):
+        if request.auth is not None:
+            # The token as sent, hashed to keep keys short: one budget per token, not per user
+            token = request.META.get('HTTP_AUTHORIZATION', str(request.auth))
+            ident = hashlib.blake2b(token.encode(), digest_size=12).hexdigest()
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+class TokenBuckets:
+    """
+    Token buckets of many clients in process memory. They are split in shards with a lock
+    each, so requests of different clients rarely wait for each other, and a shard keeps at
+    most max_size / shards buckets: past that, the least recently seen client is forgotten,
+    which only refills its bucket.
+
+    A bucket is a single float, the time at which it is full again: once a client is known,
+    a request only replaces that value and moves its entry, without new keys or containers.
+    """
+
+    def __init__(self, shards, max_size):
+        self.shard_count = shards
+        self.shard_size = max(1, max_size // shards)
+        self.shards = [(threading.Lock(), OrderedDict()) for _ in range(shards)]
+
+    def take(self, ident, now, interval, capacity):
+        """
+        Take a token from the bucket of ident, which holds `capacity` tokens and regains one
+        every `interval` seconds. Returns 0.0 if it had one, otherwise the seconds until it has.
+        """
+        lock, buckets = self.shards[hash(ident) % self.shard_count]
+        with lock:
+            full_at = buckets.get(ident, now)
+            if full_at < now:
+                full_at = now
+            # The bucket is empty while it is more than `capacity` intervals from full
+            wait = full_at - (capacity - 1) * interval - now
+            if wait <= 0:
+                buckets[ident] = full_at + interval
+                wait = 0.0
+            elif ident not in buckets:
+                buckets[ident] = full_at
+            # Rejected clients count as seen, so flooding the table cannot refill their bucket
+            buckets.move_to_end(ident)
+            if len(buckets) > self.shard_size:
+                buckets.popitem(last=False)
+        return wait
 
-    def is_allowed(self, token):
-        # Define custom rate limit (e.g., 100 requests per minute per token)
-        limit = 100
-        window = 60  # seconds
+    def __len__(self):
+        return sum(len(buckets) for _, buckets in self.shards)
 
-        cache_key = f"throttle_token_{token}"
-        request_timestamps = cache.get(cache_key, [])
+    def clear(self):
+        for lock, buckets in self.shards:
+            with lock:
+                buckets.clear()
 
-        # Filter timestamps within the time window
-        current_time = time.time()
-        request_timestamps = [
-            ts for ts in request_timestamps if current_time - ts < window
-        ]
 
-        # Check if the token exceeds the rate limit
-        if len(request_timestamps) >= limit:
-            return False
+buckets = TokenBuckets(settings.CUSTOM_THROTTLE_SHARDS, settings.CUSTOM_THROTTLE_MAX_CLIENTS)
+
+
+class CustomRateLimiter(SlidingWindowThrottle):
+    """
+    Token bucket per client IP at the 'custom' rate: up to `num_requests` at once, refilled
+    one every `duration / num_requests` seconds. The buckets are kept by each worker process;
+    with CUSTOM_THROTTLE_SHARED the limit is counted in the shared cache instead, as a
+    sliding window, so it holds across workers.
+    """
+    scope = 'custom'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.shared = settings.CUSTOM_THROTTLE_SHARED
+        if self.shared:
+            return super().allow_request(request, view)
 
-        # Add the current request timestamp and update the cache
-        request_timestamps.append(current_time)
-        cache.set(cache_key, request_timestamps, timeout=window)
-        return True
+        self.retry_after = buckets.take(
+            self.get_ident(request), self.timer(), self.duration / self.num_requests, self.num_requests,
+        )
+        return self.retry_after == 0
 
     def wait(self):
-        # Optionally return the time to wait before retrying
-        return 60  # Wait 60 seconds before retrying
\ No newline at end of file
+        if self.shared:
+            return super().wait()
+        return self.retry_after
@@ -0,0 +1,118 @@
+# coreapp/timeline.py
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from .models import Comment, Follow, TimelineEntry, UserProfile
+
+_trim_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='timeline-trim')
+
+
+def fan_out_comment(comment):
+    """Copy a new comment to the timelines of everyone following the profile it was made on."""
+    profile = comment.profile_commented_on
+    if profile.fanout_on_read:
+        return
+
+    limit = settings.TIMELINE_FANOUT_LIMIT
+    follower_ids = list(Follow.objects.filter(following_id=profile.pk).values_list(
+        'follower_id', flat=True
+    )[:limit + 1])
+    if len(follower_ids) > limit:
+        # Too many followers: from now on they read this profile's comments directly
+        UserProfile.objects.filter(pk=profile.pk).update(fanout_on_read=True)
+        return
+
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(owner_id=follower_id, comment=comment, followed_profile_id=profile.pk)
+         for follower_id in follower_ids],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+    # Every timeline gets one entry per fanned-out comment, so trimming the
+    # receivers of one comment in N keeps them all close to the cap
+    if comment.pk % settings.TIMELINE_TRIM_EVERY == 0:
+        schedule_trim(follower_ids)
+
+
+def backfill_timeline(follower_id, followed_id):
+    """Add the latest comments on a newly followed profile to the follower's timeline."""
+    if UserProfile.objects.filter(pk=followed_id, fanout_on_read=True).exists():
+        return
+
+    comment_ids = Comment.objects.filter(profile_commented_on_id=followed_id).order_by('-id').values_list(
+        'id', flat=True
+    )[:settings.TIMELINE_MAX_ENTRIES]
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(owner_id=follower_id, comment_id=comment_id, followed_profile_id=followed_id)
+         for comment_id in comment_ids],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+    schedule_trim([follower_id])
+
+
+def remove_from_timeline(follower_id, followed_id):
+    """Drop an unfollowed profile's comments from the follower's timeline."""
+    TimelineEntry.objects.filter(owner_id=follower_id, followed_profile_id=followed_id).delete()
+
+
+def restore_fanout_on_write():
+    """
+    Copy comments to the timelines of the followers of read-merged profiles again once they
+    are back to TIMELINE_FANOUT_LIMIT followers or fewer, backfilling those timelines.
+    Returns the number of profiles switched back.
+    """
+    limit = settings.TIMELINE_FANOUT_LIMIT
+    profile_ids = list(UserProfile.objects.filter(fanout_on_read=True, follower_count__lte=limit).values_list(
+        'pk', flat=True
+    ))
+    restored = 0
+    for profile_id in profile_ids:
+        with transaction.atomic():
+            follower_ids = list(Follow.objects.filter(following_id=profile_id).values_list(
+                'follower_id', flat=True
+            )[:limit + 1])
+            if len(follower_ids) > limit:
+                # follower_count is behind: still too many followers
+                continue
+            # Cleared first: a comment made meanwhile is fanned out, and the backfill skips it as a duplicate
+            UserProfile.objects.filter(pk=profile_id).update(fanout_on_read=False)
+            comment_ids = list(Comment.objects.filter(profile_commented_on_id=profile_id).order_by(
+                '-id'
+            ).values_list('id', flat=True)[:settings.TIMELINE_MAX_ENTRIES])
+            TimelineEntry.objects.bulk_create(
+                [TimelineEntry(owner_id=follower_id, comment_id=comment_id, followed_profile_id=profile_id)
+                 for follower_id in follower_ids for comment_id in comment_ids],
+                batch_size=1000,
+                ignore_conflicts=True,
+            )
+        trim_timelines(follower_ids)
+        restored += 1
+    return restored
+
+
+def trim_timelines(owner_ids):
+    """Keep only the newest TIMELINE_MAX_ENTRIES entries of each timeline."""
+    for owner_id in owner_ids:
+        entries = TimelineEntry.objects.filter(owner_id=owner_id)
+        newest_dropped = entries.order_by('-comment_id').values_list('comment_id', flat=True)[
+            settings.TIMELINE_MAX_ENTRIES:settings.TIMELINE_MAX_ENTRIES + 1
+        ]
+        for comment_id in newest_dropped:
+            entries.filter(comment_id__lte=comment_id).delete()
+
+
+def schedule_trim(owner_ids):
+    """Trim the given timelines in a background thread once the current transaction commits."""
+    owner_ids = list(owner_ids)
+    transaction.on_commit(lambda: _trim_executor.submit(_trim_in_background, owner_ids))
+
+
+def _trim_in_background(owner_ids):
+    try:
+        trim_timelines(owner_ids)
+    finally:
+        # Close this thread's connection
+        connections.close_all()
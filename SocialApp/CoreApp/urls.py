@@ -2,6 +2,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import DocumentListView, ReportView, UserProfileViewSet,FollowToggleView,UserProfileSearchView,UserProfileDetails,OTPViewSet,GetUserIdView
 from .views import CommentCreateView,CommentViewSet,LatestCommentsView,ToggleLikeCommentView,ToggleDislikeCommentView,CommentCreateView
+from .views import LeaderboardView,MutualFollowersView,FollowedByFollowingView,ProfileSuggestionsView,FollowStatusView,ProfileAutocompleteView,MetricsView
 
 
 router = DefaultRouter()
@@ -13,10 +14,16 @@ router.register(r'otp', OTPViewSet,basename='otp')
 urlpatterns = [
     path('', include(router.urls)),
     path('latest-comments/', LatestCommentsView.as_view(), name='latest-comments'),
+    path('leaderboard/', LeaderboardView.as_view(), name='leaderboard'),
     path('comments/create', CommentCreateView.as_view(), name='create_comment'),
     path('comments/<int:pk>/delete_comment/', CommentViewSet.as_view({'delete': 'delete_comment'}), name='delete_comment'),
     path('profiles/<str:username>/follow/', FollowToggleView.as_view(), name='follow-toggle'),
+    path('profiles/<str:username>/mutual-followers/', MutualFollowersView.as_view(), name='mutual-followers'),
+    path('profiles/<str:username>/followed-by-following/', FollowedByFollowingView.as_view(), name='followed-by-following'),
     path('profiles/search/', UserProfileSearchView.as_view(), name='profile-search'),
+    path('profiles/autocomplete/', ProfileAutocompleteView.as_view(), name='profile-autocomplete'),
+    path('profiles/suggestions/', ProfileSuggestionsView.as_view(), name='profile-suggestions'),
+    path('profiles/follow-status/', FollowStatusView.as_view(), name='profile-follow-status'),
     path('profiles/details/', UserProfileDetails.as_view({'get': 'details'}), name='profile-details'),
     path('profiles/info/', UserProfileDetails.as_view({'get': 'info'}), name='profile-info'),
     path('profiles/comment_stats/', UserProfileDetails.as_view({'get': 'comment_stats'}), name='profile-stats'),
@@ -25,6 +32,7 @@ urlpatterns = [
     path('comments/<int:comment_id>/like/', ToggleLikeCommentView.as_view(), name='toggle-like-comment'),
     path('comments/<int:comment_id>/dislike/', ToggleDislikeCommentView.as_view(), name='toggle-dislike-comment'),
     path('user-id/', GetUserIdView.as_view(), name='get-id'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     
     # path('comments/<int:comment_id>/likes-dislikes/', CommentLikesDislikesView.as_view(), name='comment-likes-dislikes'),
     path('report/', ReportView.as_view(), name='report'),
@@ -1,5 +1,8 @@
+import time
+
 import requests
 from django.conf import settings
+from django.core.cache import cache
 from django.core.mail import send_mail
 
 def send_email_notification(subject, message, sender, receiver ):
@@ -36,4 +39,37 @@ def send_sms_otp(mobile, otp):
     
     response = requests.get(url, data=payload, headers=headers)
     
-    return bool(response.ok)
\ No newline at end of file
+    return bool(response.ok)
+
+def cached_count(key, queryset, timeout=300):
+    """
+    Return queryset.count(), cached for `timeout` seconds.
+    The value is approximate: it can lag behind recent writes.
+    """
+    cache_key = f"count:{key}"
+    count = cache.get(cache_key)
+    if count is None:
+        count = queryset.count()
+        cache.set(cache_key, count, timeout)
+    return count
+
+
+def cache_version(key):
+    """
+    Current value of a version counter kept in the cache. A counter evicted from the cache
+    restarts from the clock, above any value it had before, so entries tagged with an older
+    version are never taken for current ones.
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_cache_version(key):
+    """Advance a version counter; nothing to do if it does not exist, as nothing was tagged with it."""
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
@@ -1,18 +1,19 @@
 
 from rest_framework import viewsets, permissions,status,serializers
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import PageNumberPagination, CursorPagination
 from rest_framework.exceptions import AuthenticationFailed,NotFound,PermissionDenied
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.throttling import UserRateThrottle,AnonRateThrottle
 from rest_framework.generics import GenericAPIView
 
-from django.db.models import Count, Q, F,Sum
+from django.db.models import Count, Q, F,Sum, Exists, OuterRef, Max
 from django.db import transaction
 from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
 from django.shortcuts import render
 from django.conf import settings
 from django.core.exceptions import ValidationError
@@ -20,13 +21,25 @@ from django.shortcuts import get_object_or_404
 from django.utils.timezone import timedelta
 from django.contrib.auth.models import User
 
-from .models import Category, Report, UserProfile, Comment
-from .serializers import ReportSerializer, UserProfileSerializer, CommentSerializer, UserUpdateSerializer
+from .autocomplete import get_autocomplete_index
+from .conditional import (
+    comments_received_version, invalidate_comments_received, make_etag, not_modified, set_validators, timeline_period,
+)
+from .follows import toggle_follow
+from .graph import get_follow_graph
+from .metrics import snapshot as metrics_snapshot
+from .search import search_comments, search_profiles
+from .stats_cache import comment_stats_version, get_comment_stats
+from .suggestions import get_suggestions
+from .models import Category, Follow, LeaderboardEntry, Reaction, Report, UserProfile, Comment, TimelineEntry
+from .profile_cache import get_profile_payload, profile_version
+from .reactions import REACTORS_PAGE_SIZE, reaction_summaries, toggle_reaction
+from .serializers import LeaderboardEntrySerializer, ProfileSuggestionSerializer, ReportSerializer, UserProfileCardSerializer, UserProfileSerializer, CommentSerializer, UserUpdateSerializer
 from UserAuth.serializers import UserSerializer
 
 import random, os
 import datetime
-from CoreApp.utils import send_sms_otp,send_email_notification
+from CoreApp.utils import send_sms_otp,send_email_notification,cached_count
 from CoreApp.throttling import CustomRateLimiter,TokenRateLimiter
 
 
@@ -34,6 +47,72 @@ class CommentPagination(PageNumberPagination):
     page_size = 5  # Set the number of comments per page
 
 
+class IdCursorPagination(CursorPagination):
+    """
+    Keyset pagination on the primary key: opaque next/previous cursors, no COUNT
+    and no OFFSET scan. With ?count=true a cached, approximate total is included.
+    """
+    ordering = '-id'
+    count_cache_key = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.total_count = None
+        if self.count_cache_key and request.query_params.get('count') == 'true':
+            self.total_count = cached_count(self.count_cache_key, queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response_data = {
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        }
+        if self.total_count is not None:
+            response_data["count"] = self.total_count
+        return Response(response_data)
+
+
+def get_paginator(request, page_size, ordering='-id', count_cache_key=None):
+    """
+    Page-number pagination by default; clients opt in to cursor pagination with
+    ?pagination=cursor (the next/previous links keep the parameter).
+    """
+    if request.query_params.get('pagination') == 'cursor':
+        paginator = IdCursorPagination()
+        paginator.ordering = ordering
+        paginator.count_cache_key = count_cache_key
+    else:
+        paginator = PageNumberPagination()
+    paginator.page_size = page_size
+    return paginator
+
+
+def cached_profile_data(request, payload, lookup, value, sparse_fields=False):
+    """
+    A cached profile payload (see CoreApp/profile_cache.py) as the serializer renders it for
+    this request: absolute picture URL and, with sparse_fields, ?fields= applied.
+    None if no profile matches.
+    """
+    data = get_profile_payload(payload, lookup, value)
+    if data is None:
+        return None
+
+    data = dict(data)
+    if data.get('profile_picture'):
+        data['profile_picture'] = request.build_absolute_uri(data['profile_picture'])
+    requested = request.query_params.get('fields') if sparse_fields else None
+    selected = set(requested.split(',')) & data.keys() if requested else None
+    if selected:
+        data = {name: field_value for name, field_value in data.items() if name in selected}
+    return data
+
+
+class LeaderboardPagination(CursorPagination):
+    # Keyset pagination over the ranking index: no COUNT, and OFFSET only skips rows tied on the score
+    page_size = 20
+    ordering = ('-score', 'profile_id')
+
+
 class UserProfileViewSet(viewsets.ModelViewSet):
     queryset = UserProfile.objects.all()
     serializer_class = UserProfileSerializer
@@ -45,10 +124,11 @@ class UserProfileViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def me(self, request):
-        """Retrieve the currently authenticated user's profile."""
-        user_profile = UserProfile.objects.get(user=request.user)
-        serializer = self.get_serializer(user_profile)
-        return Response(serializer.data)
+        """Retrieve the currently authenticated user's profile (served from the profile cache)."""
+        data = cached_profile_data(request, 'details', 'user_id', request.user.id, sparse_fields=True)
+        if data is None:
+            raise NotFound("User profile not found.")
+        return Response(data)
 
     from rest_framework.exceptions import NotFound
 
@@ -68,17 +148,54 @@ class UserProfileViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
     def comments(self, request, pk=None):
-        """Retrieve paginated comments for a specific user's profile."""
-        try:
-            user_profile = UserProfile.objects.get(username=pk)
-        except UserProfile.DoesNotExist:
+        """
+        Retrieve paginated comments for a specific user's profile.
+        Answers 304 to an unchanged If-None-Match without running the query or the serializer.
+        """
+        profile = get_profile_payload('id', 'username', pk)
+        if profile is None:
             raise NotFound("User profile not found.")
+        profile_id = profile['id']
+
+        # The comments and the commented profile's picture and name are in the payload,
+        # and the viewer's own reactions
+        etag = make_etag(
+            request, 'comments', request.user.pk, comments_received_version(profile_id), profile_version(profile_id)
+        )
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        comments = CommentSerializer.setup_eager_loading(
+            Comment.objects.filter(profile_commented_on_id=profile_id), request.user.profile
+        ).order_by('-created_at')
         
-        comments = Comment.objects.filter(profile_commented_on=user_profile).order_by('-created_at')
+        paginator = get_paginator(
+            request, CommentPagination.page_size, count_cache_key=f"comments_received:{profile_id}"
+        )
+        paginated_comments = paginator.paginate_queryset(comments, request)
         
+        comment_serializer = CommentSerializer(paginated_comments, many=True)
+        return set_validators(paginator.get_paginated_response(comment_serializer.data), etag)
+
+    @action(detail=True, methods=['get'], url_path='comments/search', permission_classes=[IsAuthenticated])
+    def search_comments(self, request, pk=None):
+        """Full-text search (?q=) over the comments made on a user's profile, best match first."""
+        query = request.query_params.get('q', '')
+        if not query.strip():
+            return Response({"detail": "Search query parameter is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        user_profile = UserProfile.objects.filter(username=pk).only('id').first()
+        if user_profile is None:
+            raise NotFound("User profile not found.")
+
+        comments = CommentSerializer.setup_eager_loading(
+            search_comments(query, profile_id=user_profile.id), request.user.profile
+        )
+
         paginator = CommentPagination()
         paginated_comments = paginator.paginate_queryset(comments, request)
-        
+
         comment_serializer = CommentSerializer(paginated_comments, many=True)
         return paginator.get_paginated_response(comment_serializer.data)
 
@@ -94,7 +211,7 @@ class UserProfileViewSet(viewsets.ModelViewSet):
         # Validate the file type and size
         try:
             user_profile.profile_picture = profile_picture
-            user_profile.save()
+            user_profile.save(update_fields=['profile_picture'])
             return Response({'message': 'Profile picture uploaded successfully.'}, status=status.HTTP_200_OK)
         except ValidationError as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -184,25 +301,15 @@ class CommentCreateView(APIView):
             if not isinstance(score, int) or score < 1 or score > 10:
                 raise ValidationError(f'Category ID "{category_id}": You must give a score between 1-10.')
 
-        # Update the JSON field for the profile being commented on
-        for category_id, score in category_scores.items():
-            current_data = profile_commented_on.category_scores.get(
-                str(category_id), {"total_score": 0, "comment_count": 0}
+        # The Comment signals add the scores to the profile's totals in the same transaction
+        with transaction.atomic():
+            # Create a single comment record
+            comment = Comment.objects.create(
+                user_profile=user_profile,
+                profile_commented_on=profile_commented_on,
+                content=content,
+                category_scores=category_scores  # Save the JSON scores in the comment
             )
-            current_data["total_score"] += score
-            current_data["comment_count"] += 1
-            profile_commented_on.category_scores[str(category_id)] = current_data
-
-        # Save the profile with updated scores
-        profile_commented_on.save()
-
-        # Create a single comment record
-        comment = Comment.objects.create(
-            user_profile=user_profile,
-            profile_commented_on=profile_commented_on,
-            content=content,
-            category_scores=category_scores  # Save the JSON scores in the comment
-        )
 
         # Serialize and return the created comment
         serializer = CommentSerializer(comment)
@@ -216,6 +323,11 @@ class CommentViewSet(viewsets.ModelViewSet):
     serializer_class = CommentSerializer
     permission_classes = [IsAuthenticated]
     throttle_classes = [TokenRateLimiter]
+
+    MAX_BATCH_IDS = 100  # Comments per batch likes_dislikes request
+
+    def get_queryset(self):
+        return CommentSerializer.setup_eager_loading(super().get_queryset(), self.request.user.profile)
     
     @action(detail=True, methods=['put'])
     def edit_comment(self, request, pk=None):
@@ -237,12 +349,6 @@ class CommentViewSet(viewsets.ModelViewSet):
         except AttributeError:
             raise AuthenticationFailed('User profile not found.')
 
-        # Get the profile being commented on
-        try:
-            profile_commented_on = UserProfile.objects.get(username=request.data['profile_commented_on'])
-        except UserProfile.DoesNotExist:
-            raise ValidationError('Profile not found for this user.')
-
         content = request.data.get('content', None)
         if not content:
             raise ValidationError('You must enter a comment.')
@@ -263,22 +369,12 @@ class CommentViewSet(viewsets.ModelViewSet):
             if not isinstance(score, int) or score < 1 or score > 10:
                 raise ValidationError(f'Category ID "{category_id}": You must give a score between 1-10.')
 
-        # Update the JSON field for the profile being commented on
-        for category_id, score in category_scores.items():
-            current_data = profile_commented_on.category_scores.get(
-                str(category_id), {"total_score": 0, "comment_count": 0}
-            )
-            current_data["total_score"] += score
-            current_data["comment_count"] += 1
-            profile_commented_on.category_scores[str(category_id)] = current_data
-
-        # Save the profile with updated scores
-        profile_commented_on.save()
-
-        # Now, update the comment's content and category_scores (if needed)
-        comment.content = content
-        comment.category_scores = category_scores
-        comment.save()
+        # The Comment signals replace the old scores with the new ones in the
+        # profile's totals, in the same transaction as the comment update
+        with transaction.atomic():
+            comment.content = content
+            comment.category_scores = category_scores
+            comment.save()
 
         # Serialize and return the updated comment
         serializer = CommentSerializer(comment)
@@ -296,7 +392,7 @@ class CommentViewSet(viewsets.ModelViewSet):
         if comment.user_profile.user != request.user:
             return Response({"error": "You can only delete your own comments."}, status=status.HTTP_403_FORBIDDEN)
 
-        # Delete the comment
+        # Delete the comment; the Comment signals take its scores out of the profile's totals
         comment.delete()
         return Response({"detail": "Comment deleted successfully."}, status=status.HTTP_204_NO_CONTENT)
     
@@ -307,9 +403,10 @@ class CommentViewSet(viewsets.ModelViewSet):
         except UserProfile.DoesNotExist:
             return Response({"error": "User profile not found."}, status=status.HTTP_404_NOT_FOUND)
 
-        comments = Comment.objects.filter(user_profile=user_profile).order_by('-created_at')
-        paginator = PageNumberPagination()
-        paginator.page_size = 10
+        comments = CommentSerializer.setup_eager_loading(
+            Comment.objects.filter(user_profile=user_profile), user_profile
+        ).order_by('-created_at')
+        paginator = get_paginator(request, 10, count_cache_key=f"comments_made:{user_profile.pk}")
         paginated_comments = paginator.paginate_queryset(comments, request)
 
         comment_serializer = self.get_serializer(paginated_comments, many=True)
@@ -317,78 +414,86 @@ class CommentViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['get'])
     def likes_dislikes(self, request, pk=None) :
+        """
+        Like/dislike counts and the user's own reaction.
+        - ?ids=1,2,3: batch mode, one query for all comments; add ?reactors=true
+          to embed the first likers and dislikers of each comment.
+        - ?reaction=likes|dislikes: cursor-paginated list of who reacted to this comment.
+        - otherwise: this comment's counts with the first likers and dislikers.
+        """
+        user_profile = request.user.profile
 
         ##Batch request optimization to improve performance
         if 'ids' in request.query_params:
-            comment_ids = [int(id) for id in request.query_params['ids'].split(',')]
-            comments = Comment.objects.filter(id__in=comment_ids)
-            
-            if not comments.exists():
+            try:
+                comment_ids = [int(id) for id in request.query_params['ids'].split(',')]
+            except ValueError:
+                return Response({"error": "ids must be a comma-separated list of comment ids."},
+                                status=status.HTTP_400_BAD_REQUEST)
+            if len(comment_ids) > self.MAX_BATCH_IDS:
+                return Response({"error": f"At most {self.MAX_BATCH_IDS} ids can be requested at once."},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+            summaries = reaction_summaries(
+                comment_ids, user_profile,
+                include_reactors=request.query_params.get('reactors') == 'true',
+            )
+            if not summaries:
                 return Response({"error": "Some comments not found."}, status=status.HTTP_404_NOT_FOUND)
-            
-            user_profile = request.user.profile
-            response_data = []
-            
-            for comment in comments:
-                likes = comment.likes.values('id', 'username')
-                dislikes = comment.dislikes.values('id', 'username')
-                
-                response_data.append({
-                    "id": comment.id,
-                    "likes": list(likes),
-                    "dislikes": list(dislikes),
-                    "user_action": {
-                        "has_liked": comment.likes.filter(id=user_profile.id).exists(),
-                        "has_disliked": comment.dislikes.filter(id=user_profile.id).exists()
-                    }
-                })
-            
-            return Response(response_data, status=status.HTTP_200_OK)
-        else:
-     
-            comment = get_object_or_404(
-                Comment.objects.prefetch_related('likes', 'dislikes'),
-                id=pk
+
+            return Response(list(summaries.values()), status=status.HTTP_200_OK)
+
+        try:
+            comment_id = int(pk)
+        except ValueError:
+            raise NotFound("Comment not found.")
+
+        reaction = request.query_params.get('reaction')
+        if reaction is not None:
+            if reaction not in ('likes', 'dislikes'):
+                return Response({"error": "reaction must be 'likes' or 'dislikes'."},
+                                status=status.HTTP_400_BAD_REQUEST)
+            comment = get_object_or_404(Comment.objects.only('id'), id=comment_id)
+            kind = Reaction.LIKE if reaction == 'likes' else Reaction.DISLIKE
+            reactors = Reaction.objects.filter(comment_id=comment.id, kind=kind).values(
+                'id', 'profile_id', username=F('profile__username')
             )
-            likes = comment.likes.values('id', 'username')
-            dislikes = comment.dislikes.values('id', 'username')
-            user_profile = request.user.profile
-
-            return Response({
-                "likes": list(likes),
-                "dislikes": list(dislikes),
-                "user_action": {
-                    "has_liked": comment.likes.filter(id=user_profile.id).exists(),
-                    "has_disliked": comment.dislikes.filter(id=user_profile.id).exists()
-                }
-            }, status=status.HTTP_200_OK)
 
-    
+            paginator = IdCursorPagination()
+            paginator.ordering = 'id'
+            paginator.page_size = REACTORS_PAGE_SIZE
+            page = paginator.paginate_queryset(reactors, request)
+            return paginator.get_paginated_response(
+                [{"id": row["profile_id"], "username": row["username"]} for row in page]
+            )
+
+        summary = reaction_summaries([comment_id], user_profile, include_reactors=True).get(comment_id)
+        if summary is None:
+            raise NotFound("Comment not found.")
+        return Response(summary, status=status.HTTP_200_OK)
+
 ##Yorum beğenme işlemleri
 class ToggleLikeCommentView(APIView):
     permission_classes = [IsAuthenticated]
     throttle_classes = [CustomRateLimiter]
 
     def post(self, request, comment_id, *args, **kwargs):
-        # Yorumu bul
-        comment = get_object_or_404(Comment, id=comment_id)
+        # Yorumu bul (only the author is needed, not the reactions)
+        comment = get_object_or_404(
+            Comment.objects.only('id', 'user_profile_id', 'profile_commented_on_id'), id=comment_id
+        )
         user_profile = request.user.profile  # Şu anki kullanıcı profili
 
         # return error if the user tries to like their own comment
-        if comment.user_profile == user_profile:
+        if comment.user_profile_id == user_profile.id:
             raise ValidationError("You cannot like your own comment.")
 
-        # remove dislike if exists
-        if user_profile in comment.dislikes.all():
-            comment.dislikes.remove(user_profile)
-
-        # Like operation
-        if user_profile in comment.likes.all():
-            comment.likes.remove(user_profile)  # Remove like
-            action = "Like removed successfully."
-        else:
-            comment.likes.add(user_profile)  # Add like
+        # Like operation: toggle (add or remove); an existing dislike is switched to a like
+        if toggle_reaction(comment.id, user_profile.id, Reaction.LIKE):
             action = "Like added successfully."
+        else:
+            action = "Like removed successfully."
+        invalidate_comments_received(comment.profile_commented_on_id)  # The comment list shows the counts
 
         return Response({"detail": action}, status=status.HTTP_200_OK)
 
@@ -399,25 +504,22 @@ class ToggleDislikeCommentView(APIView):
     throttle_classes = [CustomRateLimiter]
 
     def post(self, request, comment_id, *args, **kwargs):
-        # Yorumu bul
-        comment = get_object_or_404(Comment, id=comment_id)
+        # Yorumu bul (only the author is needed, not the reactions)
+        comment = get_object_or_404(
+            Comment.objects.only('id', 'user_profile_id', 'profile_commented_on_id'), id=comment_id
+        )
         user_profile = request.user.profile  # current user profile
 
         # Return error if the user tries to dislike their own comment
-        if comment.user_profile == user_profile:
+        if comment.user_profile_id == user_profile.id:
             raise ValidationError("You cannot dislike your own comment.")
 
-        # Remove like if exists
-        if user_profile in comment.likes.all():
-            comment.likes.remove(user_profile)
-
-        # Dislike operation: toggle (add or remove)
-        if user_profile in comment.dislikes.all():
-            comment.dislikes.remove(user_profile)  # Remove dislike
-            action = "Dislike removed successfully."
-        else:
-            comment.dislikes.add(user_profile)  # Add dislike
+        # Dislike operation: toggle (add or remove); an existing like is switched to a dislike
+        if toggle_reaction(comment.id, user_profile.id, Reaction.DISLIKE):
             action = "Dislike added successfully."
+        else:
+            action = "Dislike removed successfully."
+        invalidate_comments_received(comment.profile_commented_on_id)  # The comment list shows the counts
 
         return Response({"detail": action}, status=status.HTTP_200_OK)
 
@@ -432,21 +534,76 @@ class LatestCommentsView(GenericAPIView):
         # Fetch user profile
         user_profile = request.user.profile
 
-        # Fetch comments from followed users
-        followed_profiles = user_profile.following.all()
+        # Comments on followed profiles are copied to the user's timeline when they are made,
+        # except for profiles with too many followers, whose comments are read directly
+        pulled_profiles = UserProfile.objects.filter(
+            following_relationships__follower=user_profile, fanout_on_read=True
+        )
+        has_pulled_profiles = pulled_profiles.exists()
+
+        # Validator from the newest comment and size of the timeline, rolled over every
+        # LATEST_COMMENTS_REVALIDATE_SECONDS: a 304 skips the comment queries and the serializer
+        timeline = TimelineEntry.objects.filter(owner=user_profile).aggregate(
+            latest=Max('comment_id'), entries=Count('id')
+        )
+        pulled_latest = Comment.objects.filter(profile_commented_on__in=pulled_profiles).aggregate(
+            latest=Max('id')
+        )['latest'] if has_pulled_profiles else None
+        etag = make_etag(
+            request, 'latest-comments', user_profile.pk, timeline['latest'], timeline['entries'], pulled_latest,
+            timeline_period(),
+        )
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        if has_pulled_profiles:
+            comments = Comment.objects.filter(
+                Q(id__in=TimelineEntry.objects.filter(owner=user_profile).values('comment_id'))
+                | Q(profile_commented_on__in=pulled_profiles)
+            ).order_by('-id')
+        else:
+            # Range scan over the user's timeline entries
+            comments = Comment.objects.filter(timeline_entries__owner=user_profile).order_by('-id')
 
-        # Fetch latest comments from followed users
-        comments = Comment.objects.filter(profile_commented_on__in=followed_profiles).order_by('-created_at')
+        comments = CommentSerializer.setup_eager_loading(comments, user_profile)
         
-        paginator = PageNumberPagination()
-        paginator.page_size = 5
+        paginator = get_paginator(request, 5, count_cache_key=f"latest_comments:{user_profile.pk}")
         paginated_comments = paginator.paginate_queryset(comments, request)
 
         # Serialize comments
         comment_serializer = self.get_serializer(paginated_comments, many=True)
-        return paginator.get_paginated_response(comment_serializer.data)
+        return set_validators(paginator.get_paginated_response(comment_serializer.data), etag)
         
 
+class LeaderboardView(GenericAPIView):
+    """
+    Top-rated profiles, overall or for one category (?category=<id>).
+    Served from the precomputed leaderboard table, ranked by Bayesian average.
+    """
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [TokenRateLimiter]
+    serializer_class = LeaderboardEntrySerializer
+
+    def get(self, request):
+        entries = LeaderboardEntry.objects.filter(profile__is_active=True).select_related('profile')
+
+        category_id = request.query_params.get('category', None)
+        if category_id is None:
+            entries = entries.filter(category__isnull=True)
+        else:
+            try:
+                entries = entries.filter(category_id=int(category_id))
+            except ValueError:
+                return Response({"detail": "Category must be an integer id."}, status=status.HTTP_400_BAD_REQUEST)
+
+        paginator = LeaderboardPagination()
+        paginated_entries = paginator.paginate_queryset(entries, request, view=self)
+
+        serializer = self.get_serializer(paginated_entries, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+
 class FollowToggleView(APIView):
     """
     Toggle follow/unfollow for a user.
@@ -462,52 +619,170 @@ class FollowToggleView(APIView):
         if target_user == current_user_profile:
             return Response({"detail": "You cannot follow yourself."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Check if the user is already following
-        if target_user in current_user_profile.following.all():
-            # Unfollow
-            current_user_profile.following.remove(target_user)
-            target_user.followers.remove(current_user_profile)
-            message = "You have unfollowed this user."
-        else:
-            # Follow the user
-            current_user_profile.following.add(target_user)
-            target_user.followers.add(current_user_profile)
+        # Follow the user, or unfollow if already following
+        if toggle_follow(current_user_profile.id, target_user.id):
             message = "You are now following this user."
+        else:
+            message = "You have unfollowed this user."
 
         return Response({"detail": message}, status=status.HTTP_200_OK)
 
 
+class FollowGraphView(APIView):
+    """
+    Base view for questions answered from the follow graph snapshot (see CoreApp/graph.py)
+    about the current user and another profile. Returns the number of matching profiles
+    and the first few of them, as of the snapshot time.
+    """
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [TokenRateLimiter]
+    sample_size = 20
+
+    def related_profile_ids(self, graph, viewer_id, profile_id):
+        raise NotImplementedError
+
+    def get(self, request, username, *args, **kwargs):
+        graph = get_follow_graph()
+        if graph is None:
+            return Response({"detail": "The follow graph is not available yet."},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        profile_id = get_object_or_404(UserProfile.objects.only('id'), username=username).id
+        related_ids = self.related_profile_ids(graph, request.user.profile.id, profile_id)
+
+        sample_ids = related_ids[:self.sample_size].tolist()
+        usernames = dict(UserProfile.objects.filter(id__in=sample_ids).values_list('id', 'username'))
+        return Response({
+            "count": len(related_ids),
+            "results": [
+                {"id": related_id, "username": usernames[related_id]}
+                for related_id in sample_ids if related_id in usernames
+            ],
+            "as_of": graph.built_at,
+        }, status=status.HTTP_200_OK)
+
+
+class MutualFollowersView(FollowGraphView):
+    """Profiles that follow both the current user and the given profile."""
+
+    def related_profile_ids(self, graph, viewer_id, profile_id):
+        return graph.mutual_followers(viewer_id, profile_id)
+
+
+class FollowedByFollowingView(FollowGraphView):
+    """Profiles the current user follows that follow the given profile."""
+
+    def related_profile_ids(self, graph, viewer_id, profile_id):
+        return graph.followed_by_following(viewer_id, profile_id)
+
+
+class ProfileSuggestionsView(APIView):
+    """
+    "People you may know": profiles followed by the profiles the user follows, ranked by
+    number of such paths and by rating (?limit=, at most 50). The ranking is cached per user.
+    """
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [TokenRateLimiter]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 20)), 50))
+        except ValueError:
+            return Response({"detail": "Limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        user_profile = request.user.profile
+        suggestions = get_suggestions(user_profile.id)
+        if suggestions is None:
+            return Response({"detail": "The follow graph is not available yet."},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        # The cached ranking can predate the user's latest follows and deactivations: walk it
+        # in batches until the page is full, usually one
+        page = []
+        batch_size = limit * 2
+        for start in range(0, len(suggestions), batch_size):
+            candidate_ids = [profile_id for profile_id, _ in suggestions[start:start + batch_size]]
+            followed = set(Follow.objects.filter(
+                follower=user_profile, following_id__in=candidate_ids
+            ).values_list('following_id', flat=True))
+            profiles = ProfileSuggestionSerializer.setup_eager_loading(
+                UserProfile.objects.filter(is_active=True)
+            ).in_bulk([profile_id for profile_id in candidate_ids if profile_id not in followed])
+            page += [profiles[profile_id] for profile_id in candidate_ids if profile_id in profiles]
+            if len(page) >= limit:
+                break
+
+        serializer = ProfileSuggestionSerializer(
+            page[:limit],
+            many=True,
+            context={'request': request, 'path_counts': dict(suggestions)},
+        )
+        return Response({"results": serializer.data}, status=status.HTTP_200_OK)
+
+
+class FollowStatusView(APIView):
+    """
+    Follow flags of the user towards a list of profiles, given as ?usernames=a,b or ?ids=1,2
+    (at most FOLLOW_STATUS_MAX_PROFILES). Answered with one query on the Follow indexes;
+    the response may be cached privately by the client for FOLLOW_STATUS_MAX_AGE seconds.
+    """
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [TokenRateLimiter]
+
+    def get(self, request, *args, **kwargs):
+        if 'usernames' in request.query_params:
+            lookup = 'username__in'
+            values = [value for value in request.query_params['usernames'].split(',') if value]
+        elif 'ids' in request.query_params:
+            lookup = 'id__in'
+            try:
+                values = [int(value) for value in request.query_params['ids'].split(',') if value]
+            except ValueError:
+                return Response({"detail": "ids must be a comma-separated list of profile ids."},
+                                status=status.HTTP_400_BAD_REQUEST)
+        else:
+            return Response({"detail": "usernames or ids query parameter is required."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        max_profiles = settings.FOLLOW_STATUS_MAX_PROFILES
+        if len(values) > max_profiles:
+            return Response({"detail": f"At most {max_profiles} profiles can be requested at once."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        user_profile = request.user.profile
+        rows = UserProfile.objects.filter(**{lookup: values}).annotate(
+            is_following=Exists(Follow.objects.filter(follower=user_profile, following=OuterRef('pk'))),
+            is_followed_by=Exists(Follow.objects.filter(follower=OuterRef('pk'), following=user_profile)),
+        ).values_list('id', 'username', 'is_following', 'is_followed_by')
+
+        response = Response({
+            "results": [
+                {"id": profile_id, "username": username, "following": following, "followed_by": followed_by}
+                for profile_id, username, following, followed_by in rows
+            ]
+        }, status=status.HTTP_200_OK)
+        # The answer depends on who asks: only the user's own client may reuse it
+        patch_cache_control(response, private=True, max_age=settings.FOLLOW_STATUS_MAX_AGE)
+        patch_vary_headers(response, ['Authorization'])
+        return response
+
+
 class UserProfileSearchView(GenericAPIView):
     """
     Perform a search for user profiles based on username, first name, last name, or phone number and return paginated results.
+    Served from the n-gram search index (see CoreApp/search.py), ranked by relevance, case-insensitive the Turkish way.
     """
 
     throttle_classes = [UserRateThrottle]
-    serializer_class = UserProfileSerializer
+    serializer_class = UserProfileCardSerializer  # ?fields= selects a subset
 
     def get(self, request, *args, **kwargs):
         query = request.query_params.get('q', '')  # Search query
         if not query:
             return Response({"detail": "Search query parameter is required."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Split the query into separate terms by spaces
-        query_terms = query.split()
-
-        # Start with an empty Q object
-        query_filter = Q()
-
-        # Add each query term to the filter with 'OR' logic for each field
-        for term in query_terms:
-            query_filter |= Q(username__icontains=term)
-            query_filter |= Q(first_name__icontains=term)
-            query_filter |= Q(last_name__icontains=term)
-            query_filter |= Q(phone_number__icontains=term)
-
-        # Add 'is_active' filter to only include active users
-        query_filter &= Q(is_active=True)
-
-        # Apply the filter to the UserProfile model
-        profiles = UserProfile.objects.filter(query_filter).order_by('id')
+        # Active profiles from the search index, most relevant first
+        profiles = UserProfileCardSerializer.setup_eager_loading(search_profiles(query))
 
         # Pagination
         paginator = PageNumberPagination()
@@ -522,12 +797,39 @@ class UserProfileSearchView(GenericAPIView):
 
 
 
+class ProfileAutocompleteView(APIView):
+    """
+    Type-ahead suggestions: active profiles whose username, full name or last name starts with ?q=,
+    most followed first (?limit=, at most AUTOCOMPLETE_MAX_RESULTS). Served from the in-memory
+    autocomplete index (see CoreApp/autocomplete.py) without a database query.
+    """
+    throttle_classes = [UserRateThrottle]
+
+    def get(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '')
+        if not query.strip():
+            return Response({"detail": "Search query parameter is required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), settings.AUTOCOMPLETE_MAX_RESULTS)
+        except ValueError:
+            return Response({"detail": "Limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        index = get_autocomplete_index()
+        return Response({"results": index.results(index.lookup(query, limit))}, status=status.HTTP_200_OK)
+
+
 class UserProfileDetails(viewsets.ModelViewSet):  
     queryset = UserProfile.objects.all()
     serializer_class = UserProfileSerializer
     permission_classes = [IsAuthenticated]
     throttle_classes = [TokenRateLimiter]
 
+    def get_serializer_class(self):
+        # Follower and following lists use the compact card (?fields= selects a subset)
+        if self.action in ('followers', 'following'):
+            return UserProfileCardSerializer
+        return super().get_serializer_class()
+
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
         
@@ -538,15 +840,21 @@ class UserProfileDetails(viewsets.ModelViewSet):
         if username is None:
             return Response({"detail": "Username query parameter is required."}, status=status.HTTP_400_BAD_REQUEST)
         
-        try:
-            # Find the user being searched for
-            user_profile = UserProfile.objects.get(username=username)
-        except UserProfile.DoesNotExist:
+        profile = get_profile_payload('id', 'username', username)
+        if profile is None:
             return Response({"detail": "User not found."}, status=status.HTTP_404_NOT_FOUND)
 
-        # Serialize the user and return
-        serializer = self.get_serializer(user_profile)
-        return Response(serializer.data)
+        # Validator from the profile's cache version, read before the payload
+        etag = make_etag(request, 'details', profile_version(profile['id']))
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        # Serialized profile of the user being searched for, from the profile cache
+        data = cached_profile_data(request, 'details', 'username', username, sparse_fields=True)
+        if data is None:
+            return Response({"detail": "User not found."}, status=status.HTTP_404_NOT_FOUND)
+        return set_validators(Response(data), etag)
     
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def info(self, request):
@@ -555,15 +863,11 @@ class UserProfileDetails(viewsets.ModelViewSet):
         if username is None:
             return Response({"detail": "Username query parameter is required."}, status=status.HTTP_400_BAD_REQUEST)
         
-        try:
-            # Find the user being searched for
-            user_profile = UserProfile.objects.get(username=username)
-        except UserProfile.DoesNotExist:
+        # Serialized profile of the user being searched for, from the profile cache
+        data = cached_profile_data(request, 'info', 'username', username)
+        if data is None:
             return Response({"detail": "User not found."}, status=status.HTTP_404_NOT_FOUND)
-
-        # Serialize the user and return
-        serializer = UserUpdateSerializer(user_profile)
-        return Response(serializer.data)
+        return Response(data)
     
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def followers(self, request):
@@ -576,18 +880,22 @@ class UserProfileDetails(viewsets.ModelViewSet):
 
         try:
             user_profile = UserProfile.objects.get(username=username)
-            followers = user_profile.followers.all().order_by('id')
+            followers = UserProfileCardSerializer.setup_eager_loading(
+                UserProfile.objects.filter(follower_relationships__following=user_profile)
+            ).order_by('id')
         except UserProfile.DoesNotExist:
             return Response({"detail": "User not found."}, status=status.HTTP_404_NOT_FOUND)
 
-        paginator = PageNumberPagination()
-        paginator.page_size = 20  # 20 results per page
+        paginator = get_paginator(request, 20, ordering='id', count_cache_key=f"followers:{user_profile.pk}")
         paginated_followers = paginator.paginate_queryset(followers, request, view=self)
 
         if paginated_followers is None:
             return Response({"detail": "Pagination did not return any results."}, status=status.HTTP_404_NOT_FOUND)
 
         serializer = self.get_serializer(paginated_followers, many=True)
+        if isinstance(paginator, IdCursorPagination):
+            return paginator.get_paginated_response(serializer.data)
+
         total_pages = paginator.page.paginator.num_pages
 
         # Get the next and previous links
@@ -621,12 +929,13 @@ class UserProfileDetails(viewsets.ModelViewSet):
         try:
             # Find the user being searched for
             user_profile = UserProfile.objects.get(username=username)
-            followees = user_profile.following.all()
+            followees = UserProfileCardSerializer.setup_eager_loading(
+                UserProfile.objects.filter(following_relationships__follower=user_profile)
+            ).order_by('id')
         except UserProfile.DoesNotExist:
             return Response({"detail": "User not found."}, status=status.HTTP_404_NOT_FOUND)
         
-        paginator = PageNumberPagination()
-        paginator.page_size = 20  # 20 results per page
+        paginator = get_paginator(request, 20, ordering='id', count_cache_key=f"following:{user_profile.pk}")
         paginated_followees = paginator.paginate_queryset(followees, request, view=self)
 
         # Serialize the user and return
@@ -634,6 +943,9 @@ class UserProfileDetails(viewsets.ModelViewSet):
             return Response({"detail": "Pagination did not return any results."}, status=status.HTTP_404_NOT_FOUND)
 
         serializer = self.get_serializer(paginated_followees, many=True)
+        if isinstance(paginator, IdCursorPagination):
+            return paginator.get_paginated_response(serializer.data)
+
         total_pages = paginator.page.paginator.num_pages
 
         # Get the next and previous links
@@ -656,21 +968,23 @@ class UserProfileDetails(viewsets.ModelViewSet):
         if username is None:
             return Response({"detail": "Username query parameter is required."}, status=status.HTTP_400_BAD_REQUEST)
         
-        try:
-            # Find the user being searched for
-            user_profile = UserProfile.objects.get(username=username)
-        except UserProfile.DoesNotExist:
+        # Find the user being searched for, then its statistics, both through the cache
+        profile = get_profile_payload('id', 'username', username)
+        if profile is None:
             return Response({"detail": "User not found."}, status=status.HTTP_404_NOT_FOUND)
 
-        # Calculate comment statistics
-        comment_stats = user_profile.get_category_comment_stats()
-        user_average_score = user_profile.get_user_average_score()  # Calculate average score
+        response = not_modified(request, make_etag(request, 'comment_stats', comment_stats_version(profile['id'])))
+        if response is not None:
+            return response
 
-        # Return statistics
-        return Response({
-            "comment_stats": comment_stats,
-            "average_score": user_average_score['average_score']
-        })
+        result = get_comment_stats(profile['id'])
+        if result is None:
+            return Response({"detail": "User not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        # Return statistics, tagged with the version they were computed at (possibly an outdated one)
+        stats, version = result
+        etag = make_etag(request, 'comment_stats', version)
+        return not_modified(request, etag) or set_validators(Response(stats), etag)
         
         
 class OTPViewSet(viewsets.ModelViewSet):  
@@ -702,7 +1016,7 @@ class OTPViewSet(viewsets.ModelViewSet):
             instance.otp_expiry = None
             instance.max_otp_try = settings.MAX_OTP_TRY
             instance.otp_max_out = None
-            instance.save()
+            instance.save(update_fields=['is_active', 'otp_expiry', 'max_otp_try', 'otp_max_out'])
             return Response({"detail": "Doğrulama başarılı."}, status=status.HTTP_200_OK)
         
         return Response(
@@ -736,7 +1050,7 @@ class OTPViewSet(viewsets.ModelViewSet):
             instance.otp_max_out = None
             instance.max_otp_try = max_otp_try
         
-        instance.save()
+        instance.save(update_fields=['otp', 'otp_expiry', 'max_otp_try', 'otp_max_out'])
         # send_sms_otp(instance.phone_number, otp)
         send_email_notification("Activate your Account", otp, settings.EMAIL_HOST_USER, instance.email)
         return Response({"detail": "A new OTP code has been sent."}, status=status.HTTP_200_OK)
@@ -782,12 +1096,19 @@ class GetUserIdView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        try:
-            # Retrieve the UserProfile associated with the given username
-            user_profile = UserProfile.objects.get(user__username=username)
-            return Response({'id': user_profile.id}, status=status.HTTP_200_OK)
-        except UserProfile.DoesNotExist:
+        # Id of the UserProfile associated with the given username, from the profile cache
+        data = get_profile_payload('id', 'user__username', username)
+        if data is None:
             return Response(
                 {"detail": "UserProfile with the given username does not exist."},
                 status=status.HTTP_404_NOT_FOUND
-            )
\ No newline at end of file
+            )
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class MetricsView(APIView):
+    """Current value of the application metrics (cache hit counters and the like), for staff."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(metrics_snapshot(), status=status.HTTP_200_OK)
@@ -48,6 +48,67 @@ EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 ALLOWED_HOSTS = []
 MAX_OTP_TRY = 3
 
+# Leaderboard ranking: Bayesian average that pulls profiles with few ratings
+# towards LEADERBOARD_PRIOR_MEAN, as if they had LEADERBOARD_PRIOR_WEIGHT extra ratings of it
+LEADERBOARD_PRIOR_MEAN = 5.5
+LEADERBOARD_PRIOR_WEIGHT = 10
+
+# Latest comments timeline: number of entries kept per user, follower count above which
+# a profile's comments are read on demand instead of copied to every follower's timeline,
+# and how often (one comment in N) the receiving timelines are trimmed in the background.
+# trim_timelines switches profiles back under the limit to copying their comments
+TIMELINE_MAX_ENTRIES = 500
+TIMELINE_FANOUT_LIMIT = 5000
+TIMELINE_TRIM_EVERY = 100
+
+# Follow graph snapshot (see CoreApp/graph.py): directory of the memory-mapped arrays,
+# and how often (seconds) each worker checks for a newer snapshot
+FOLLOW_GRAPH_DIR = BASE_DIR / 'follow_graph'
+FOLLOW_GRAPH_RELOAD_SECONDS = 30
+
+# Follow suggestions: candidates with the most 2-hop paths that are weighted by rating,
+# and how long each user's ranking is cached
+SUGGESTION_CANDIDATES = 200
+SUGGESTIONS_CACHE_SECONDS = 600
+
+# Bulk follow-status lookups: profiles per request, and how long clients may cache the answer
+FOLLOW_STATUS_MAX_PROFILES = 50
+FOLLOW_STATUS_MAX_AGE = 30
+
+# Profile autocomplete (see CoreApp/autocomplete.py): results per lookup, matches above which
+# a prefix's ranking is memoized, how often (seconds) each worker rebuilds its index, and an
+# optional snapshot file written by build_autocomplete_index that is loaded instead of the database
+AUTOCOMPLETE_MAX_RESULTS = 20
+AUTOCOMPLETE_SCAN_LIMIT = 256
+AUTOCOMPLETE_REBUILD_SECONDS = 300
+AUTOCOMPLETE_SNAPSHOT = None
+
+# Read-through profile cache (see CoreApp/profile_cache.py): lifetime of the serialized profiles,
+# of "no such profile" answers, and the longest a request waits for another one loading the same profile
+PROFILE_CACHE_SECONDS = 300
+PROFILE_CACHE_MISSING_SECONDS = 30
+PROFILE_CACHE_LOCK_SECONDS = 2
+
+# Cached comment_stats payloads (see CoreApp/stats_cache.py): lifetime of an entry, which is
+# served even when outdated while it is recomputed, and the longest a recompute may hold its lock
+COMMENT_STATS_CACHE_SECONDS = 24 * 60 * 60
+COMMENT_STATS_REFRESH_LOCK_SECONDS = 30
+
+# Metric counts (see CoreApp/metrics.py) are added up in each process and written to the
+# cache at most once every this many seconds, instead of one cache write per count
+METRICS_FLUSH_SECONDS = 10
+
+# latest-comments ETags also change every this many seconds, so edits and reactions on
+# comments a client already has reach it within this delay
+LATEST_COMMENTS_REVALIDATE_SECONDS = 60
+
+# CustomRateLimiter (see CoreApp/throttling.py): lock shards of the in-memory token buckets, the
+# most client IPs a worker keeps a bucket for, and whether to count in the shared cache instead
+# so the limit holds across workers
+CUSTOM_THROTTLE_SHARDS = 16
+CUSTOM_THROTTLE_MAX_CLIENTS = 100000
+CUSTOM_THROTTLE_SHARED = False
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -100,12 +161,20 @@ REST_FRAMEWORK = {
 
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
+        # Shared by the worker processes of the host: counters, locks and cached profiles
+        # are the same for every worker
+        'BACKEND': 'CoreApp.shared_cache.SQLiteCache',
+        'LOCATION': env('CACHE_LOCATION', default=str(BASE_DIR / 'cache.sqlite3')),
         'TIMEOUT': 60,  # 1 dakika boyunca önbellekte tut
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
     }
 }
 
+# Tests run against cache files of their own, never the one above
+TEST_RUNNER = 'SocialApp.test_runner.IsolatedCacheTestRunner'
+
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
@@ -158,6 +227,16 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Take the write lock when a transaction starts so concurrent writers wait
+            # for each other instead of failing with "database is locked"
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        'TEST': {
+            # A file database, so tests can use several connections at once
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
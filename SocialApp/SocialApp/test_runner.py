@@ -0,0 +1,29 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+
+class IsolatedCacheTestRunner(DiscoverRunner):
+    """
+    Test runner that gives the tests SQLite cache files of their own, created empty for the
+    run, like the test database: the tests never read or clear the cache of the running server.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache_dir = tempfile.TemporaryDirectory()
+        caches = {
+            alias: {**config, 'LOCATION': os.path.join(self.cache_dir.name, f'{alias}.sqlite3')}
+            if config['BACKEND'] == 'CoreApp.shared_cache.SQLiteCache' else config
+            for alias, config in settings.CACHES.items()
+        }
+        self.cache_settings = override_settings(CACHES=caches)
+        self.cache_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.cache_settings.disable()
+        self.cache_dir.cleanup()
+        super().teardown_test_environment(**kwargs)
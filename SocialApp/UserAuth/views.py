@@ -196,7 +196,7 @@ def forgot_password(request):
     
     user_profile.otp = otp
     user_profile.otp_expiry = otp_expiry
-    user_profile.save()
+    user_profile.save(update_fields=['otp', 'otp_expiry'])
 
     send_email_notification("Your password reset code: ", otp, settings.EMAIL_HOST_USER, email)
     return Response({"detail": "OTP has been sent to your email address."}, status=status.HTTP_200_OK)
@@ -224,7 +224,7 @@ def reset_password(request):
     user.save()
     
     user_profile.otp_expiry = None
-    user_profile.save()
+    user_profile.save(update_fields=['otp_expiry'])
     
     return Response({"detail": "Password reset successfully."}, status=status.HTTP_200_OK)
 